@@ -0,0 +1,341 @@
+"""
+Asyncio runtime for the Number Bot
+
+Long polling, Telegram calls and the OTP monitor all run on one event loop
+and share one keep-alive connection pool. Handlers in number_bot.py are
+plain blocking functions, so each update runs on a worker thread; updates
+from the same chat are processed strictly in order, different chats run
+concurrently. Telegram calls made from those threads are bridged back onto
+the loop, and file parsing goes to a process pool.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import aiohttp
+
+import telegram_client
+from heartbeat import beat
+from status_board import board
+from lease_manager import LEASE_TICK_SECONDS
+from telegram_client import api_stats, backoff_delay, method_timeout, retry_delay
+from update_spool import SpoolReader
+
+HANDLER_WORKERS = int(os.getenv("HANDLER_WORKERS", "64"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "2"))
+# OTP sends in flight at once; a backlog is worked through at this width
+OTP_SEND_CONCURRENCY = int(os.getenv("OTP_SEND_CONCURRENCY", "20"))
+OTP_POLL_SECONDS = 2
+SPOOL_IDLE_SECONDS = 0.05
+
+log = logging.getLogger(__name__)
+
+
+class AsyncBotAPI:
+    """Bot API client on a single aiohttp session (keep-alive pool).
+
+    Same timeouts, retry policy and counters as telegram_client.TelegramClient.
+    """
+
+    def __init__(self, token, pool_size=telegram_client.POOL_SIZE, max_retries=telegram_client.MAX_RETRIES):
+        self.base_url = f"{telegram_client.API_BASE}/bot{token}"
+        self.file_url = f"{telegram_client.API_BASE}/file/bot{token}"
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.session = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def call(self, method, payload=None, timeout=None, max_retries=None):
+        url = f"{self.base_url}/{method}"
+        client_timeout = aiohttp.ClientTimeout(total=method_timeout(method, timeout))
+        if method in telegram_client.NO_RETRY_METHODS:
+            retries = 0
+        else:
+            retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                async with self.session.post(url, json=payload or {}, timeout=client_timeout) as response:
+                    result = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                api_stats.record(method, time.monotonic() - started, error=True)
+                if attempt >= retries or (method in telegram_client.SEND_METHODS
+                                          and not isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                log.warning("⚠️ Telegram call failed, retrying", extra={"method": method, "attempt": attempt + 1,
+                                                                       "error": repr(e)})
+                delay = backoff_delay(attempt)
+            else:
+                ok = bool(result.get("ok"))
+                api_stats.record(method, time.monotonic() - started, error=not ok,
+                                 rate_limited=result.get("error_code") == 429)
+                if ok:
+                    return result
+                delay = retry_delay(result, attempt, method)
+                if delay is None or attempt >= retries:
+                    log.warning("⚠️ Telegram call failed", extra={"method": method, "status": result.get("error_code"),
+                                                                 "error": result.get("description", "")})
+                    return result
+            api_stats.record_retry(method)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def download(self, file_path, timeout=None):
+        client_timeout = aiohttp.ClientTimeout(total=method_timeout("file", timeout))
+        started = time.monotonic()
+        try:
+            async with self.session.get(f"{self.file_url}/{file_path}", timeout=client_timeout) as response:
+                response.raise_for_status()
+                data = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            api_stats.record("file", time.monotonic() - started, error=True)
+            raise
+        api_stats.record("file", time.monotonic() - started)
+        return data
+
+
+class ThreadBridge:
+    """Blocking call()/download() for handler threads, executed on the loop"""
+
+    def __init__(self, api, loop):
+        self.api = api
+        self.loop = loop
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def call(self, method, payload=None, timeout=None, max_retries=None):
+        return self._run(self.api.call(method, payload, timeout, max_retries))
+
+    def download(self, file_path, timeout=None):
+        return self._run(self.api.download(file_path, timeout))
+
+
+def chat_key(update):
+    """Updates with the same key are handled in order"""
+    if "message" in update:
+        return update["message"]["chat"]["id"]
+    if "callback_query" in update:
+        callback = update["callback_query"]
+        message = callback.get("message")
+        if message:
+            return message["chat"]["id"]
+        return callback["from"]["id"]
+    return update.get("update_id")
+
+
+class ChatDispatcher:
+    """Runs handle_update concurrently across chats, sequentially within a chat.
+
+    The handler is called as handler(update, received_at) with the monotonic
+    time the update was submitted, so waiting behind a chat's earlier updates
+    doesn't change when it arrived.
+    """
+
+    def __init__(self, handler, executor):
+        self.handler = handler
+        self.executor = executor
+        self.queues = {}   # chat key -> deque of pending updates
+        self.tasks = set()
+
+    def submit(self, update):
+        """Queue an update, returns a future that is done once it has been handled"""
+        loop = asyncio.get_running_loop()
+        handled = loop.create_future()
+        item = (update, time.monotonic(), handled)
+        key = chat_key(update)
+        queue = self.queues.get(key)
+        if queue is not None:
+            queue.append(item)
+            return handled
+        self.queues[key] = deque([item])
+        task = loop.create_task(self._drain(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return handled
+
+    async def _drain(self, key):
+        loop = asyncio.get_running_loop()
+        queue = self.queues[key]
+        try:
+            while queue:
+                update, received_at, handled = queue.popleft()
+                try:
+                    await loop.run_in_executor(self.executor, self.handler, update, received_at)
+                except Exception as e:
+                    log.error("❌ Error handling update", extra={"chat": key, "error": str(e)})
+                finally:
+                    handled.set_result(None)
+        finally:
+            del self.queues[key]
+
+    @property
+    def pending(self):
+        return sum(len(q) for q in self.queues.values())
+
+
+async def commit_when_handled(reader, offset, handled, previous):
+    """Save the spool offset once its batch and every batch before it have been handled"""
+    if previous is not None:
+        await asyncio.wait([previous])
+    await asyncio.gather(*handled)
+    try:
+        await asyncio.to_thread(reader.commit, offset)
+    except OSError as e:
+        log.warning("⚠️ Failed to save the spool offset", extra={"error": str(e)})
+
+
+async def poll_updates(bot, api, dispatcher):
+    offset = 0
+    log.info("📡 Long polling started")
+    while True:
+        beat()
+        bot.profiler.cycle()
+        try:
+            updates = await api.call("getUpdates", {"offset": offset, "timeout": 30})
+        except Exception as e:
+            log.warning("⚠️ getUpdates failed", extra={"error": str(e)})
+            await asyncio.sleep(1)
+            continue
+        if not updates.get("ok"):
+            await asyncio.sleep(1)
+            continue
+        board.mark("number_last_poll")
+        bot.capture_updates(updates.get("result"))
+        for update in updates.get("result", []):
+            dispatcher.submit(update)
+            offset = update["update_id"] + 1
+
+
+async def consume_webhook_updates(bot, dispatcher):
+    """Webhook mode: dispatch updates spooled by health_server.py in batches"""
+    log.info("📥 Webhook mode: reading spooled updates")
+    reader = SpoolReader()
+    committing = None
+    while True:
+        beat()
+        bot.profiler.cycle()
+        try:
+            updates = await asyncio.to_thread(reader.read_batch)
+        except Exception as e:
+            log.warning("⚠️ Webhook spool error", extra={"error": str(e)})
+            updates = []
+        else:
+            board.mark("number_last_poll")
+            bot.capture_updates(updates)
+        if updates:
+            handled = [dispatcher.submit(update) for update in updates]
+            committing = asyncio.create_task(commit_when_handled(reader, reader.offset, handled, committing))
+        else:
+            await asyncio.sleep(SPOOL_IDLE_SECONDS)
+
+
+async def send_otp(bot, api, limit, user_id, msg, trace):
+    """Send one OTP; its delivery time is taken as soon as Telegram accepts it"""
+    async with limit:
+        result = await api.call("sendMessage", {"chat_id": user_id, "text": msg, "parse_mode": "HTML"})
+    if result.get("ok"):
+        board.mark("number_last_send")
+        bot.otp_latency.delivered(trace)
+    return result
+
+
+async def monitor_otp_queue(bot, api):
+    """OTP monitor task: file scanning in a thread, deliveries sent OTP_SEND_CONCURRENCY at a time"""
+    bot.otp_log.info("🔍 OTP Monitor started")
+    limit = asyncio.Semaphore(OTP_SEND_CONCURRENCY)
+    while True:
+        try:
+            result = await asyncio.to_thread(bot.collect_otp_deliveries)
+            if result is None:
+                await asyncio.sleep(5)
+                continue
+            deliveries, position = result
+            if deliveries:
+                sends = [send_otp(bot, api, limit, user_id, msg, trace) for user_id, msg, trace in deliveries]
+                results = await asyncio.gather(*sends, return_exceptions=True)
+                for (user_id, _, trace), result in zip(deliveries, results):
+                    if isinstance(result, Exception):
+                        bot.log_otp_delivery(user_id, trace, False, error=str(result))
+                    else:
+                        bot.log_otp_delivery(user_id, trace, result.get("ok"), error=result.get("description"))
+            await asyncio.to_thread(bot.save_otp_position, position)
+        except Exception as e:
+            bot.otp_log.warning("⚠️ OTP Monitor error", extra={"error": str(e)})
+        await asyncio.sleep(OTP_POLL_SECONDS)
+
+
+async def expire_leases(bot):
+    """Lease expiry task: the blocking work runs in a thread"""
+    while True:
+        try:
+            await asyncio.to_thread(bot.expire_leases)
+        except Exception as e:
+            log.warning("⚠️ Lease expiry error", extra={"error": str(e)})
+        await asyncio.sleep(LEASE_TICK_SECONDS)
+
+
+async def serve(bot):
+    log.info("🤖 Number Bot started (asyncio runtime)")
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    handler_executor = ThreadPoolExecutor(max_workers=HANDLER_WORKERS, thread_name_prefix="handler")
+    # The process already runs threads (metrics, profiler, log writer, handlers):
+    # fork from a clean server process rather than from this one
+    cpu_executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+
+    api = AsyncBotAPI(bot.BOT_TOKEN)
+    await api.start()
+    sync_transport = bot.api_transport
+    bot.api_transport = ThreadBridge(api, loop)
+    bot.cpu_executor = cpu_executor
+
+    with bot.startup.phase("init_files"):
+        await asyncio.to_thread(bot.init_files)
+    with bot.startup.phase("configure_webhook"):
+        await asyncio.to_thread(bot.configure_webhook)
+
+    dispatcher = ChatDispatcher(bot.handle_update, handler_executor)
+    if bot.WEBHOOK_URL:
+        updates_task = consume_webhook_updates(bot, dispatcher)
+    else:
+        updates_task = poll_updates(bot, api, dispatcher)
+    tasks = [
+        asyncio.create_task(updates_task),
+        asyncio.create_task(monitor_otp_queue(bot, api)),
+        asyncio.create_task(expire_leases(bot)),
+    ]
+    bot.startup.mark_serving()
+    log.info("✅ Serving updates", extra={"duration_ms": round((time.monotonic() - started) * 1000)})
+    deferred = asyncio.create_task(asyncio.to_thread(bot.deferred_startup))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        deferred.cancel()
+        bot.api_transport = sync_transport
+        bot.cpu_executor = None
+        await api.close()
+        handler_executor.shutdown(wait=False, cancel_futures=True)
+        cpu_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run(bot):
+    """Run the bot module ``bot`` (number_bot) on an asyncio event loop"""
+    try:
+        asyncio.run(serve(bot))
+    except KeyboardInterrupt:
+        log.info("👋 Number Bot stopped")
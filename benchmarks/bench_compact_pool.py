@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: countries.json lists vs. CompactPool memory and save cost
+
+Compares the two storage formats only. The bot doesn't use CompactPool,
+so these numbers are not a measure of the running bot.
+
+Usage: python benchmarks/bench_compact_pool.py [--numbers 1000000] [--leases 1000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compact_pool import CompactPool, pool_from_json, pool_to_json
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numbers", type=int, default=1_000_000)
+    parser.add_argument("--leases", type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    json_path = os.path.join(tmp, "countries.json")
+    pool_path = os.path.join(tmp, "Ecuador.pool")
+
+    tracemalloc.start()
+    numbers = [str(593000000000 + i) for i in range(args.numbers)]
+    countries = {"Ecuador": {"flag": "🇪🇨", "numbers": numbers}}
+    json_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    pool = pool_from_json("Ecuador", countries["Ecuador"])
+    pool_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"📦 {args.numbers:,} numbers")
+    print(f"memory  json lists: {json_bytes / 1e6:8.1f} MB   compact: {pool_bytes / 1e6:8.1f} MB")
+
+    t0 = time.perf_counter()
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(countries, f, ensure_ascii=False, indent=2)
+    json_save = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pool.save(pool_path)
+    full_save = time.perf_counter() - t0
+
+    for _ in range(args.leases):
+        pool.lease_next()
+    t0 = time.perf_counter()
+    written = pool.checkpoint()
+    checkpoint = time.perf_counter() - t0
+    print(f"save    json: {json_save * 1e3:8.1f} ms ({os.path.getsize(json_path) / 1e6:.1f} MB)   "
+          f"pool: {full_save * 1e3:8.1f} ms ({os.path.getsize(pool_path) / 1e6:.1f} MB)   "
+          f"checkpoint after {args.leases} leases: {checkpoint * 1e3:.2f} ms ({written} bytes)")
+
+    t0 = time.perf_counter()
+    mapped = CompactPool.load(pool_path, use_mmap=True)
+    print(f"mmap open: {(time.perf_counter() - t0) * 1e3:.2f} ms, free {mapped.free_count:,}")
+    mapped.lease_next()
+    mapped.append("593999999999")
+    mapped.checkpoint()
+    mapped.close()
+
+    restored = pool_to_json(CompactPool.load(pool_path))
+    assert restored["numbers"] == numbers[args.leases + 1:] + ["593999999999"]
+    print("✅ JSON round-trip ok")
+
+
+if __name__ == "__main__":
+    main()
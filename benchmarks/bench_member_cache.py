@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MemberSet lookups vs. loading approved_users.json on every check
+
+Usage: python benchmarks/bench_member_cache.py [--members 50000] [--checks 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from member_cache import MemberSet
+
+
+def legacy_is_approved(path, user_id):
+    """The previous is_user_approved: parse the whole file per check"""
+    with open(path, "r", encoding="utf-8") as f:
+        approved = json.load(f)
+    return str(user_id) in approved
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=50_000)
+    parser.add_argument("--checks", type=int, default=100_000)
+    parser.add_argument("--legacy-checks", type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "approved_users.json")
+    members = {
+        str(7_000_000_000 + i): {"user_id": 7_000_000_000 + i, "username": f"user{i}", "first_name": "User",
+                                 "approved_at": 1700000000.0}
+        for i in range(args.members)
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(members, f, ensure_ascii=False, indent=2)
+    print(f"📦 {args.members:,} approved members, {os.path.getsize(path) / 1e6:.1f} MB file")
+
+    t0 = time.perf_counter()
+    for i in range(args.legacy_checks):
+        legacy_is_approved(path, 7_000_000_000 + i)
+    legacy = (time.perf_counter() - t0) / args.legacy_checks
+    print(f"legacy check:   {legacy * 1e6:10.1f} µs")
+
+    cache = MemberSet(path)
+    t0 = time.perf_counter()
+    7_000_000_000 in cache  # first check loads the file
+    print(f"first check:    {(time.perf_counter() - t0) * 1e6:10.1f} µs")
+
+    t0 = time.perf_counter()
+    for i in range(args.checks):
+        (7_000_000_000 + i) in cache
+    cached = (time.perf_counter() - t0) / args.checks
+    print(f"cached check:   {cached * 1e6:10.1f} µs  ({legacy / cached:,.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streaming number import vs. the old parse-then-list-scan upload
+
+Usage: python benchmarks/bench_number_import.py [--rows 1000000] [--legacy-rows 20000]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from number_import import import_numbers
+from number_pool import NumberPool
+
+
+def build_csv(rows, seed=1):
+    """CSV with a header, formatting noise, ~5% duplicates, ~2% junk and ~3% Venezuelan rows"""
+    rng = random.Random(seed)
+    lines = ["phone"]
+    for i in range(rows):
+        roll = rng.random()
+        if roll < 0.02:
+            lines.append("n/a")
+        elif roll < 0.05:
+            lines.append(str(584120000000 + i))
+        elif roll < 0.07 and i:
+            lines.append(str(593000000000 + rng.randrange(i)))
+        elif roll < 0.2:
+            lines.append(f"+593 {i // 1000000:03d}-{i % 1000000:06d}")
+        else:
+            lines.append(str(593000000000 + i))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def legacy_import(file_content, existing):
+    """The previous upload path: read everything, clean row by row, list membership test"""
+    df = pd.read_csv(io.BytesIO(file_content), dtype=str)
+    cleaned_numbers = []
+    for num in df.iloc[:, 0].tolist():
+        cleaned = str(num).strip()
+        if cleaned.lower() in ['nan', 'none', '']:
+            continue
+        if cleaned.endswith('.0'):
+            cleaned = cleaned[:-2]
+        cleaned = cleaned.replace(' ', '').replace('-', '').replace('+', '')
+        if cleaned.isdigit() and 8 <= len(cleaned) <= 15:
+            cleaned_numbers.append(cleaned)
+    added = 0
+    for number in cleaned_numbers:
+        if number not in existing:
+            existing.append(number)
+            added += 1
+    return added
+
+
+def measure(func):
+    """Time one run, then measure peak memory on a second (tracemalloc slows it down)"""
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    data = build_csv(args.rows)
+    print(f"📦 {args.rows:,} rows, {len(data) / 1e6:.1f} MB CSV")
+
+    def run():
+        pool = NumberPool()
+        pool.add_country("Ecuador")
+        pool.add_numbers("Venezuela", [str(584120000000 + i) for i in range(0, args.rows, 2)])
+        return import_numbers(pool, "Ecuador", data, "numbers.csv", calling_code=593)
+
+    stats, elapsed, peak = measure(run)
+    print(f"streaming:     {elapsed:8.3f} s  {args.rows / elapsed:12,.0f} rows/s  peak {peak / 1e6:7.1f} MB")
+    print(f"               added {stats.added:,}, duplicates {stats.duplicates_in_file:,}, invalid {stats.invalid:,}, "
+          f"wrong country {sum(stats.wrong_country.values()):,}")
+
+    sample = build_csv(args.legacy_rows)
+    added, elapsed, peak = measure(lambda: legacy_import(sample, []))
+    print(f"legacy ({args.legacy_rows:,} rows): {elapsed:8.3f} s  {args.legacy_rows / elapsed:12,.0f} rows/s  peak {peak / 1e6:7.1f} MB")
+    print("               (list membership is O(n) per row, so legacy time grows quadratically)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark: NumberPool lease/release vs. the old list-scan assignment
+
+Allocator only: saving the pool is left out on both sides. The cost of
+assign_number_to_user as the bot runs it, lease journal included, is the
+assign_number case of run_suite.py.
+
+Usage: python benchmarks/bench_number_pool.py [--numbers 1000000] [--users 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from number_pool import NumberPool
+
+COUNTRIES = ["Ecuador", "Venezuela", "Egypt", "Pakistan"]
+
+
+def build_data(total_numbers):
+    per_country = total_numbers // len(COUNTRIES)
+    countries = {}
+    for i, country in enumerate(COUNTRIES):
+        base = 500000000000 + i * 10_000_000_000
+        countries[country] = {"flag": "🌍", "numbers": [str(base + n) for n in range(per_country)]}
+    return countries
+
+
+def legacy_assign(countries, assignments, user_key, country):
+    """The previous assign_number_to_user algorithm, without file I/O"""
+    all_assigned_numbers = set()
+    for data in assignments.values():
+        all_assigned_numbers.add(data["number"])
+    available = [n for n in countries[country]["numbers"] if n not in all_assigned_numbers]
+    if not available:
+        return None
+    if user_key in assignments:
+        old = assignments[user_key]
+        if old["number"] in countries[old["country"]]["numbers"]:
+            countries[old["country"]]["numbers"].remove(old["number"])
+    selected = available[0]
+    countries[country]["numbers"].remove(selected)
+    assignments[user_key] = {"number": selected, "country": country}
+    return selected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numbers", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--legacy-samples", type=int, default=20)
+    args = parser.parse_args()
+
+    countries = build_data(args.numbers)
+    print(f"📦 {args.numbers:,} numbers in {len(COUNTRIES)} countries, {args.users:,} users")
+
+    pool = NumberPool()
+    t0 = time.perf_counter()
+    pool.load(countries, {})
+    print(f"load:          {time.perf_counter() - t0:8.3f} s")
+
+    t0 = time.perf_counter()
+    for uid in range(args.users):
+        pool.lease(uid, COUNTRIES[uid % len(COUNTRIES)])
+    elapsed = time.perf_counter() - t0
+    print(f"lease:         {elapsed:8.3f} s  ({elapsed / args.users * 1e6:.2f} µs/op)")
+
+    t0 = time.perf_counter()
+    for uid in range(args.users):
+        pool.lease(uid, COUNTRIES[(uid + 1) % len(COUNTRIES)])
+    elapsed = time.perf_counter() - t0
+    print(f"change number: {elapsed:8.3f} s  ({elapsed / args.users * 1e6:.2f} µs/op)")
+
+    t0 = time.perf_counter()
+    for uid in range(args.users):
+        pool.release(uid)
+    elapsed = time.perf_counter() - t0
+    print(f"release:       {elapsed:8.3f} s  ({elapsed / args.users * 1e6:.2f} µs/op)")
+
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        pool.free_counts()
+    print(f"free_counts:   {(time.perf_counter() - t0) / 1000 * 1e6:8.2f} µs/op")
+
+    # The old algorithm is O(users + pool) per call, so only sample it with
+    # a full set of existing assignments and extrapolate.
+    legacy_countries = build_data(args.numbers)
+    assignments = {}
+    for uid in range(args.users):
+        country = COUNTRIES[uid % len(COUNTRIES)]
+        number = legacy_countries[country]["numbers"].pop()
+        assignments[str(uid)] = {"number": number, "country": country}
+    t0 = time.perf_counter()
+    for i in range(args.legacy_samples):
+        legacy_assign(legacy_countries, assignments, f"new{i}", COUNTRIES[i % len(COUNTRIES)])
+    per_op = (time.perf_counter() - t0) / args.legacy_samples
+    print(f"legacy lease:  {per_op * 1e3:8.2f} ms/op  (~{per_op * args.users / 60:.1f} min for {args.users:,} users)")
+
+
+if __name__ == "__main__":
+    main()
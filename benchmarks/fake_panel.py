@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the NumberPanel, for end-to-end load tests
+
+Serves the login page with its "What is a + b = ?" captcha, and the
+SMSCDRReports page whose #dt table is filled by a DataTables-style AJAX
+call after --ajax-delay-ms, like the real panel. SMS arrive at --rate per
+second (Poisson) and the table shows the newest --rows of them. A
+--leased-share of them go to numbers leased in the Number Bot's
+user_assignments.json (with its lease journal replayed on top), so OTPs flow all the way to the virtual users of
+fake_telegram.py; the rest go to random numbers.
+
+Usage:
+    python benchmarks/fake_panel.py --port 8082 --rate 5 --assignments user_assignments.json
+    PANEL_BASE_URL=http://127.0.0.1:8082/NumberPanel python main.py
+
+/stats reports SMS generated, pages and AJAX calls served and logins.
+"""
+import argparse
+import asyncio
+import html
+import json
+import os
+import random
+import secrets
+import sys
+import time
+from collections import deque
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+from lease_journal import LEASE_JOURNAL_FILE, LeaseJournal, apply as replay_journal
+
+ASSIGNMENTS_REFRESH_SECONDS = 2
+
+LOGIN_HTML = """<html><head><title>NumberPanel | Login</title></head><body>
+<form method="post" action="signin">
+<input type="text" name="username" placeholder="Username">
+<input type="password" name="password" placeholder="Password">
+<label>What is {a} + {b} = ?</label>
+<input type="text" name="capt" placeholder="Your answer">
+<button type="submit">LOGIN</button>
+</form>
+{notice}
+</body></html>"""
+
+DASHBOARD_HTML = """<html><head><title>NumberPanel | Dashboard</title></head><body>
+<h3>Welcome</h3><a href="SMSCDRReports">SMS Reports</a></body></html>"""
+
+# Rows are loaded after the page, as DataTables does; until then the table
+# holds a single "Loading" cell that main.py waits out
+REPORTS_HTML = """<html><head><title>SMS CDR Reports</title></head><body>
+<div class="content"><table id="dt" class="table dataTable"><thead><tr>
+<th>Date</th><th>Range</th><th>Number</th><th>CLI</th><th>Client</th><th>SMS</th><th>Currency</th><th>Payout</th>
+</tr></thead><tbody><tr><td colspan="8">Loading...</td></tr></tbody></table></div>
+<script>
+setTimeout(function () {
+  fetch("res/data_smscdr.php", {credentials: "same-origin"}).then(function (r) { return r.json(); }).then(function (data) {
+    var tbody = document.querySelector("#dt tbody");
+    tbody.innerHTML = "";
+    data.aaData.forEach(function (row) {
+      var tr = document.createElement("tr");
+      row.forEach(function (cell) {
+        var td = document.createElement("td");
+        td.innerHTML = cell;
+        tr.appendChild(td);
+      });
+      tbody.appendChild(tr);
+    });
+  });
+}, %d);
+</script></body></html>"""
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class FakePanel:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.texts = fixtures.sms_texts(1000, args.seed)
+        self.sms = deque(maxlen=args.rows)     # newest last
+        self.sessions = set()
+        self.captchas = {}                      # login token -> answer
+        self.leased = []
+        self.assignments_mtime = None
+        self.stats = {"sms": 0, "sms_to_leased": 0, "logins": 0, "failed_logins": 0, "pages": 0, "ajax": 0}
+
+    # ======== SMS arrivals ========
+
+    def refresh_leased(self):
+        path = self.args.assignments
+        if not path:
+            return
+        try:
+            journal = LeaseJournal(os.path.join(os.path.dirname(path), LEASE_JOURNAL_FILE))
+            mtime = (os.path.getmtime(path), _mtime(journal.path))
+            if mtime == self.assignments_mtime:
+                return
+            with open(path, encoding="utf-8") as f:
+                assignments = json.load(f)
+            replay_journal({}, assignments, journal.entries())
+        except (OSError, ValueError):
+            return
+        self.assignments_mtime = mtime
+        self.leased = [data["number"] for data in assignments.values() if data.get("number")]
+
+    def new_sms(self):
+        if self.leased and self.rng.random() < self.args.leased_share:
+            number = self.rng.choice(self.leased)
+            self.stats["sms_to_leased"] += 1
+        else:
+            number = fixtures.country_number(self.rng, self.rng.choice(fixtures.COUNTRIES)[2])
+        now = time.time() + self.args.utc_offset_hours * 3600
+        text = self.rng.choice(self.texts)
+        cli = self.rng.choice(fixtures.SERVICES) if self.rng.random() < 0.7 else "0"
+        self.sms.append((time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now)), number, cli, "client1", text))
+        self.stats["sms"] += 1
+
+    async def arrivals(self):
+        last_refresh = 0
+        while True:
+            if time.monotonic() - last_refresh > ASSIGNMENTS_REFRESH_SECONDS:
+                self.refresh_leased()
+                last_refresh = time.monotonic()
+            if self.args.rate:
+                await asyncio.sleep(self.rng.expovariate(self.args.rate))
+                self.new_sms()
+            else:
+                await asyncio.sleep(1)
+
+    # ======== HTTP ========
+
+    def logged_in(self, request):
+        return self.args.no_auth or request.cookies.get("PHPSESSID") in self.sessions
+
+    async def handle_login_page(self, request, notice=""):
+        a, b = self.rng.randrange(1, 10), self.rng.randrange(1, 10)
+        token = secrets.token_hex(8)
+        self.captchas[token] = a + b
+        response = web.Response(text=LOGIN_HTML.format(a=a, b=b, notice=notice), content_type="text/html")
+        response.set_cookie("login_token", token)
+        return response
+
+    async def handle_signin(self, request):
+        form = await request.post()
+        expected = self.captchas.pop(request.cookies.get("login_token"), None)
+        if (form.get("username") != self.args.username or form.get("password") != self.args.password
+                or expected is None or form.get("capt", "").strip() != str(expected)):
+            self.stats["failed_logins"] += 1
+            return await self.handle_login_page(request, notice="<p>Invalid login</p>")
+        session = secrets.token_hex(16)
+        self.sessions.add(session)
+        self.stats["logins"] += 1
+        response = web.HTTPFound("agent/SMSDashboard")
+        response.set_cookie("PHPSESSID", session)
+        raise response
+
+    async def handle_dashboard(self, request):
+        if not self.logged_in(request):
+            raise web.HTTPFound("../login")
+        return web.Response(text=DASHBOARD_HTML, content_type="text/html")
+
+    async def handle_reports(self, request):
+        if not self.logged_in(request):
+            raise web.HTTPFound("../login")
+        self.stats["pages"] += 1
+        return web.Response(text=REPORTS_HTML % self.args.ajax_delay_ms, content_type="text/html")
+
+    async def handle_data(self, request):
+        if not self.logged_in(request):
+            return web.json_response({"aaData": []}, status=403)
+        self.stats["ajax"] += 1
+        rows = [[date, "Range 1", number, cli, client, html.escape(sms).replace("\n", "<br>"), "USD", "0.005"]
+                for date, number, cli, client, sms in reversed(self.sms)]
+        rows.append([f"CDR Data: {len(rows)},0,0", "", "", "", "", "", "", ""])
+        return web.json_response({"sEcho": 1, "iTotalRecords": len(rows), "iTotalDisplayRecords": len(rows),
+                                  "aaData": rows})
+
+    async def handle_stats(self, request):
+        return web.json_response(dict(self.stats, rows_shown=len(self.sms), leased_numbers=len(self.leased)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--rate", type=float, default=1, help="SMS arriving per second")
+    parser.add_argument("--rows", type=int, default=100, help="newest SMS shown in the table")
+    parser.add_argument("--ajax-delay-ms", type=int, default=500, help="delay before the table is filled")
+    parser.add_argument("--assignments", default="user_assignments.json",
+                        help="the Number Bot's user_assignments.json, to send OTPs to leased numbers")
+    parser.add_argument("--leased-share", type=float, default=0.5, help="share of SMS sent to leased numbers")
+    parser.add_argument("--utc-offset-hours", type=float, default=float(os.getenv("PANEL_UTC_OFFSET_HOURS", "0")),
+                        help="offset of the panel's clock from UTC")
+    parser.add_argument("--username", default=os.getenv("LOGIN_USERNAME", ""))
+    parser.add_argument("--password", default=os.getenv("LOGIN_PASSWORD", ""))
+    parser.add_argument("--no-auth", action="store_true", help="serve the reports without logging in")
+    parser.add_argument("--seed", type=int, default=fixtures.SEED)
+    args = parser.parse_args()
+
+    async def start_background(app):
+        app["arrivals"] = asyncio.create_task(app["panel"].arrivals())
+
+    async def stop_background(app):
+        app["arrivals"].cancel()
+
+    panel = FakePanel(args)
+    app = web.Application()
+    app["panel"] = panel
+    app.router.add_get("/NumberPanel/login", panel.handle_login_page)
+    app.router.add_post("/NumberPanel/signin", panel.handle_signin)
+    app.router.add_get("/NumberPanel/agent/SMSDashboard", panel.handle_dashboard)
+    app.router.add_get("/NumberPanel/agent/SMSCDRReports", panel.handle_reports)
+    app.router.add_get("/NumberPanel/agent/res/data_smscdr.php", panel.handle_data)
+    app.router.add_get("/stats", panel.handle_stats)
+    app.on_startup.append(start_background)
+    app.on_cleanup.append(stop_background)
+    print(f"📟 Fake NumberPanel on http://{args.host}:{args.port}/NumberPanel ({args.rate} SMS/s)")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
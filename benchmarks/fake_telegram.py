@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Telegram Bot API, for end-to-end load tests
+
+Serves getUpdates (long polling, or pushes to the URL given to setWebhook),
+sendMessage, editMessageText, answerCallbackQuery, getFile and file
+downloads for any bot token, with configurable response latency and 429
+injection (a random share of calls and/or a global sends-per-second cap).
+Every other method just answers ok.
+
+Virtual users drive the Number Bot the way real ones do: /start, wait for
+the admin (played by this server too, it presses every approve button it
+is sent), /getnumber, pick a country, then every --think seconds either
+change the number or check /status. Bot response times (update handed out
+-> first reply to that chat) and OTP deliveries are reported on /stats.
+
+Usage:
+    python benchmarks/fake_telegram.py --port 8081 --users 200 --admin-id 1
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 ADMIN_USER_ID=1 python run_all.py
+
+POST /inject takes a raw update (e.g. a document with file_id "rows_100000",
+which getFile serves as a generated 100k-line upload) for admin flows.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+from otp_latency import percentiles
+
+SEND_METHODS = {"sendMessage", "editMessageText", "answerCallbackQuery"}
+RESPONSE_WINDOW = 10_000
+GET_UPDATES_LIMIT = 100
+FILE_ROWS = re.compile(r"rows_(\d+)")
+
+
+class FakeTelegram:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.updates = deque()          # pending updates, oldest first
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.new_update = asyncio.Event()
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.calls = {}                 # method -> count
+        self.injected_429 = 0
+        self.send_window = deque()      # monotonic times of recent sends, for --global-rate
+        self.waiting = {}               # chat_id -> monotonic time its last update was handed out
+        self.response_times = deque(maxlen=RESPONSE_WINDOW)
+        self.otp_deliveries = 0
+        self.group_messages = 0
+        self.users = {}                 # user_id -> VirtualUser
+        self.started = time.monotonic()
+
+    # ======== Updates ========
+
+    def push_update(self, update):
+        update["update_id"] = self.next_update_id
+        self.next_update_id += 1
+        self.updates.append(update)
+        self.new_update.set()
+
+    def _sender(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def send_text(self, user_id, text):
+        self.push_update({"message": {
+            "message_id": self._message_id(), "from": self._sender(user_id),
+            "chat": {"id": user_id, "type": "private"}, "date": int(time.time()), "text": text,
+        }})
+
+    def press_button(self, user_id, message, data):
+        self.push_update({"callback_query": {
+            "id": str(self.rng.getrandbits(48)), "from": self._sender(user_id),
+            "message": message, "chat_instance": str(user_id), "data": data,
+        }})
+
+    def _message_id(self):
+        self.next_message_id += 1
+        return self.next_message_id
+
+    def _handed_out(self, updates):
+        now = time.monotonic()
+        for update in updates:
+            body = update.get("message") or update.get("callback_query", {}).get("message") or {}
+            chat_id = body.get("chat", {}).get("id")
+            if chat_id is not None:
+                self.waiting.setdefault(chat_id, now)
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), 50)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = list(self.updates)[:GET_UPDATES_LIMIT]
+        self._handed_out(batch)
+        return batch
+
+    async def push_to_webhook(self):
+        """Deliver updates to the URL registered with setWebhook, one at a time like Telegram"""
+        async with ClientSession(timeout=ClientTimeout(total=30)) as session:
+            while True:
+                if not self.webhook_url or not self.updates:
+                    self.new_update.clear()
+                    await self.new_update.wait()
+                    continue
+                update = self.updates[0]
+                headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+                try:
+                    self._handed_out([update])
+                    async with session.post(self.webhook_url, json=update, headers=headers) as response:
+                        if response.status == 200:
+                            self.updates.popleft()
+                            continue
+                except Exception as e:
+                    print(f"⚠️ Webhook delivery failed: {e}")
+                await asyncio.sleep(1)
+
+    # ======== Replies from the bots ========
+
+    def rate_limited(self, method):
+        if method not in SEND_METHODS:
+            return False
+        if self.args.rate_limit and self.rng.random() < self.args.rate_limit:
+            return True
+        if self.args.global_rate:
+            now = time.monotonic()
+            while self.send_window and now - self.send_window[0] > 1:
+                self.send_window.popleft()
+            if len(self.send_window) >= self.args.global_rate:
+                return True
+            self.send_window.append(now)
+        return False
+
+    @staticmethod
+    def chat_id(params):
+        # Group ids come as strings from the SMS bot's form posts; channels may be @names
+        chat_id = str(params.get("chat_id", ""))
+        return int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
+
+    def replied(self, chat_id):
+        started = self.waiting.pop(chat_id, None)
+        if started is not None:
+            self.response_times.append(time.monotonic() - started)
+
+    def on_message(self, params):
+        chat_id = self.chat_id(params)
+        text = params.get("text", "")
+        markup = params.get("reply_markup") or {}
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        message = {"message_id": self._message_id(), "chat": {"id": chat_id, "type": "private"},
+                   "date": int(time.time()), "text": text}
+        if "Reward:" in text:
+            self.otp_deliveries += 1
+        if chat_id not in self.users and chat_id != self.args.admin_id:
+            self.group_messages += 1
+        self.replied(chat_id)
+
+        if chat_id == self.args.admin_id:
+            for row in markup.get("inline_keyboard", []):
+                for button in row:
+                    if button.get("callback_data", "").startswith("approve_user:"):
+                        self.press_button(chat_id, message, button["callback_data"])
+        user = self.users.get(chat_id)
+        if user is not None:
+            user.received(message, markup)
+        return message
+
+    def on_edit(self, params):
+        chat_id = self.chat_id(params)
+        self.replied(chat_id)
+        message = {"message_id": int(params["message_id"]), "chat": {"id": chat_id, "type": "private"},
+                   "date": int(time.time()), "text": params.get("text", "")}
+        markup = params.get("reply_markup") or {}
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        user = self.users.get(chat_id)
+        if user is not None:
+            user.received(message, markup)
+        return message
+
+    # ======== HTTP ========
+
+    async def params(self, request):
+        params = dict(request.query)
+        if request.method == "POST" and request.can_read_body:
+            if request.content_type == "application/json":
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        return params
+
+    async def handle_method(self, request):
+        method = request.match_info["method"]
+        params = await self.params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self.get_updates(params)})
+
+        if self.args.latency_ms or self.args.jitter_ms:
+            await asyncio.sleep((self.args.latency_ms + self.rng.uniform(0, self.args.jitter_ms)) / 1000)
+        if self.rate_limited(method):
+            self.injected_429 += 1
+            return web.json_response({"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {self.args.retry_after}",
+                                      "parameters": {"retry_after": self.args.retry_after}}, status=429)
+
+        if method == "sendMessage":
+            result = self.on_message(params)
+        elif method == "editMessageText":
+            result = self.on_edit(params)
+        elif method == "answerCallbackQuery":
+            result = True
+        elif method == "getFile":
+            file_id = params.get("file_id", "")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_path": f"documents/{file_id}.csv"}
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        elif method == "setWebhook":
+            self.webhook_url = params.get("url") or None
+            self.webhook_secret = params.get("secret_token") or None
+            self.new_update.set()
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+            result = True
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request):
+        match = FILE_ROWS.search(request.match_info["path"])
+        rows = int(match.group(1)) if match else 1000
+        return web.Response(body=fixtures.upload_csv(rows), content_type="text/csv")
+
+    async def handle_inject(self, request):
+        self.push_update(await request.json())
+        return web.json_response({"ok": True})
+
+    async def handle_stats(self, request):
+        elapsed = time.monotonic() - self.started
+        states = {}
+        for user in self.users.values():
+            states[user.state] = states.get(user.state, 0) + 1
+        stats = {
+            "uptime": round(elapsed, 1),
+            "calls": self.calls,
+            "injected_429": self.injected_429,
+            "pending_updates": len(self.updates),
+            "updates_sent": self.next_update_id - 1,
+            "otp_deliveries": self.otp_deliveries,
+            "group_messages": self.group_messages,
+            "users": states,
+        }
+        if self.response_times:
+            p50, p95, p99 = percentiles(self.response_times)
+            stats["response_seconds"] = {"count": len(self.response_times), "p50": round(p50, 4),
+                                         "p95": round(p95, 4), "p99": round(p99, 4)}
+        return web.json_response(stats)
+
+    # ======== Virtual users ========
+
+    async def spawn_users(self):
+        for i in range(self.args.users):
+            user_id = self.args.first_user_id + i
+            user = self.users[user_id] = VirtualUser(self, user_id)
+            user.start()
+            if self.args.user_rate:
+                await asyncio.sleep(1 / self.args.user_rate)
+
+
+class VirtualUser:
+    """Scripted user: /start, wait for approval, /getnumber, pick a country, change or check status"""
+
+    def __init__(self, server, user_id):
+        self.server = server
+        self.user_id = user_id
+        self.state = "new"
+        self.timer = None
+
+    def start(self):
+        self.state = "pending"
+        self.server.send_text(self.user_id, "/start")
+
+    def later(self, action):
+        if self.timer is not None:
+            self.timer.cancel()
+        delay = self.server.rng.expovariate(1 / self.server.args.think) if self.server.args.think else 0
+        self.timer = asyncio.get_running_loop().call_later(delay, action)
+
+    def received(self, message, markup):
+        text = message["text"]
+        buttons = [button for row in markup.get("inline_keyboard", []) for button in row if "callback_data" in button]
+        if "Welcome to Number Bot" in text or "Access Granted" in text:
+            self.state = "approved"
+            self.later(lambda: self.server.send_text(self.user_id, "/getnumber"))
+        elif any(button["callback_data"].startswith("select_") for button in buttons):
+            choices = [button["callback_data"] for button in buttons if button["callback_data"].startswith("select_")]
+            choice = self.server.rng.choice(choices)
+            self.later(lambda: self.server.press_button(self.user_id, message, choice))
+        elif "Number Assigned" in text:
+            self.state = "leased"
+            self.later(lambda: self.next_action(message))
+        elif "No numbers available" in text or "don't have a number" in text:
+            self.state = "starved"
+            self.later(lambda: self.server.send_text(self.user_id, "/getnumber"))
+        elif "📱 <b>Number:</b>" in text:
+            # /status answer
+            self.later(lambda: self.next_action(message))
+
+    def next_action(self, message):
+        if self.server.rng.random() < self.server.args.change_share:
+            self.server.press_button(self.user_id, message, "change_number")
+        else:
+            self.server.send_text(self.user_id, "/status")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every call except getUpdates")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random extra latency, uniform in [0, jitter]")
+    parser.add_argument("--rate-limit", type=float, default=0, help="share of send calls answered with 429")
+    parser.add_argument("--global-rate", type=int, default=0, help="sends per second before 429s (0 = no cap)")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after in injected 429s")
+    parser.add_argument("--users", type=int, default=0, help="virtual users to run")
+    parser.add_argument("--user-rate", type=float, default=10, help="new virtual users per second")
+    parser.add_argument("--first-user-id", type=int, default=900_000_000)
+    parser.add_argument("--think", type=float, default=5, help="mean seconds a virtual user waits between actions")
+    parser.add_argument("--change-share", type=float, default=0.3, help="share of actions that change the number")
+    parser.add_argument("--admin-id", type=int, default=int(os.getenv("ADMIN_USER_ID", "0")),
+                        help="user id of the admin; approve buttons sent to it are pressed")
+    parser.add_argument("--seed", type=int, default=fixtures.SEED)
+    args = parser.parse_args()
+
+    async def start_background(app):
+        server = app["server"]
+        app["tasks"] = [asyncio.create_task(server.push_to_webhook()), asyncio.create_task(server.spawn_users())]
+
+    async def stop_background(app):
+        for task in app["tasks"]:
+            task.cancel()
+
+    server = FakeTelegram(args)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["server"] = server
+    app.router.add_route("*", "/bot{token}/{method}", server.handle_method)
+    app.router.add_get("/file/bot{token}/{path:.*}", server.handle_file)
+    app.router.add_post("/inject", server.handle_inject)
+    app.router.add_get("/stats", server.handle_stats)
+    app.on_startup.append(start_background)
+    app.on_cleanup.append(stop_background)
+    print(f"🤖 Fake Telegram Bot API on http://{args.host}:{args.port} ({args.users} virtual users)")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
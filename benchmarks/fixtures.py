@@ -0,0 +1,132 @@
+"""
+Deterministic synthetic inputs for the benchmark suite
+
+Everything is generated from a fixed seed, so two runs (or two machines)
+time exactly the same data. Large files are written once under the fixture
+directory and reused while their parameters stay the same.
+"""
+import json
+import os
+import random
+
+SEED = 20251110
+COUNTRIES = [("Ecuador", "🇪🇨", 593), ("Venezuela", "🇻🇪", 58), ("Egypt", "🇪🇬", 20), ("Pakistan", "🇵🇰", 92)]
+SERVICES = ["WhatsApp", "Telegram", "Facebook", "Google", "TikTok", "Instagram", "Binance", "Unknown"]
+SMS_TEMPLATES = [
+    "Your WhatsApp code: {a}-{b}\nDon't share this code with others",
+    "Telegram code: {a}{b}. Do not give this code to anyone, even if they say they are from Telegram!",
+    "G-{a}{b} is your Google verification code.",
+    "{a}{b} is your Facebook confirmation code",
+    "[TikTok] {a}{b} is your verification code, valid for 5 minutes.",
+    "Use {a}{b} to verify your Instagram account.",
+    "Binance verification code: {a}{b}. Valid for 10 minutes.",
+    "Your code is {a} {b}",
+]
+
+
+def country_number(rng, calling_code):
+    return f"{calling_code}{rng.randrange(10 ** 9, 10 ** 10)}"
+
+
+def sms_texts(count, seed=SEED):
+    rng = random.Random(seed)
+    return [rng.choice(SMS_TEMPLATES).format(a=rng.randrange(100, 1000), b=rng.randrange(100, 1000))
+            for _ in range(count)]
+
+
+def sms_rows(count, seed=SEED):
+    """(date, number, cli, client, sms) tuples as get_sms_rows returns them"""
+    rng = random.Random(seed)
+    texts = sms_texts(count, seed)
+    rows = []
+    for i in range(count):
+        _, _, code = rng.choice(COUNTRIES)
+        date = f"2025-11-10 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+        cli = rng.choice(SERVICES) if rng.random() < 0.7 else "0"
+        rows.append((date, country_number(rng, code), cli, "client1", texts[i]))
+    return rows
+
+
+def sms_page(count, seed=SEED):
+    """An SMSCDRReports page whose #dt table holds ``count`` SMS rows plus the panel's summary row"""
+    parts = [
+        "<html><head><title>SMS CDR Reports</title></head><body>",
+        "<div class='content'><table id='dt' class='table dataTable'><thead><tr>",
+        "<th>Date</th><th>Range</th><th>Number</th><th>CLI</th><th>Client</th><th>SMS</th><th>Currency</th><th>Payout</th>",
+        "</tr></thead><tbody>",
+    ]
+    for date, number, cli, client, sms in sms_rows(count, seed):
+        sms_html = sms.replace("\n", "<br>")
+        parts.append(f"<tr><td>{date}</td><td>Range 1</td><td>{number}</td><td>{cli}</td><td>{client}</td>"
+                     f"<td>{sms_html}</td><td>USD</td><td>0.005</td></tr>")
+    parts.append("<tr><td colspan='8'>CDR Data: 0,0,0</td></tr>")
+    parts.append("</tbody></table></div></body></html>")
+    return "".join(parts)
+
+
+def pool_data(total_numbers, users):
+    """(countries.json data, user_assignments.json data) with ``users`` numbers already leased"""
+    per_country = total_numbers // len(COUNTRIES)
+    countries = {}
+    for i, (name, flag, code) in enumerate(COUNTRIES):
+        base = int(f"{code}{i}00000000")
+        countries[name] = {"flag": flag, "numbers": [str(base + n) for n in range(per_country)]}
+    assignments = {}
+    for user in range(users):
+        name = COUNTRIES[user % len(COUNTRIES)][0]
+        number = countries[name]["numbers"].pop()
+        assignments[str(7_000_000_000 + user)] = {"number": number, "country": name, "timestamp": 1762776000.0}
+    return countries, assignments
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def otp_queue_file(directory, lines, assigned_numbers, seed=SEED):
+    """otp_queue.json with ``lines`` records, ~10% of them for leased numbers. Cached by size."""
+    path = os.path.join(directory, f"otp_queue_{lines}_{len(assigned_numbers)}_{seed}.json")
+    if os.path.exists(path):
+        return path
+    rng = random.Random(seed)
+    texts = sms_texts(1000, seed)
+    assigned = list(assigned_numbers)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        batch = []
+        for i in range(lines):
+            if assigned and rng.random() < 0.1:
+                number = rng.choice(assigned)
+            else:
+                number = country_number(rng, rng.choice(COUNTRIES)[2])
+            batch.append(json.dumps({
+                "number": number, "otp": texts[i % 1000][-6:], "service": SERVICES[i % len(SERVICES)],
+                "panel_ts": 1762776000.0 + i, "scraped_at": 1762776010.0 + i, "enqueued_at": 1762776011.0 + i,
+            }))
+            if len(batch) == 100_000:
+                f.write("\n".join(batch) + "\n")
+                batch = []
+        if batch:
+            f.write("\n".join(batch) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def upload_csv(rows, seed=SEED):
+    """Upload file content: a header, formatting noise, ~5% duplicates, ~2% junk, ~3% other countries"""
+    rng = random.Random(seed)
+    lines = ["phone"]
+    for i in range(rows):
+        roll = rng.random()
+        if roll < 0.02:
+            lines.append("n/a")
+        elif roll < 0.05:
+            lines.append(str(584120000000 + i))
+        elif roll < 0.07 and i:
+            lines.append(str(593000000000 + rng.randrange(i)))
+        elif roll < 0.2:
+            lines.append(f"+593 {i // 1000000:03d}-{i % 1000000:06d}")
+        else:
+            lines.append(str(593000000000 + i))
+    return ("\n".join(lines) + "\n").encode()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Replay captured Telegram updates against the Number Bot's dispatcher
+
+Feeds a capture written with CAPTURE_UPDATES_FILE (update_capture.py) to
+number_bot.handle_update through the async runtime's ChatDispatcher (in
+order per chat, concurrent across chats, HANDLER_WORKERS threads), at the
+captured pace times --speed, or as fast as possible with --speed 0. The
+Telegram API is stubbed: calls return a fake ok after --api-latency-ms,
+file downloads return a generated CSV of about the captured file size. Bot state lives in a scratch
+directory, copied from --state or generated (--pool numbers, nobody
+approved yet) so every replay starts from the same place.
+
+The report has throughput, update latency (arrival at the dispatcher to
+handler done, so queueing when the bot falls behind counts) and, per
+route, calls, errors, handler time, Telegram calls and state-file I/O
+(files opened for reading/writing, bytes, time from open to close).
+
+Usage:
+    python benchmarks/replay.py captures/updates-20251110.jsonl --speed 10 [--output replay.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+from otp_latency import percentiles
+from router import percentile_ms
+from structured_log import setup_logging
+from update_capture import ADMIN_PSEUDONYM, read_capture
+
+STATE_FILES = ("countries.json", "user_assignments.json", "approved_users.json", "pending_requests.json",
+               "quarantine.json", "otp_queue.json", "last_otp_check.txt", "lease_journal.jsonl")
+# Modules whose open() calls are counted as state-file I/O
+IO_MODULES = ("number_bot", "member_cache", "lease_manager", "lease_journal", "broadcast")
+FILE_ROWS = re.compile(r"rows_(\d+)")
+# Roughly one "593988100231\r\n" line of an uploaded numbers file
+UPLOAD_BYTES_PER_ROW = 14
+BACKGROUND = "(background)"
+
+# Route of the update the current thread is handling, set by a router middleware
+current = threading.local()
+
+
+def route_name():
+    return getattr(current, "route", None) or BACKGROUND
+
+
+class Costs:
+    """Telegram calls and state-file I/O per route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def _entry(self, route):
+        entry = self.routes.get(route)
+        if entry is None:
+            entry = self.routes[route] = {"api_calls": {}, "reads": 0, "writes": 0, "bytes_read": 0,
+                                          "bytes_written": 0, "io_seconds": 0.0}
+        return entry
+
+    def api_call(self, method):
+        with self._lock:
+            calls = self._entry(route_name())["api_calls"]
+            calls[method] = calls.get(method, 0) + 1
+
+    def file_io(self, writing, size, seconds):
+        with self._lock:
+            entry = self._entry(route_name())
+            if writing:
+                entry["writes"] += 1
+                entry["bytes_written"] += size
+            else:
+                entry["reads"] += 1
+                entry["bytes_read"] += size
+            entry["io_seconds"] += seconds
+
+
+class StubTransport:
+    """Stands in for the Telegram transport (api_transport in number_bot)"""
+
+    def __init__(self, costs, latency, file_sizes=None):
+        self.costs = costs
+        self.latency = latency
+        self.file_sizes = file_sizes or {}     # captured file_id -> file_size
+        self.message_ids = itertools.count(1)
+
+    def call(self, method, payload=None, timeout=None, max_retries=None):
+        payload = payload or {}
+        self.costs.api_call(method)
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "sendMessage":
+            return {"ok": True, "result": {"message_id": next(self.message_ids), "date": int(time.time()),
+                                           "chat": {"id": payload.get("chat_id")}, "text": payload.get("text", "")}}
+        if method == "getFile":
+            file_id = payload.get("file_id", "")
+            return {"ok": True, "result": {"file_id": file_id, "file_path": f"documents/{file_id}.csv"}}
+        return {"ok": True, "result": True}
+
+    def download(self, file_path, timeout=None):
+        self.costs.api_call("file")
+        match = FILE_ROWS.search(file_path)
+        if match:
+            return fixtures.upload_csv(int(match.group(1)))
+        size = self.file_sizes.get(os.path.splitext(os.path.basename(file_path))[0])
+        return fixtures.upload_csv(max(1, size // UPLOAD_BYTES_PER_ROW) if size else 1000)
+
+
+class CountedFile:
+    """File wrapper that reports its size and open time to Costs when closed"""
+
+    def __init__(self, f, costs, writing, size_before):
+        self._f = f
+        self._costs = costs
+        self._writing = writing
+        self._size_before = size_before
+        self._opened = time.perf_counter()
+        self._reported = False
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __iter__(self):
+        return iter(self._f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if not self._reported:
+            self._reported = True
+            try:
+                if self._writing:
+                    self._f.flush()
+                size = os.fstat(self._f.fileno()).st_size if self._writing else self._f.tell()
+            except (OSError, ValueError):
+                size = 0
+            self._f.close()
+            self._costs.file_io(self._writing, max(size - self._size_before, 0),
+                                time.perf_counter() - self._opened)
+        else:
+            self._f.close()
+
+
+def counting_open(costs):
+    def open_counted(file, mode="r", *args, **kwargs):
+        writing = any(flag in mode for flag in "wax+")
+        size_before = 0
+        if "a" in mode:
+            with contextlib.suppress(OSError):
+                size_before = os.path.getsize(file)
+        return CountedFile(open(file, mode, *args, **kwargs), costs, writing, size_before)
+    return open_counted
+
+
+def prepare_state(workdir, state_dir, pool):
+    os.makedirs(workdir, exist_ok=True)
+    for name in os.listdir(workdir):
+        # the lease journal's segments are "lease_journal.jsonl.<n>"
+        if name in STATE_FILES or name.startswith("lease_journal.jsonl."):
+            os.remove(os.path.join(workdir, name))
+    if state_dir:
+        for name in STATE_FILES:
+            source = os.path.join(state_dir, name)
+            if os.path.exists(source):
+                shutil.copy(source, workdir)
+    else:
+        countries, assignments = fixtures.pool_data(pool, 0)
+        fixtures.write_json(os.path.join(workdir, "countries.json"), countries)
+        fixtures.write_json(os.path.join(workdir, "user_assignments.json"), assignments)
+
+
+def load_updates(paths, limit=None):
+    """(arrival time, update) sorted by time, update_ids renumbered so captures can be concatenated"""
+    records = []
+    for path in paths:
+        records.extend(read_capture(path))
+    records.sort(key=lambda record: record[0])
+    if limit:
+        records = records[:limit]
+    for update_id, (_, update) in enumerate(records, 1):
+        update["update_id"] = update_id
+    return records
+
+
+async def replay(nb, records, speed, workers):
+    import async_runtime
+
+    latencies = []
+    lock = threading.Lock()
+
+    def handle(update, received_at):
+        try:
+            nb.handle_update(update, received_at)
+        finally:
+            # The tag_route middleware doesn't run for every update; don't
+            # let the next one on this thread inherit its route
+            current.route = None
+        done = time.monotonic()
+        with lock:
+            latencies.append(done - received_at)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay")
+    dispatcher = async_runtime.ChatDispatcher(handle, executor)
+    started = time.monotonic()
+    first_arrival = records[0][0] if records else 0
+    max_lag = 0.0
+    for arrival, update in records:
+        if speed:
+            delay = started + (arrival - first_arrival) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        dispatcher.submit(update)
+        if not speed:
+            await asyncio.sleep(0)
+    while dispatcher.tasks:
+        await asyncio.gather(*list(dispatcher.tasks), return_exceptions=True)
+    elapsed = time.monotonic() - started
+    executor.shutdown()
+    return elapsed, latencies, max_lag
+
+
+def build_report(args, records, elapsed, latencies, max_lag, route_stats, costs):
+    captured_seconds = records[-1][0] - records[0][0] if len(records) > 1 else 0
+    report = {
+        "meta": {"captures": args.captures, "speed": args.speed, "workers": args.workers,
+                 "api_latency_ms": args.api_latency_ms, "time": time.time()},
+        "updates": len(records),
+        "captured_seconds": round(captured_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": round(len(records) / elapsed, 2) if elapsed else None,
+        "schedule_lag_max_seconds": round(max_lag, 4),
+        "latency": None,
+        "routes": {},
+    }
+    if latencies:
+        p50, p95, p99 = percentiles(latencies)
+        report["latency"] = {"p50": round(p50, 5), "p95": round(p95, 5), "p99": round(p99, 5),
+                             "max": round(max(latencies), 5)}
+    for name in sorted(set(route_stats) | set(costs.routes)):
+        stats = route_stats.get(name, {})
+        calls = stats.get("calls", 0)
+        report["routes"][name] = {
+            "calls": calls,
+            "errors": stats.get("errors", 0),
+            "handler_seconds": round(stats.get("latency_total", 0.0), 4),
+            "avg_ms": round(stats["latency_total"] / calls * 1000, 3) if calls else None,
+            "p95_ms_le": percentile_ms(stats["buckets"], 0.95) if calls else None,
+            "max_ms": round(stats.get("latency_max", 0.0) * 1000, 3),
+            **costs.routes.get(name, {}),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"\n🔁 Replayed {report['updates']} updates ({report['captured_seconds']}s captured) "
+          f"in {report['elapsed_seconds']}s: {report['throughput']} updates/s")
+    if report["latency"]:
+        latency = report["latency"]
+        print(f"⏱️ Update latency p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms, "
+              f"p99 {latency['p99'] * 1000:.1f} ms, max {latency['max'] * 1000:.1f} ms; "
+              f"max schedule lag {report['schedule_lag_max_seconds']}s")
+    print(f"\n{'route':<28} {'calls':>7} {'err':>5} {'avg ms':>8} {'p95 ms≤':>8} {'total s':>8} "
+          f"{'api':>6} {'reads':>7} {'writes':>7} {'KB r/w per call':>16} {'io s':>7}")
+    busiest = sorted(report["routes"].items(), key=lambda item: item[1].get("handler_seconds", 0), reverse=True)
+    for name, route in busiest:
+        calls = route["calls"] or 1
+        api = sum(route.get("api_calls", {}).values())
+        kb = f"{route.get('bytes_read', 0) / calls / 1024:.0f}/{route.get('bytes_written', 0) / calls / 1024:.0f}"
+        avg = f"{route['avg_ms']:.1f}" if route["avg_ms"] is not None else "-"
+        print(f"{name[:28]:<28} {route['calls']:>7} {route['errors']:>5} {avg:>8} {str(route['p95_ms_le'] or '-'):>8} "
+              f"{route['handler_seconds']:>8.2f} {api:>6} {route.get('reads', 0):>7} {route.get('writes', 0):>7} "
+              f"{kb:>16} {route.get('io_seconds', 0):>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("captures", nargs="+", help="capture files (.jsonl or .jsonl.gz), merged by time")
+    parser.add_argument("--speed", type=float, default=1, help="pace multiplier, 0 = as fast as possible")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("HANDLER_WORKERS", "64")))
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="time every stubbed Telegram call takes")
+    parser.add_argument("--state", help="directory with state files to start from (default: a generated pool)")
+    parser.add_argument("--pool", type=int, default=100_000, help="numbers in the generated pool")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "otp_replay"),
+                        help="scratch directory the bot runs in; its state files are replaced")
+    parser.add_argument("--limit", type=int, help="replay only the first N updates")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own log")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    captures = [os.path.abspath(path) for path in args.captures]
+    state_dir = os.path.abspath(args.state) if args.state else None
+    records = load_updates(captures, args.limit)
+    if not records:
+        print("⚠️ No updates in the capture")
+        sys.exit(1)
+
+    prepare_state(args.workdir, state_dir, args.pool)
+    os.chdir(args.workdir)
+    os.environ["ADMIN_USER_ID"] = str(ADMIN_PSEUDONYM)
+    os.environ.setdefault("NUMBER_BOT_TOKEN", "replay")
+    if args.verbose:
+        setup_logging("replay")
+    else:
+        logging.disable(logging.CRITICAL)
+    import number_bot as nb
+    nb.init_files()
+
+    costs = Costs()
+    file_sizes = {update["message"]["document"]["file_id"]: update["message"]["document"].get("file_size")
+                  for _, update in records if "document" in update.get("message", {})}
+    nb.api_transport = StubTransport(costs, args.api_latency_ms / 1000, file_sizes)
+
+    def tag_route(ctx, route):
+        current.route = route.name if route is not None else None
+        return route
+
+    nb.router.use(tag_route)
+    for module_name in IO_MODULES:
+        sys.modules[module_name].open = counting_open(costs)
+
+    print(f"🔁 Replaying {len(records)} updates at {'max speed' if not args.speed else f'{args.speed:g}x'} "
+          f"with {args.workers} workers in {args.workdir}", flush=True)
+    elapsed, latencies, max_lag = asyncio.run(replay(nb, records, args.speed, args.workers))
+
+    report = build_report(args, records, elapsed, latencies, max_lag, nb.router.stats.snapshot(), costs)
+    print_report(report)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
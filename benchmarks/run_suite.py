@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the parsing, routing and allocation hot paths
+
+Times get_sms_rows, format_message/extract_otp/detect_service (main.py),
+OTP queue routing, get_recent_otps_for_number, assign_number_to_user
+(journaled lease included) and the periodic pool checkpoint (number_bot.py)
+and upload parsing (number_import.py) on the synthetic
+fixtures in fixtures.py. Results are written as JSON and can be compared
+against a stored baseline; any case slower than the baseline by more than
+--threshold makes the run exit with status 1.
+
+Usage:
+    python benchmarks/run_suite.py [--scale quick|full] [--only PATTERN]
+                                   [--output results.json]
+                                   [--baseline baseline.json] [--threshold 1.25]
+
+Every case runs in a fresh worker process, so one case's heap (a 10M-line
+queue, a 1M-number pool) can't slow down the next. Cases whose module
+can't be imported here (main.py needs selenium, uploads need pandas) are
+reported as skipped, not failed.
+"""
+import argparse
+import contextlib
+import fnmatch
+import gc
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+
+# sizes per scale; "full" is what the production panel/queue/pool can reach
+SCALES = {
+    "quick": {
+        "sms_rows": [100, 1_000, 10_000],
+        "messages": [2_000],
+        "queue_lines": [10_000, 100_000],
+        "pool_numbers": [10_000, 100_000],
+        "upload_rows": [10_000, 100_000],
+    },
+    "full": {
+        "sms_rows": [100, 1_000, 10_000, 100_000],
+        "messages": [20_000],
+        "queue_lines": [10_000, 100_000, 1_000_000, 10_000_000],
+        "pool_numbers": [10_000, 100_000, 1_000_000],
+        "upload_rows": [10_000, 100_000, 1_000_000],
+    },
+}
+ASSIGN_CALLS = 20
+DEFAULT_THRESHOLD = 1.25
+
+
+class Skip(Exception):
+    pass
+
+
+def rounds_for(seconds_per_round):
+    """More rounds for fast cases, at least 3"""
+    return max(3, min(20, int(2 / max(seconds_per_round, 1e-6))))
+
+
+def measure(func, items, setup=None):
+    """Time func() over several rounds (setup() runs untimed before each).
+
+    The garbage collector is paused while timing, as timeit does, so results
+    don't depend on what earlier cases left on the heap.
+    Returns {"items", "rounds", "min", "median", "per_item_us"}.
+    """
+    samples = []
+    rounds = None
+    while rounds is None or len(samples) < rounds:
+        if setup:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                func()
+                samples.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+        if rounds is None:
+            rounds = rounds_for(samples[0])
+    best = min(samples)
+    return {
+        "items": items,
+        "rounds": len(samples),
+        "min": best,
+        "median": statistics.median(samples),
+        "per_item_us": best / items * 1e6 if items else None,
+    }
+
+
+# ======== Cases ========
+
+def import_main():
+    try:
+        import main
+    except ImportError as e:
+        raise Skip(f"main.py not importable: {e}")
+    return main
+
+
+def import_number_bot(workdir):
+    os.chdir(workdir)
+    os.environ.setdefault("ADMIN_USER_ID", "1")
+    with contextlib.redirect_stdout(io.StringIO()):
+        import number_bot
+    return number_bot
+
+
+def case_sms_rows(scale, workdir, wanted):
+    if not any(wanted(f"sms_rows[{rows}]") for rows in scale["sms_rows"]):
+        return
+    main = import_main()
+    for rows in scale["sms_rows"]:
+        if wanted(f"sms_rows[{rows}]"):
+            html = fixtures.sms_page(rows)
+            yield f"sms_rows[{rows}]", measure(lambda: main.get_sms_rows(html), rows)
+
+
+def case_message_formatting(scale, workdir, wanted):
+    if not any(wanted(f"{kind}[{count}]") for count in scale["messages"]
+               for kind in ("format_message", "extract_otp", "detect_service")):
+        return
+    main = import_main()
+    for count in scale["messages"]:
+        rows = fixtures.sms_rows(count)
+        texts = [row[4] for row in rows]
+        if wanted(f"format_message[{count}]"):
+            yield f"format_message[{count}]", measure(lambda: [main.format_message(*row) for row in rows], count)
+        if wanted(f"extract_otp[{count}]"):
+            yield f"extract_otp[{count}]", measure(lambda: [main.extract_otp(text) for text in texts], count)
+        if wanted(f"detect_service[{count}]"):
+            yield f"detect_service[{count}]", measure(lambda: [main.detect_service(text) for text in texts], count)
+
+
+def _load_pool(nb, total_numbers, users):
+    countries, assignments = fixtures.pool_data(total_numbers, users)
+    fixtures.write_json(nb.COUNTRIES_FILE, countries)
+    fixtures.write_json(nb.USER_ASSIGNMENTS_FILE, assignments)
+    # A journal left by an earlier case belongs to a different pool
+    for name in os.listdir("."):
+        if name.startswith(nb.lease_journal.path):
+            os.remove(name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nb.init_files()
+    return assignments
+
+
+def case_otp_routing(scale, workdir, wanted):
+    names = [f"{kind}[{lines}]" for lines in scale["queue_lines"]
+             for kind in ("otp_routing_backlog", "otp_routing_tail", "recent_otps")]
+    if not any(map(wanted, names)):
+        return
+    nb = import_number_bot(workdir)
+    assignments = _load_pool(nb, 100_000, 5_000)
+    assigned = [data["number"] for data in assignments.values()]
+
+    def from_position(position):
+        def setup():
+            # Stored as "<byte offset> <lines>", as save_otp_position writes it
+            offset = 0
+            with open(nb.OTP_QUEUE_FILE, "rb") as f:
+                for _ in range(position):
+                    offset += len(f.readline())
+            with open(nb.LAST_OTP_CHECK_FILE, "w") as f:
+                f.write(f"{offset} {position}")
+        return setup
+
+    for lines in scale["queue_lines"]:
+        # Catching up on the whole file (restart), the steady state (100 new lines) and /status
+        runs = [
+            (f"otp_routing_backlog[{lines}]", nb.collect_otp_deliveries, lines, from_position(0)),
+            (f"otp_routing_tail[{lines}]", nb.collect_otp_deliveries, 100, from_position(lines - 100)),
+            (f"recent_otps[{lines}]", lambda: nb.get_recent_otps_for_number(assigned[0]), lines, None),
+        ]
+        for name, func, items, setup in runs:
+            if wanted(name):
+                nb.OTP_QUEUE_FILE = fixtures.otp_queue_file(workdir, lines, assigned)
+                yield name, measure(func, items, setup)
+    nb.OTP_QUEUE_FILE = "otp_queue.json"
+
+
+def case_assign_number(scale, workdir, wanted):
+    for total in scale["pool_numbers"]:
+        if not wanted(f"assign_number[{total}]") and not wanted(f"pool_checkpoint[{total}]"):
+            continue
+        nb = import_number_bot(workdir)
+        _load_pool(nb, total, min(total // 10, 10_000))
+        user = iter(range(8_000_000_000, 9_000_000_000))
+
+        def assign_batch():
+            for _ in range(ASSIGN_CALLS):
+                nb.assign_number_to_user(next(user), "Ecuador")
+
+        if wanted(f"assign_number[{total}]"):
+            yield f"assign_number[{total}]", measure(assign_batch, ASSIGN_CALLS)
+        if wanted(f"pool_checkpoint[{total}]"):
+            # What the lease journal costs every CHECKPOINT_SECONDS instead of on every assignment
+            yield f"pool_checkpoint[{total}]", measure(nb.checkpoint_pool, 1)
+
+
+def case_upload_parse(scale, workdir, wanted):
+    if not any(wanted(f"upload_parse[{rows}]") for rows in scale["upload_rows"]):
+        return
+    try:
+        from number_import import import_numbers
+    except ImportError as e:
+        raise Skip(f"number_import not importable: {e}")
+    from number_pool import NumberPool
+    for rows in scale["upload_rows"]:
+        if not wanted(f"upload_parse[{rows}]"):
+            continue
+        content = fixtures.upload_csv(rows)
+        pool = [None]     # a fresh, empty pool for every round
+
+        def fresh_pool():
+            pool[0] = NumberPool()
+
+        yield f"upload_parse[{rows}]", measure(
+            lambda: import_numbers(pool[0], "Ecuador", content, "numbers.csv", calling_code=593),
+            rows, setup=fresh_pool)
+
+
+CASES = [case_sms_rows, case_message_formatting, case_otp_routing, case_assign_number, case_upload_parse]
+
+
+# ======== Workers ========
+
+def print_result(name, result):
+    per_item = f"{result['per_item_us']:10.2f} µs/item" if result["per_item_us"] is not None else ""
+    print(f"{name:<36} {result['min'] * 1000:10.2f} ms (median {result['median'] * 1000:.2f}, "
+          f"{result['rounds']} rounds) {per_item}", file=sys.stderr, flush=True)
+
+
+def run_worker(case_name, scale, workdir, wanted):
+    """Run one case and print its results as the last line of stdout"""
+    case = next(case for case in CASES if case.__name__ == case_name)
+    # The bots' own log records would be timed too
+    logging.disable(logging.CRITICAL)
+    results = {}
+    error = None
+    try:
+        for name, result in case(scale, workdir, wanted):
+            results[name] = result
+            print_result(name, result)
+    except Skip as e:
+        error = str(e)
+    sys.stdout.write("\n" + json.dumps({"results": results, "error": error}) + "\n")
+
+
+def run_case_in_worker(case_name, args):
+    """({name: result}, error) of one case, run in a fresh interpreter"""
+    command = [sys.executable, os.path.abspath(__file__), "--worker", case_name,
+               "--scale", args.scale, "--fixtures", args.fixtures]
+    if args.only:
+        command += ["--only", args.only]
+    proc = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    lines = proc.stdout.strip().splitlines()
+    try:
+        report = json.loads(lines[-1])
+    except (IndexError, ValueError):
+        return {}, f"worker exited with status {proc.returncode}"
+    return report["results"], report["error"]
+
+
+# ======== Reporting ========
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "-C", REPO, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, threshold, wanted):
+    """Lines comparing min times with the baseline, and the names of regressed cases"""
+    lines = []
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            lines.append(f"  {name:<36} new")
+            continue
+        ratio = result["min"] / base["min"] if base["min"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  ❌ REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = "  ✅ faster"
+        lines.append(f"  {name:<36} {base['min'] * 1000:10.2f} ms -> {result['min'] * 1000:10.2f} ms  x{ratio:.2f}{flag}")
+    for name in baseline.get("results", {}):
+        if name not in results and wanted(name):
+            lines.append(f"  {name:<36} missing from this run")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="quick")
+    parser.add_argument("--only", help="run only cases whose name matches this glob, e.g. 'otp_*'")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --output")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown ratio that counts as a regression (default %(default)s)")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "otp_bench_fixtures"),
+                        help="directory for generated fixtures and bot state files")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale]
+    # The bot cases run inside the fixture directory
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    args.fixtures = os.path.abspath(args.fixtures)
+    os.makedirs(args.fixtures, exist_ok=True)
+
+    def wanted(name):
+        return not args.only or fnmatch.fnmatch(name, args.only)
+
+    if args.worker:
+        run_worker(args.worker, scale, args.fixtures, wanted)
+        return
+
+    results = {}
+    skipped = {}
+    for case in CASES:
+        case_results, error = run_case_in_worker(case.__name__, args)
+        results.update(case_results)
+        if error:
+            skipped[case.__name__] = error
+            print(f"{case.__name__:<36} skipped: {error}", flush=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "scale": args.scale,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.time(),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.threshold, wanted)
+        base_meta = baseline.get("meta", {})
+        print(f"\n📊 Against {args.baseline} (commit {base_meta.get('commit')}, {base_meta.get('platform')}):")
+        if base_meta.get("platform") != report["meta"]["platform"]:
+            print("⚠️ The baseline was recorded on a different platform; ratios are only indicative")
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n❌ {len(regressions)} case(s) slower than x{args.threshold}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
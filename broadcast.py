@@ -0,0 +1,302 @@
+"""
+Resumable broadcast engine for the Number Bot
+
+A broadcast is a job persisted in BROADCAST_JOBS_FILE, with its recipient
+list written once to BROADCAST_RECIPIENTS_DIR. A background thread sends it
+in chunks of concurrent sendMessage calls, paced by a global token bucket
+(Telegram allows ~30 messages/s per bot; every recipient chat gets one
+message per job, which keeps each chat far below its own limit). A 429
+pauses the bucket for everyone and the message is sent again. The cursor
+and counters are saved after every chunk, so a restart resumes where it
+stopped and re-sends at most one chunk; the last KEEP_FINISHED_JOBS
+finished jobs are kept. Users who blocked the bot (403) are remembered in
+BLOCKED_USERS_FILE and skipped by later broadcasts until they write to the
+bot again.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BROADCAST_JOBS_FILE = "broadcast_jobs.json"
+BROADCAST_RECIPIENTS_DIR = "broadcast_recipients"
+BLOCKED_USERS_FILE = "blocked_users.json"
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))          # messages per second
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "16"))
+CHUNK_SIZE = 100
+PROGRESS_INTERVAL = 3.0
+KEEP_FINISHED_JOBS = 20
+RATE_LIMIT_RETRIES = 3
+
+log = logging.getLogger(__name__)
+
+
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except:
+        return {}
+
+
+def _save(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class TokenBucket:
+    """Blocking rate limiter shared by all sender threads"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop everyone after a 429 until Telegram's retry_after has passed"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class BroadcastEngine:
+    """Runs persisted broadcast jobs in the background.
+
+    ``send(chat_id, text)`` must return Telegram's response dict (or None on
+    network failure) without retrying 429s itself, the engine does that for
+    all senders at once; ``notify(chat_id, message_id, text, reply_markup)``
+    edits the admin's progress message.
+    """
+
+    def __init__(self, send, notify, jobs_file=BROADCAST_JOBS_FILE, recipients_dir=BROADCAST_RECIPIENTS_DIR,
+                 blocked_file=BLOCKED_USERS_FILE):
+        self.send = send
+        self.notify = notify
+        self.jobs_file = jobs_file
+        self.recipients_dir = recipients_dir
+        self.blocked_file = blocked_file
+        self.lock = threading.Lock()
+        self.jobs = _load(jobs_file)
+        self.blocked = set(_load(blocked_file))
+        os.makedirs(recipients_dir, exist_ok=True)
+        legacy = [job_id for job_id, job in self.jobs.items() if "recipients" in job]
+        for job_id in legacy:
+            # Saved before recipient lists got their own files
+            recipients = self.jobs[job_id].pop("recipients")
+            self.jobs[job_id]["total"] = len(recipients)
+            if self.jobs[job_id]["status"] == "running":
+                _save(self._recipients_path(job_id), recipients)
+        if legacy:
+            self._save_jobs()
+        self.bucket = TokenBucket(BROADCAST_RATE)
+        self.executor = ThreadPoolExecutor(max_workers=BROADCAST_WORKERS, thread_name_prefix="broadcast")
+        self.threads = {}
+
+    # ======== Jobs ========
+
+    def enqueue(self, text, recipients, admin_chat_id, status_message_id=None):
+        """Create a job for ``recipients`` (users that blocked the bot are left out) and start it"""
+        recipients = list(recipients)
+        with self.lock:
+            seen = set()
+            targets = []
+            for chat_id in recipients:
+                key = str(chat_id)
+                if key not in seen and key not in self.blocked:
+                    seen.add(key)
+                    targets.append(key)
+            job_id = str(int(time.time() * 1000))
+            _save(self._recipients_path(job_id), targets)
+            self.jobs[job_id] = {
+                "id": job_id,
+                "text": text,
+                "total": len(targets),
+                "cursor": 0,
+                "sent": 0,
+                "failed": 0,
+                "blocked": 0,
+                "skipped": len(recipients) - len(targets),
+                "admin_chat_id": admin_chat_id,
+                "status_message_id": status_message_id,
+                "status": "running",
+                "created_at": time.time(),
+                "elapsed": 0.0,
+            }
+            self._save_jobs()
+        self._start(job_id)
+        return job_id
+
+    def resume(self):
+        """Restart jobs that were still running when the process stopped"""
+        with self.lock:
+            running = [job_id for job_id, job in self.jobs.items() if job["status"] == "running"]
+        for job_id in running:
+            log.info("📢 Resuming broadcast", extra={"job": job_id})
+            self._start(job_id)
+        return running
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job["status"] != "running":
+                return False
+            job["status"] = "cancelled"
+            self._save_jobs()
+            return True
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def unblock(self, chat_id):
+        """A user who blocked the bot wrote to it again: broadcasts reach them again"""
+        key = str(chat_id)
+        if key not in self.blocked:
+            return False
+        with self.lock:
+            self.blocked.discard(key)
+            _save(self.blocked_file, sorted(self.blocked))
+        return True
+
+    def _start(self, job_id):
+        thread = threading.Thread(target=self._run, args=(job_id,), daemon=True, name=f"broadcast-{job_id}")
+        self.threads[job_id] = thread
+        thread.start()
+
+    def _recipients_path(self, job_id):
+        return os.path.join(self.recipients_dir, f"{job_id}.json")
+
+    def _save_jobs(self):
+        _save(self.jobs_file, self.jobs)
+
+    def _prune(self):
+        # Called with the lock held once a job is over
+        finished = sorted((job["created_at"], job_id) for job_id, job in self.jobs.items() if job["status"] != "running")
+        for _, job_id in finished[:-KEEP_FINISHED_JOBS]:
+            del self.jobs[job_id]
+
+    # ======== Sending ========
+
+    def _send_one(self, chat_id, text):
+        for _ in range(RATE_LIMIT_RETRIES + 1):
+            self.bucket.acquire()
+            try:
+                result = self.send(chat_id, text)
+            except Exception as e:
+                log.warning("⚠️ Broadcast send failed", extra={"chat": chat_id, "error": str(e)})
+                return "failed"
+            if result and result.get("ok"):
+                return "sent"
+            error_code = (result or {}).get("error_code")
+            if error_code == 403:
+                return "blocked"
+            if error_code != 429:
+                return "failed"
+            self.bucket.pause((result.get("parameters") or {}).get("retry_after", 1))
+        return "failed"
+
+    def _run(self, job_id):
+        with self.lock:
+            job = self.jobs[job_id]
+            text = job["text"]
+        recipients = _load(self._recipients_path(job_id)) or []
+        if len(recipients) != job["total"]:
+            log.warning("⚠️ Broadcast recipient list missing", extra={"job": job_id})
+        started = time.monotonic() - job["elapsed"]
+        sent_at_start = job["sent"] + job["failed"] + job["blocked"]
+        resumed_at = time.monotonic()
+        last_progress = 0.0
+
+        while job["status"] == "running" and job["cursor"] < len(recipients):
+            chunk = recipients[job["cursor"]:job["cursor"] + CHUNK_SIZE]
+            outcomes = list(self.executor.map(lambda chat_id: self._send_one(chat_id, text), chunk))
+
+            with self.lock:
+                newly_blocked = [chat_id for chat_id, outcome in zip(chunk, outcomes) if outcome == "blocked"]
+                for outcome in ("sent", "failed", "blocked"):
+                    job[outcome] += outcomes.count(outcome)
+                job["cursor"] += len(chunk)
+                job["elapsed"] = time.monotonic() - started
+                if newly_blocked:
+                    self.blocked.update(newly_blocked)
+                    _save(self.blocked_file, sorted(self.blocked))
+                self._save_jobs()
+
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                done = job["sent"] + job["failed"] + job["blocked"]
+                rate = (done - sent_at_start) / max(now - resumed_at, 0.001)
+                self._report(job, rate)
+
+        with self.lock:
+            if job["status"] == "running":
+                job["status"] = "done"
+            job["elapsed"] = time.monotonic() - started
+            self._prune()
+            self._save_jobs()
+        try:
+            os.remove(self._recipients_path(job_id))
+        except OSError:
+            pass
+        done = job["sent"] + job["failed"] + job["blocked"]
+        self._report(job, (done - sent_at_start) / max(time.monotonic() - resumed_at, 0.001))
+        log.info("📢 Broadcast finished", extra={"job": job_id, "status": job["status"], "sent": job["sent"],
+                                                "failed": job["failed"], "blocked": job["blocked"]})
+        self.threads.pop(job_id, None)
+
+    def _report(self, job, rate):
+        if not job.get("status_message_id"):
+            return
+        try:
+            self.notify(job["admin_chat_id"], job["status_message_id"], format_progress(job, rate), progress_markup(job))
+        except Exception as e:
+            log.warning("⚠️ Failed to update broadcast progress", extra={"job": job.get("id"), "error": str(e)})
+
+
+def progress_markup(job):
+    if job["status"] != "running":
+        return None
+    return {"inline_keyboard": [[{"text": "⏹ Cancel", "callback_data": f"cancel_broadcast:{job['id']}"}]]}
+
+
+def format_progress(job, rate):
+    total = job["total"]
+    done = job["sent"] + job["failed"] + job["blocked"]
+    status = {"running": "⏳ Sending", "done": "✅ Finished", "cancelled": "⏹ Cancelled"}.get(job["status"], job["status"])
+    msg = f"📢 <b>Broadcast</b> — {status}\n\n"
+    msg += f"📨 Progress: {done}/{total}\n"
+    msg += f"✅ Sent: {job['sent']}\n"
+    if job["failed"]:
+        msg += f"⚠️ Failed: {job['failed']}\n"
+    if job["blocked"]:
+        msg += f"🚫 Blocked the bot: {job['blocked']}\n"
+    if job.get("skipped"):
+        msg += f"⏭ Skipped (blocked earlier): {job['skipped']}\n"
+    msg += f"⚡ Throughput: {rate:.1f} msg/s"
+    if job["status"] == "running" and rate > 0:
+        msg += f"\n⏱ ETA: {int((total - done) / rate)}s"
+    return msg
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Compact array-backed number pools
+
+Each country pool is stored as 64-bit ints in an ``array('Q')`` plus a bitmap
+with one bit per slot (1 = free, 0 = leased). A leading "+" and leading
+zeros are kept in the top bits of a slot, so every number up to 18 digits
+comes back exactly as uploaded. On disk a pool is a single ``.pool`` file
+that can be memory-mapped and checkpointed incrementally:
+
+    header   256 bytes   magic, version, count, capacity, JSON metadata
+    numbers  capacity*8  little-endian uint64 numbers
+    bitmap   capacity/8  free bits
+
+This is a storage format and conversion tool only: the Number Bot keeps
+its pool in number_pool.NumberPool and countries.json, not in .pool files.
+
+Usage:
+    python compact_pool.py export countries.json pools/
+    python compact_pool.py import pools/ countries.json
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b"NPOOL\x00\x00\x01"
+VERSION = 2
+# Version 1 stored plain ints; numbers below 2**60 read the same in version 2
+READABLE_VERSIONS = (1, 2)
+HEADER_SIZE = 256
+HEADER_FORMAT = "<8sIIQQH"   # magic, version, reserved, count, capacity, meta length
+META_MAX = HEADER_SIZE - struct.calcsize(HEADER_FORMAT)
+MIN_CAPACITY = 1024
+POOL_SUFFIX = ".pool"
+# Slot layout: bit 63 = leading "+", bits 60-62 = leading zeros, bits 0-59 = the digits
+PLUS_BIT = 1 << 63
+ZEROS_SHIFT = 60
+MAX_LEADING_ZEROS = 7
+MAX_DIGITS = 18
+VALUE_MASK = (1 << ZEROS_SHIFT) - 1
+
+
+def encode_number(number):
+    """'593988100231' -> 593988100231, '+0044...' keeps its "+" and zeros in the top bits"""
+    text = str(number)
+    plus = text.startswith("+")
+    digits = text[1:] if plus else text
+    zeros = len(digits) - len(digits.lstrip("0") or "0")
+    if not digits.isdigit() or not digits.isascii() or len(digits) > MAX_DIGITS or zeros > MAX_LEADING_ZEROS:
+        raise ValueError(f"Not a storable phone number: {number!r}")
+    return int(digits) | zeros << ZEROS_SHIFT | (PLUS_BIT if plus else 0)
+
+
+def decode_number(value):
+    prefix = "+" if value & PLUS_BIT else ""
+    return prefix + "0" * ((value >> ZEROS_SHIFT) & MAX_LEADING_ZEROS) + str(value & VALUE_MASK)
+
+
+def _bitmap_size(capacity):
+    return (capacity + 7) // 8
+
+
+class CompactPool:
+    """Free/leased numbers of one country in ~8.1 bytes per number"""
+
+    def __init__(self, meta=None, capacity=MIN_CAPACITY):
+        self.meta = dict(meta or {})
+        self._capacity = max(MIN_CAPACITY, capacity)
+        self._count = 0
+        self._free = 0
+        self._numbers = array("Q", bytes(8 * self._capacity))
+        self._bitmap = bytearray(_bitmap_size(self._capacity))
+        self._cursor = 0          # no free slot below this index
+        self._mm = None
+        self._file = None
+        self._path = None
+        self._saved_count = 0     # slots already written to _path
+        self._saved_capacity = 0
+        self._dirty_bytes = set()  # saved bitmap bytes changed since last checkpoint
+
+    # ======== Slots ========
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def free_count(self):
+        return self._free
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def is_free(self, slot):
+        return bool(self._bitmap[slot >> 3] & (1 << (slot & 7)))
+
+    def _set_bit(self, slot, free):
+        byte = slot >> 3
+        if free:
+            self._bitmap[byte] |= 1 << (slot & 7)
+        else:
+            self._bitmap[byte] &= ~(1 << (slot & 7)) & 0xFF
+        # Bytes past the saved slots are rewritten wholesale by checkpoint()
+        if byte < self._saved_count >> 3:
+            self._dirty_bytes.add(byte)
+
+    def number_at(self, slot):
+        return decode_number(self._numbers[slot])
+
+    def append(self, number, free=True):
+        """Add a number in a new slot and return the slot"""
+        value = encode_number(number)
+        if self._count == self._capacity:
+            self._grow(self._capacity * 2)
+        slot = self._count
+        self._numbers[slot] = value
+        self._count += 1
+        if free:
+            self._set_bit(slot, True)
+            self._free += 1
+            self._cursor = min(self._cursor, slot)
+        return slot
+
+    def extend(self, numbers, free=True):
+        for number in numbers:
+            self.append(number, free)
+
+    def lease_next(self):
+        """Mark the lowest free slot as leased, returns (slot, number) or None"""
+        if not self._free:
+            return None
+        bitmap = self._bitmap
+        byte = self._cursor >> 3
+        last = _bitmap_size(self._count)
+        while byte < last and not bitmap[byte]:
+            byte += 1
+        if byte >= last:
+            return None
+        bits = bitmap[byte]
+        slot = byte * 8 + ((bits & -bits).bit_length() - 1)
+        self._set_bit(slot, False)
+        self._free -= 1
+        self._cursor = slot + 1
+        return slot, self.number_at(slot)
+
+    def lease(self, slot):
+        if slot >= self._count or not self.is_free(slot):
+            return False
+        self._set_bit(slot, False)
+        self._free -= 1
+        return True
+
+    def release(self, slot):
+        if slot >= self._count or self.is_free(slot):
+            return False
+        self._set_bit(slot, True)
+        self._free += 1
+        self._cursor = min(self._cursor, slot)
+        return True
+
+    def slot_of(self, number):
+        """Slot holding ``number`` or -1 (linear, but a C-level memory scan)"""
+        needle = struct.pack("<Q", encode_number(number))
+        data = memoryview(self._numbers).cast("B")[:self._count * 8]
+        haystack = bytes(data)
+        pos = haystack.find(needle)
+        while pos != -1 and pos % 8:
+            pos = haystack.find(needle, pos + 1)
+        return -1 if pos == -1 else pos // 8
+
+    def free_numbers(self):
+        """Free numbers in slot order, as strings"""
+        numbers = self._numbers
+        bitmap = self._bitmap
+        result = []
+        for byte in range(_bitmap_size(self._count)):
+            bits = bitmap[byte]
+            while bits:
+                low = bits & -bits
+                slot = byte * 8 + low.bit_length() - 1
+                if slot < self._count:
+                    result.append(decode_number(numbers[slot]))
+                bits ^= low
+        return result
+
+    def _grow(self, capacity):
+        if self._mm is not None:
+            self._remap(capacity)
+            return
+        self._numbers.extend(array("Q", bytes(8 * (capacity - self._capacity))))
+        self._bitmap.extend(bytes(_bitmap_size(capacity) - len(self._bitmap)))
+        self._capacity = capacity
+
+    # ======== Disk format ========
+
+    def _header(self):
+        meta = json.dumps(self.meta, ensure_ascii=False).encode("utf-8")
+        if len(meta) > META_MAX:
+            raise ValueError("Pool metadata too large for header")
+        head = struct.pack(HEADER_FORMAT, MAGIC, VERSION, 0, self._count, self._capacity, len(meta))
+        return (head + meta).ljust(HEADER_SIZE, b"\x00")
+
+    def _bitmap_offset(self, capacity=None):
+        return HEADER_SIZE + 8 * (capacity or self._capacity)
+
+    def save(self, path):
+        """Write the whole pool to ``path`` atomically"""
+        self.close()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._header())
+            f.write(memoryview(self._numbers).cast("B"))
+            f.write(self._bitmap)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._path = path
+        self._saved_count = self._count
+        self._saved_capacity = self._capacity
+        self._dirty_bytes.clear()
+
+    def checkpoint(self, path=None):
+        """Persist only what changed since the last save/checkpoint.
+
+        New slots and touched bitmap bytes are written in place; a full
+        rewrite only happens the first time or after the capacity grew.
+        Returns the number of bytes written.
+        """
+        path = path or self._path
+        if self._mm is not None:
+            self._mm[:HEADER_SIZE] = self._header()
+            self._mm.flush()
+            self._dirty_bytes.clear()
+            return 0
+        if path != self._path or self._saved_capacity != self._capacity or not os.path.exists(path):
+            self.save(path)
+            return HEADER_SIZE + 8 * self._capacity + len(self._bitmap)
+
+        written = 0
+        with open(path, "r+b") as f:
+            if self._count > self._saved_count:
+                raw = memoryview(self._numbers).cast("B")
+                f.seek(HEADER_SIZE + 8 * self._saved_count)
+                chunk = raw[8 * self._saved_count:8 * self._count]
+                f.write(chunk)
+                written += len(chunk)
+            bitmap_offset = self._bitmap_offset()
+            runs = _byte_runs(sorted(self._dirty_bytes))
+            runs.append([self._saved_count >> 3, _bitmap_size(self._count)])
+            for start, end in runs:
+                f.seek(bitmap_offset + start)
+                f.write(self._bitmap[start:end])
+                written += end - start
+            f.seek(0)
+            f.write(self._header())
+            written += HEADER_SIZE
+            f.flush()
+            os.fsync(f.fileno())
+        self._saved_count = self._count
+        self._dirty_bytes.clear()
+        return written
+
+    @classmethod
+    def load(cls, path, use_mmap=False):
+        """Load a .pool file into memory, or map it with ``use_mmap``"""
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+            magic, version, _, count, capacity, meta_len = struct.unpack_from(HEADER_FORMAT, header)
+            if magic != MAGIC or version not in READABLE_VERSIONS:
+                raise ValueError(f"{path} is not a number pool file")
+            meta_start = struct.calcsize(HEADER_FORMAT)
+            meta = json.loads(header[meta_start:meta_start + meta_len].decode("utf-8") or "{}")
+
+            pool = cls.__new__(cls)
+            pool.meta = meta
+            pool._count = count
+            pool._capacity = capacity
+            pool._path = path
+            pool._saved_count = count
+            pool._saved_capacity = capacity
+            pool._dirty_bytes = set()
+            pool._cursor = 0
+            pool._mm = None
+            pool._file = None
+            if use_mmap:
+                pool._map(open(path, "r+b"))
+            else:
+                pool._numbers = array("Q")
+                pool._numbers.frombytes(f.read(8 * capacity))
+                pool._bitmap = bytearray(f.read(_bitmap_size(capacity)))
+        pool._free = int.from_bytes(bytes(pool._bitmap[:_bitmap_size(count)]), "little").bit_count()
+        return pool
+
+    def _map(self, file):
+        self._file = file
+        self._mm = mmap.mmap(file.fileno(), 0)
+        view = memoryview(self._mm)
+        self._numbers = view[HEADER_SIZE:self._bitmap_offset()].cast("Q")
+        self._bitmap = view[self._bitmap_offset():self._bitmap_offset() + _bitmap_size(self._capacity)]
+
+    def _remap(self, capacity):
+        # Crash safe in this order: the new bitmap goes past the end of the
+        # old layout, the header switches to it, and only then is the old
+        # bitmap (now inside the number array) cleared
+        old_bitmap_offset = self._bitmap_offset()
+        bitmap = bytes(self._bitmap)
+        file = self._file
+        self._mm.flush()
+        self._release_views()
+        file.truncate(HEADER_SIZE + 8 * capacity + _bitmap_size(capacity))
+        file.seek(self._bitmap_offset(capacity))
+        file.write(bitmap)
+        file.flush()
+        os.fsync(file.fileno())
+        self._capacity = capacity
+        file.seek(0)
+        file.write(self._header())
+        file.flush()
+        os.fsync(file.fileno())
+        file.seek(old_bitmap_offset)
+        file.write(bytes(len(bitmap)))
+        file.flush()
+        self._saved_capacity = capacity
+        self._map(file)
+
+    def _release_views(self):
+        self._numbers.release()
+        self._bitmap.release()
+        self._mm.close()
+        self._mm = None
+
+    def close(self):
+        """Detach from a memory-mapped file, keeping the data in memory"""
+        if self._mm is None:
+            return
+        self._mm[:HEADER_SIZE] = self._header()
+        numbers = array("Q")
+        numbers.frombytes(memoryview(self._numbers).cast("B"))
+        bitmap = bytearray(self._bitmap)
+        self._release_views()
+        self._file.close()
+        self._file = None
+        self._numbers = numbers
+        self._bitmap = bitmap
+
+
+def _byte_runs(indexes):
+    """[3, 4, 5, 9] -> [(3, 6), (9, 10)]"""
+    runs = []
+    for i in indexes:
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+
+# ======== JSON converters ========
+
+def pool_from_json(country, data, leased=(), rejected=None):
+    """Build a CompactPool from one countries.json entry.
+
+    ``leased`` numbers (currently assigned) are stored too, but marked leased.
+    Numbers that can't be stored are appended to ``rejected`` when it is
+    given, otherwise they raise ValueError.
+    """
+    numbers = data.get("numbers", [])
+    pool = CompactPool({"country": country, "flag": data.get("flag", "🌍")},
+                       capacity=len(numbers) + len(leased))
+    for group, free in ((numbers, True), (leased, False)):
+        for number in group:
+            try:
+                pool.append(number, free)
+            except ValueError:
+                if rejected is None:
+                    raise
+                rejected.append(number)
+    return pool
+
+
+def pool_to_json(pool):
+    """CompactPool -> countries.json entry (free numbers only)"""
+    return {"flag": pool.meta.get("flag", "🌍"), "numbers": pool.free_numbers()}
+
+
+def pool_path(directory, country):
+    return os.path.join(directory, country + POOL_SUFFIX)
+
+
+def export_countries(countries, directory, assignments=None):
+    """Write every country of countries.json as ``<directory>/<country>.pool``.
+
+    Returns {country: [numbers that could not be stored]} for the countries
+    that had any; those numbers are left out of the .pool files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    leased = {}
+    for data in (assignments or {}).values():
+        if data.get("number"):
+            leased.setdefault(data.get("country"), []).append(data["number"])
+    rejects = {}
+    for country, data in countries.items():
+        rejected = []
+        pool_from_json(country, data, leased.get(country, ()), rejected).save(pool_path(directory, country))
+        if rejected:
+            rejects[country] = rejected
+    return rejects
+
+
+def import_countries(directory):
+    """Read every ``.pool`` file of ``directory`` back into countries.json form"""
+    countries = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(POOL_SUFFIX):
+            pool = CompactPool.load(os.path.join(directory, name))
+            country = pool.meta.get("country", name[:-len(POOL_SUFFIX)])
+            countries[country] = pool_to_json(pool)
+    return countries
+
+
+def main(argv):
+    if len(argv) != 4 or argv[1] not in ("export", "import"):
+        print(__doc__)
+        return 1
+    if argv[1] == "export":
+        with open(argv[2], "r", encoding="utf-8") as f:
+            countries = json.load(f)
+        rejects = export_countries(countries, argv[3])
+        print(f"✅ Exported {len(countries)} countries to {argv[3]}")
+        for country, numbers in rejects.items():
+            print(f"⚠️ {country}: {len(numbers)} numbers could not be stored and were left out, e.g. {numbers[:3]}")
+    else:
+        countries = import_countries(argv[2])
+        with open(argv[3], "w", encoding="utf-8") as f:
+            json.dump(countries, f, ensure_ascii=False, indent=2)
+        print(f"✅ Imported {len(countries)} countries into {argv[3]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,92 @@
+"""
+Per-user flood control for the Number Bot
+
+Every user gets a token bucket (FLOOD_RATE updates per second, bursts of
+FLOOD_BURST). Callback taps that repeat the same button on the same message
+within COALESCE_SECONDS are collapsed into the first one before they cost a
+token, so hammering "🔄 Change Number" leases one number, not ten.
+
+Times are when the update reached the bot, not when a worker got to it, so
+a burst that sat in a queue behind a slow handler is still seen as a burst.
+"""
+import os
+import threading
+import time
+from collections import Counter
+
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "1"))          # updates per second per user
+FLOOD_BURST = float(os.getenv("FLOOD_BURST", "5"))
+COALESCE_SECONDS = float(os.getenv("COALESCE_SECONDS", "2"))
+PRUNE_INTERVAL = 60
+THROTTLED_USERS_KEPT = 100    # per-user throttle counts kept past a prune, the highest first
+
+
+class FloodControl:
+    def __init__(self, rate=FLOOD_RATE, burst=FLOOD_BURST, coalesce_seconds=COALESCE_SECONDS):
+        self.rate = rate
+        self.burst = burst
+        self.coalesce_seconds = coalesce_seconds
+        self._lock = threading.Lock()
+        self._buckets = {}         # user_id -> [tokens, last update]
+        self._recent_taps = {}     # (chat_id, message_id, data) -> time of the tap that went through
+        self._pruned = time.monotonic()
+        self.throttled = Counter()        # reason -> count
+        self.throttled_users = Counter()  # user_id -> count, trimmed to the top THROTTLED_USERS_KEPT
+
+    def check(self, user_id, tap=None, now=None):
+        """None if the update may go through, else "duplicate" or "rate".
+
+        ``tap`` is (chat_id, message_id, data) for callback queries; ``now`` is
+        the update's arrival time (time.monotonic()).
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self._pruned >= PRUNE_INTERVAL:
+                self._prune(now)
+
+            if tap is not None:
+                last = self._recent_taps.get(tap)
+                if last is not None and now - last < self.coalesce_seconds:
+                    return self._throttle("duplicate", user_id)
+
+            tokens, updated = self._buckets.get(user_id, (self.burst, now))
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[user_id] = [tokens, max(now, updated)]
+                return self._throttle("rate", user_id)
+            self._buckets[user_id] = [tokens - 1, max(now, updated)]
+            if tap is not None:
+                self._recent_taps[tap] = now
+            return None
+
+    def _throttle(self, reason, user_id):
+        self.throttled[reason] += 1
+        self.throttled_users[user_id] += 1
+        return reason
+
+    def _prune(self, now):
+        # Full buckets and expired taps carry no state worth keeping
+        refill = self.burst / self.rate if self.rate else float("inf")
+        self._buckets = {u: b for u, b in self._buckets.items() if now - b[1] < refill}
+        self._recent_taps = {k: t for k, t in self._recent_taps.items() if now - t < self.coalesce_seconds}
+        # A flood from many ids must not grow this forever
+        if len(self.throttled_users) > THROTTLED_USERS_KEPT:
+            self.throttled_users = Counter(dict(self.throttled_users.most_common(THROTTLED_USERS_KEPT)))
+        self._pruned = now
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "throttled": dict(self.throttled),
+                "top_users": self.throttled_users.most_common(5),
+                "tracked_users": len(self._buckets),
+            }
+
+
+def format_flood_stats(snapshot):
+    throttled = snapshot["throttled"]
+    msg = f"🚦 <b>Flood control</b>: {throttled.get('rate', 0)} rate-limited, "
+    msg += f"{throttled.get('duplicate', 0)} duplicate taps collapsed\n"
+    for user_id, count in snapshot["top_users"]:
+        msg += f"   <code>{user_id}</code>: {count}\n"
+    return msg
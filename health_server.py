@@ -1,8 +1,21 @@
-from flask import Flask
+from flask import Flask, request, send_from_directory
+import hmac
+import json
 import os
+import time
+from metrics import family, merge, read_snapshots, render
+from status_board import board, readiness
+from update_spool import append_updates
+from live_profiler import MODE_COVERAGE, PROFILE_DIR, list_profiles, request_profile
 
 app = Flask(__name__)
 
+# Must match the secret_token number_bot.py registers with setWebhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Sent as X-Admin-Token to use the profiling endpoints; they are off while unset
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+PROFILED_PROCESSES = ("sms_bot", "number_bot")
+
 @app.route('/')
 def home():
     return """
@@ -18,12 +31,95 @@ def home():
 
 @app.route('/health')
 def health():
-    return {"status": "ok", "bots": ["sms_forwarder", "number_bot"]}, 200
+    """Readiness from the bots' heartbeats on the status board: 200 if ready, else 503"""
+    ready, report = readiness(board.read())
+    return report, 200 if ready else 503
+
+@app.route('/metrics')
+def metrics():
+    """Both bots' metrics, merged from their snapshots, plus OTP queue state from the status board"""
+    now = time.time()
+    snapshots = read_snapshots()
+    values = board.read()
+    families = merge(snapshots)
+    families.append(family("otp_queue_lag", "gauge", "OTP queue entries written by the SMS bot and not yet read by the Number Bot",
+                           [["otp_queue_lag", {}, max(values["sms_otp_enqueued"] - values["number_otp_offset"], 0)]]))
+    families.append(family("bot_last_poll_age_seconds", "gauge", "Seconds since each bot last polled successfully",
+                           [["bot_last_poll_age_seconds", {"bot": bot}, now - values[field]]
+                            for bot, field in (("sms_forwarder", "sms_last_poll"), ("number_bot", "number_last_poll"))
+                            if values[field]]))
+    families.append(family("metrics_snapshot_age_seconds", "gauge", "Seconds since each process last wrote its metrics",
+                           [["metrics_snapshot_age_seconds", {"process": s["process"]}, now - s["time"]] for s in snapshots]))
+    return render(families), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route('/supervisor')
+def supervisor():
+    """Per-service uptime, restarts and hangs as last written by run_all.py"""
+    try:
+        with open(os.path.join(os.getenv("SUPERVISOR_DIR", ".supervisor"), "status.json"), encoding="utf-8") as f:
+            return json.load(f), 200
+    except (OSError, ValueError):
+        return {"error": "supervisor status not available"}, 404
+
+def admin_allowed():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_API_TOKEN) and hmac.compare_digest(token, ADMIN_API_TOKEN)
+
+def _number_arg(name, type):
+    value = request.args.get(name)
+    return type(value) if value not in (None, "") else None
+
+@app.route('/profile/<process>', methods=['POST'])
+def profile(process):
+    """Ask a bot for a profile: ?mode=cprofile|sample|tracemalloc&seconds=30 (cprofile also takes cycles=N).
+
+    cprofile sees the poll loop thread and the update handlers only; sample
+    covers every thread. The response says what the chosen mode covers.
+    """
+    if not admin_allowed():
+        return {"ok": False, "error": "forbidden"}, 403
+    if process not in PROFILED_PROCESSES:
+        return {"ok": False, "error": f"process must be one of {', '.join(PROFILED_PROCESSES)}"}, 404
+    try:
+        requested = request_profile(process, request.args.get("mode", "sample"), seconds=_number_arg("seconds", float),
+                                    cycles=_number_arg("cycles", int), interval=_number_arg("interval", float))
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}, 400
+    return {"ok": True, "process": process, "request": requested, "covers": MODE_COVERAGE[requested["mode"]]}, 202
+
+@app.route('/profiles')
+def profiles():
+    """Profile results written so far, newest first"""
+    if not admin_allowed():
+        return {"ok": False, "error": "forbidden"}, 403
+    return {"ok": True, "profiles": list_profiles()}, 200
+
+@app.route('/profiles/<name>')
+def profile_file(name):
+    if not admin_allowed():
+        return {"ok": False, "error": "forbidden"}, 403
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
 
 @app.route('/ping')
 def ping():
     return "pong", 200
 
+@app.route('/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Spool Telegram updates for number_bot.py and acknowledge immediately"""
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return {"ok": False, "error": "forbidden"}, 403
+    
+    payload = request.get_json(silent=True)
+    # Telegram posts one update per request; a list is accepted for local replays
+    updates = payload if isinstance(payload, list) else [payload]
+    if not all(isinstance(u, dict) and "update_id" in u for u in updates):
+        return {"ok": False, "error": "bad update"}, 400
+    
+    append_updates(updates)
+    return {"ok": True}, 200
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
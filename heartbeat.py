@@ -0,0 +1,32 @@
+"""
+Liveness heartbeats for processes started by run_all.py
+
+run_all.py passes each child the path of its heartbeat file in HEARTBEAT_FILE.
+beat() touches that file (at most once per BEAT_INTERVAL), and the supervisor
+restarts a child whose file stops moving for longer than its hang timeout.
+Outside the supervisor HEARTBEAT_FILE is unset and beat() does nothing.
+"""
+import os
+import time
+
+HEARTBEAT_FILE = os.getenv("HEARTBEAT_FILE", "")
+BEAT_INTERVAL = 1.0
+
+_last_beat = 0.0
+
+
+def beat():
+    """Tell the supervisor this process is still making progress"""
+    global _last_beat
+    if not HEARTBEAT_FILE:
+        return
+    now = time.monotonic()
+    if now - _last_beat < BEAT_INTERVAL:
+        return
+    _last_beat = now
+    try:
+        os.utime(HEARTBEAT_FILE)
+    except FileNotFoundError:
+        open(HEARTBEAT_FILE, "a").close()
+    except OSError:
+        pass
@@ -0,0 +1,164 @@
+"""
+Append-only journal of lease changes between number pool checkpoints
+
+The number pool and the assignments live in memory in number_bot;
+countries.json and user_assignments.json are checkpoints of them. Writing
+those files on every assignment cost time in proportion to the pool, so a
+lease change is appended here as one JSON line instead:
+
+- {"op": "lease", "user", "number", "country", "ts"}: a number was leased
+- {"op": "release", "user", "number", "country", "to_pool"[, "until"]}: a
+  lease ended; the number went back to the free pool or left it, discarded
+  or, with "until", held in quarantine until then
+- {"op": "free", "number", "country"}: a number joined the free pool (a
+  quarantined one included, which ends its quarantine)
+
+number_bot writes a checkpoint (the quarantine file included) every
+CHECKPOINT_SECONDS or CHECKPOINT_OPS entries, and whenever the admin changes
+countries. The journal is moved
+aside as a numbered segment when the checkpoint's snapshot is taken and the
+segment is deleted once the checkpoint is on disk; at startup the segments
+left over and the current journal are replayed on top of the checkpoint with
+apply().
+"""
+import json
+import os
+import threading
+import time
+
+LEASE_JOURNAL_FILE = "lease_journal.jsonl"
+CHECKPOINT_SECONDS = float(os.getenv("CHECKPOINT_SECONDS", "30"))
+CHECKPOINT_OPS = int(os.getenv("CHECKPOINT_OPS", "1000"))
+
+
+class LeaseJournal:
+    def __init__(self, path=LEASE_JOURNAL_FILE, checkpoint_seconds=CHECKPOINT_SECONDS, checkpoint_ops=CHECKPOINT_OPS):
+        self.path = path
+        self.checkpoint_seconds = checkpoint_seconds
+        self.checkpoint_ops = checkpoint_ops
+        self.pending = 0            # entries since the last snapshot
+        self._first_at = None       # monotonic time of the first of them
+        self._lock = threading.Lock()
+        segments = self._segments()
+        self._seq = segments[-1][0] if segments else 0
+
+    # ======== Writing ========
+
+    def lease(self, user_key, number, country, timestamp):
+        self._append({"op": "lease", "user": str(user_key), "number": number, "country": country, "ts": timestamp})
+
+    def release(self, user_key, number, country, to_pool, until=None):
+        entry = {"op": "release", "user": str(user_key), "number": number, "country": country,
+                 "to_pool": bool(to_pool)}
+        if until is not None:
+            entry["until"] = until
+        self._append(entry)
+
+    def free(self, number, country):
+        self._append({"op": "free", "number": number, "country": country})
+
+    def _append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            if not self.pending:
+                self._first_at = time.monotonic()
+            self.pending += 1
+
+    # ======== Checkpoints ========
+
+    def due(self, now=None):
+        if not self.pending:
+            return False
+        now = time.monotonic() if now is None else now
+        return self.pending >= self.checkpoint_ops or now - self._first_at >= self.checkpoint_seconds
+
+    def rotate(self):
+        """Move the journal aside when a snapshot is taken, returns the segment's sequence number.
+
+        Call with the state lock held, so no entry lands between the snapshot
+        and the move.
+        """
+        with self._lock:
+            self._seq += 1
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.{self._seq}")
+            self.pending = 0
+            self._first_at = None
+            return self._seq
+
+    def committed(self, seq):
+        """The checkpoint of snapshot ``seq`` is on disk: drop the segments it covers"""
+        for number, path in self._segments():
+            if number <= seq:
+                os.remove(path)
+
+    def _segments(self):
+        directory = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + "."
+        segments = []
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                segments.append((int(name[len(prefix):]), os.path.join(directory, name)))
+        return sorted(segments)
+
+    # ======== Replay ========
+
+    def entries(self):
+        """Every entry not covered by a checkpoint yet, oldest first"""
+        paths = [path for _, path in self._segments()] + [self.path]
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if not line.endswith("\n"):
+                            break   # cut short by a crash
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except FileNotFoundError:
+                continue
+
+
+def apply(countries, assignments, entries, quarantine=None):
+    """Replay journal entries onto countries.json / user_assignments.json data in place.
+
+    ``quarantine`` is the checkpointed quarantine, [[until, number, country],
+    ...], updated in place as well. Returns the number of entries applied.
+    """
+    state = {}      # number -> country it is free in, or None when it is not free
+    held = {entry[1]: (entry[0], entry[2]) for entry in quarantine or ()}   # number -> (until, country)
+    applied = 0
+    for entry in entries:
+        op = entry.get("op")
+        number = entry.get("number")
+        if op == "lease":
+            assignments[entry["user"]] = {"number": number, "country": entry["country"], "timestamp": entry["ts"]}
+            state[number] = None
+        elif op == "release":
+            if (assignments.get(entry["user"]) or {}).get("number") == number:
+                del assignments[entry["user"]]
+            state[number] = entry["country"] if entry.get("to_pool") else None
+        elif op == "free":
+            state[number] = entry["country"]
+        else:
+            continue
+        if op == "release" and entry.get("until") is not None:
+            held[number] = (entry["until"], entry["country"])
+        else:
+            held.pop(number, None)
+        applied += 1
+
+    if quarantine is not None:
+        quarantine[:] = sorted([until, number, country] for number, (until, country) in held.items())
+
+    if state:
+        for data in countries.values():
+            if data.get("numbers"):
+                data["numbers"] = [number for number in data["numbers"] if number not in state]
+        for number, country in state.items():
+            if country is not None and country in countries:
+                countries[country].setdefault("numbers", []).append(number)
+    return applied
@@ -0,0 +1,166 @@
+"""
+Number lease expiry and recycling
+
+A lease ends after LEASE_TTL_MINUTES, or after LEASE_IDLE_MINUTES without
+an OTP for the number (0 disables either rule). Every lease has one entry
+in a min-heap keyed by its deadline; an OTP only updates the lease's last
+activity, and when the entry reaches the top its real deadline is
+recomputed and the entry pushed back if it moved. Expiring a lease is
+therefore O(log n), and nothing ever scans all assignments.
+
+Expired (and, with RECYCLE_CHANGED_NUMBERS, changed) numbers wait
+QUARANTINE_MINUTES before they return to the free pool, so a late OTP for
+the previous user never reaches the next one. The quarantine is only held
+in memory here: number_bot journals every number that enters or leaves it
+(lease_journal.py) and writes it to QUARANTINE_FILE with each number pool
+checkpoint, so a restart doesn't lose those numbers.
+"""
+import heapq
+import os
+import threading
+import time
+from collections import Counter, deque
+
+LEASE_TTL_MINUTES = float(os.getenv("LEASE_TTL_MINUTES", "0"))
+LEASE_IDLE_MINUTES = float(os.getenv("LEASE_IDLE_MINUTES", "0"))
+QUARANTINE_MINUTES = float(os.getenv("QUARANTINE_MINUTES", "60"))
+RECYCLE_CHANGED_NUMBERS = os.getenv("RECYCLE_CHANGED_NUMBERS", "0") == "1"
+LEASE_TICK_SECONDS = 5
+QUARANTINE_FILE = "quarantine.json"
+
+
+class LeaseScheduler:
+    def __init__(self, ttl_minutes=LEASE_TTL_MINUTES, idle_minutes=LEASE_IDLE_MINUTES,
+                 quarantine_minutes=QUARANTINE_MINUTES, quarantine_file=QUARANTINE_FILE):
+        self.ttl = ttl_minutes * 60
+        self.idle = idle_minutes * 60
+        self.quarantine_seconds = quarantine_minutes * 60
+        self.quarantine_file = quarantine_file
+        self._lock = threading.Lock()
+        self._leases = {}        # user_key -> [number, country, leased_at, last_active]
+        self._heap = []          # (deadline, user_key, number)
+        self._quarantine = deque()   # (release_at, number, country), release_at never decreases
+        self.stats = Counter()
+
+    @property
+    def enabled(self):
+        return bool(self.ttl or self.idle)
+
+    # ======== Leases ========
+
+    def load(self, assignments, now=None):
+        """Track the leases in user_assignments.json data.
+
+        Activity isn't persisted, so idle time counts from the restart.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._leases.clear()
+            self._heap = []
+            for user_key, data in assignments.items():
+                if data.get("number"):
+                    leased_at = data.get("timestamp", now)
+                    self._add(str(user_key), data["number"], data.get("country"), leased_at, max(leased_at, now))
+
+    def track(self, user_key, number, country, leased_at=None):
+        leased_at = time.time() if leased_at is None else leased_at
+        with self._lock:
+            self._add(str(user_key), number, country, leased_at, leased_at)
+
+    def _add(self, user_key, number, country, leased_at, last_active):
+        lease = [number, country, leased_at, last_active]
+        self._leases[user_key] = lease
+        if self.enabled:
+            heapq.heappush(self._heap, (self._deadline(lease), user_key, number))
+            if len(self._heap) > 2 * len(self._leases) + 1024:
+                self._heap = [entry for entry in self._heap if self._leases.get(entry[1], [None])[0] == entry[2]]
+                heapq.heapify(self._heap)
+
+    def forget(self, user_key):
+        """The lease ended some other way (number changed, user removed)"""
+        with self._lock:
+            self._leases.pop(str(user_key), None)
+
+    def touch(self, user_key, now=None):
+        """An OTP arrived for the user's number"""
+        with self._lock:
+            lease = self._leases.get(str(user_key))
+            if lease:
+                lease[3] = time.time() if now is None else now
+
+    def _deadline(self, lease):
+        _, _, leased_at, last_active = lease
+        deadlines = []
+        if self.ttl:
+            deadlines.append(leased_at + self.ttl)
+        if self.idle:
+            deadlines.append(last_active + self.idle)
+        return min(deadlines) if deadlines else float("inf")
+
+    def _reason(self, lease, now):
+        if self.ttl and now >= lease[2] + self.ttl:
+            return "ttl"
+        return "idle"
+
+    def due(self, now=None):
+        """Pop the leases whose deadline has passed: [(user_key, number, country, reason)]"""
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, user_key, number = heapq.heappop(self._heap)
+                lease = self._leases.get(user_key)
+                if lease is None or lease[0] != number:
+                    continue   # stale entry
+                deadline = self._deadline(lease)
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, user_key, number))
+                    continue
+                reason = self._reason(lease, now)
+                del self._leases[user_key]
+                self.stats[f"expired_{reason}"] += 1
+                expired.append((user_key, number, lease[1], reason))
+        return expired
+
+    # ======== Quarantine ========
+
+    def quarantine_until(self, now=None):
+        """When a number quarantined now goes back to the pool"""
+        return (time.time() if now is None else now) + self.quarantine_seconds
+
+    def quarantine(self, number, country, until):
+        """Hold a number back from the pool until ``until`` (from quarantine_until())"""
+        with self._lock:
+            self._quarantine.append((until, number, country))
+            self.stats["quarantined"] += 1
+
+    def released(self, now=None):
+        """Numbers whose quarantine is over: [(number, country)]"""
+        now = time.time() if now is None else now
+        with self._lock:
+            ready = []
+            while self._quarantine and self._quarantine[0][0] <= now:
+                _, number, country = self._quarantine.popleft()
+                ready.append((number, country))
+            if ready:
+                self.stats["recycled"] += len(ready)
+            return ready
+
+    def load_quarantine(self, entries):
+        """Restore the quarantine from [[until, number, country], ...]"""
+        with self._lock:
+            self._quarantine = deque(sorted(tuple(entry) for entry in entries))
+
+    def quarantined(self):
+        """The quarantine as [[until, number, country], ...], for checkpoints"""
+        with self._lock:
+            return [list(entry) for entry in self._quarantine]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "tracked": len(self._leases),
+                "scheduled": len(self._heap),
+                "in_quarantine": len(self._quarantine),
+                **self.stats,
+            }
@@ -0,0 +1,378 @@
+"""
+On-demand profiling of the running bots, no restart needed
+
+A bot calls profiler.start(process) once; a watcher thread then picks up
+requests that health_server.py (POST /profile/<process>) drops in
+PROFILE_DIR as <process>.<mode>.request, and SIGUSR1 / SIGUSR2 start the
+process's default mode / a tracemalloc diff for PROFILE_SECONDS. Modes:
+
+- cprofile: cProfile of the poll loop thread (main_loop in the SMS bot,
+  the update loop in the Number Bot) for N seconds or N cycles. The loop
+  calls profiler.cycle() once per iteration, so captures cover whole
+  cycles; the call is a single attribute check when nothing is pending.
+  cProfile only sees the thread it runs on, so work handed to other
+  threads goes through profiler.call(): the Number Bot's update handlers
+  (on the async runtime's handler threads) are profiled per call while a
+  capture runs and merged into it. Other threads (lease expiry, broadcasts)
+  only show up in sample mode.
+- sample: a thread samples every thread's stack each interval (10ms) for N
+  seconds; writes collapsed stacks (flamegraph.pl / speedscope) and the
+  hottest functions.
+- tracemalloc: allocation growth over N seconds by source line, plus the
+  sizes of structures registered with profiler.watch() (sent_ids,
+  admin_states, ...) and the live object counts per type (BeautifulSoup
+  Tags show up here) at both ends.
+
+Results are written to PROFILE_DIR as <process>-<mode>-<time>.* and can be
+pulled from the health server at /profiles.
+"""
+import cProfile
+import gc
+import io
+import json
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+MAX_PROFILE_SECONDS = 600
+SAMPLE_INTERVAL = 0.01
+TRACEMALLOC_FRAMES = 10
+REQUEST_POLL_SECONDS = 1
+MODES = ("cprofile", "sample", "tracemalloc")
+# What each mode sees, returned with every request
+MODE_COVERAGE = {
+    "cprofile": "deterministic, the poll loop thread and update handlers only",
+    "sample": "statistical, every thread",
+    "tracemalloc": "allocations, every thread",
+}
+TOP = 40
+
+log = logging.getLogger(__name__)
+
+
+def request_path(process, mode, directory=PROFILE_DIR):
+    # One slot per mode, so requests for different modes don't overwrite each other
+    return os.path.join(directory, f"{process}.{mode}.request")
+
+
+def request_profile(process, mode, seconds=None, cycles=None, interval=None, directory=PROFILE_DIR):
+    """Ask a running bot for a profile; returns the request as written. Raises ValueError if invalid."""
+    if mode not in MODES:
+        raise ValueError("mode must be one of " + "; ".join(f"{name} ({MODE_COVERAGE[name]})" for name in MODES))
+    if seconds is not None and not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_PROFILE_SECONDS}")
+    if cycles is not None and (mode != "cprofile" or cycles < 1):
+        raise ValueError("cycles only applies to cprofile and must be at least 1")
+    if interval is not None and not 0.001 <= interval <= 1:
+        raise ValueError("interval must be between 0.001 and 1 seconds")
+    request = {"mode": mode}
+    for key, value in (("seconds", seconds), ("cycles", cycles), ("interval", interval)):
+        if value is not None:
+            request[key] = value
+    os.makedirs(directory, exist_ok=True)
+    path = request_path(process, mode, directory)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(request, f)
+    os.replace(path + ".tmp", path)
+    return request
+
+
+def list_profiles(directory=PROFILE_DIR):
+    """Result files, newest first: [{"name", "size", "time"}]"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    files = []
+    for name in names:
+        if name.endswith((".request", ".tmp")):
+            continue
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        files.append({"name": name, "size": st.st_size, "time": st.st_mtime})
+    return sorted(files, key=lambda entry: entry["time"], reverse=True)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+class LiveProfiler:
+    def __init__(self):
+        self.process = None
+        self.directory = PROFILE_DIR
+        self.default_mode = "sample"
+        self.watches = {}              # name -> callable returning a size
+        self._lock = threading.Lock()
+        self._pending = None           # cprofile request waiting for the next cycle()
+        self._running = None           # [profile, request, thread id, started, cycles]
+        self._calls = None             # pstats.Stats of the profiler.call()s of the running capture
+        self._call_count = 0
+        self._busy = set()             # sample/tracemalloc modes in progress
+
+    def start(self, process, default_mode="sample", directory=PROFILE_DIR):
+        """Watch for requests; call from the main thread so the signal handlers can be installed"""
+        self.process = process
+        self.default_mode = default_mode
+        self.directory = directory
+        threading.Thread(target=self._watch_requests, name="profiler-requests", daemon=True).start()
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda *_: self._submit_async({"mode": self.default_mode}))
+            signal.signal(signal.SIGUSR2, lambda *_: self._submit_async({"mode": "tracemalloc"}))
+
+    def watch(self, name, size):
+        """Report ``size()`` (e.g. len of a cache) at both ends of tracemalloc captures"""
+        self.watches[name] = size
+
+    # ======== Requests ========
+
+    def _watch_requests(self):
+        paths = [request_path(self.process, mode, self.directory) for mode in MODES]
+        while True:
+            time.sleep(REQUEST_POLL_SECONDS)
+            for path in paths:
+                if not os.path.exists(path):
+                    continue
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        request = json.load(f)
+                except (OSError, ValueError):
+                    request = None
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                if request:
+                    self.submit(request)
+
+    def _submit_async(self, request):
+        # Signal handlers run on the main thread, which may hold our lock
+        threading.Thread(target=self.submit, args=(request,), daemon=True).start()
+
+    def submit(self, request):
+        mode = request.get("mode")
+        log.info("🔬 Profile requested", extra={"request": request})
+        if mode == "cprofile":
+            with self._lock:
+                if self._pending is not None or self._running is not None:
+                    log.warning("⚠️ A cProfile capture is already in progress")
+                    return
+                self._pending = request
+            return
+        if mode not in MODES:
+            log.warning("⚠️ Unknown profile mode", extra={"mode": mode})
+            return
+        with self._lock:
+            if mode in self._busy:
+                log.warning("⚠️ A profile is already in progress", extra={"mode": mode})
+                return
+            self._busy.add(mode)
+        target = self._sample if mode == "sample" else self._tracemalloc
+        threading.Thread(target=target, args=(request,), name=f"profiler-{mode}", daemon=True).start()
+
+    def _output(self, mode, extension):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.directory, f"{self.process}-{mode}-{stamp}.{extension}")
+
+    # ======== cProfile ========
+
+    def call(self, func, *args):
+        """Run ``func(*args)``, profiled into the running cProfile capture if there is one.
+
+        For work that runs off the poll loop thread, which the capture's own
+        profiler can't see.
+        """
+        running = self._running
+        if running is None or running[2] == threading.get_ident():
+            return func(*args)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 3.12+: the capture's profiler already sees every thread
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._running is running:
+                    self._calls.add(profile)
+                    self._call_count += 1
+
+    def cycle(self):
+        """Called by a poll loop once per iteration; starts and stops cProfile captures on that thread"""
+        if self._pending is None and self._running is None:
+            return
+        with self._lock:
+            if self._running is None:
+                request, self._pending = self._pending, None
+                profile = cProfile.Profile()
+                self._calls = pstats.Stats()
+                self._call_count = 0
+                self._running = [profile, request, threading.get_ident(), time.monotonic(), 0]
+                profile.enable()
+                return
+            profile, request, thread_id, started, cycles = self._running
+            if thread_id != threading.get_ident():
+                return
+            cycles += 1
+            self._running[4] = cycles
+            elapsed = time.monotonic() - started
+            if request.get("cycles"):
+                done = cycles >= request["cycles"] or elapsed >= MAX_PROFILE_SECONDS
+            else:
+                done = elapsed >= request.get("seconds", PROFILE_SECONDS)
+            if not done:
+                return
+            profile.disable()
+            self._running = None
+            calls, call_count, self._calls = self._calls, self._call_count, None
+        self._write_cprofile(profile, calls, call_count, elapsed, cycles)
+
+    def _write_cprofile(self, profile, calls, call_count, elapsed, cycles):
+        path = self._output("cprofile", "prof")
+        text = io.StringIO()
+        text.write(f"{self.process}: cProfile of the poll loop thread, {cycles} cycles in {elapsed:.1f}s, "
+                   f"plus {call_count} update handler calls (other threads: use sample mode)\n\n")
+        stats = pstats.Stats(profile, stream=text)
+        if call_count:
+            stats.add(calls)
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(TOP)
+        stats.sort_stats("tottime").print_stats(TOP)
+        with open(path[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+        log.info("🔬 Profile written", extra={"mode": "cprofile", "path": path})
+
+    # ======== Sampling ========
+
+    def _sample(self, request):
+        try:
+            seconds = request.get("seconds", PROFILE_SECONDS)
+            interval = request.get("interval", SAMPLE_INTERVAL)
+            own = threading.get_ident()
+            stacks = Counter()          # (thread name, frames from the root) -> samples
+            names = {}
+            samples = 0
+            started = time.monotonic()
+            while time.monotonic() - started < seconds:
+                if samples % 100 == 0:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    frames = []
+                    while frame is not None:
+                        frames.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    frames.reverse()
+                    stacks[(names.get(ident, str(ident)), tuple(frames))] += 1
+                samples += 1
+                time.sleep(interval)
+            self._write_samples(stacks, samples, time.monotonic() - started)
+        except Exception as e:
+            log.warning("⚠️ Profile failed", extra={"mode": "sample", "error": str(e)})
+        finally:
+            with self._lock:
+                self._busy.discard("sample")
+
+    def _write_samples(self, stacks, samples, elapsed):
+        path = self._output("sample", "collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for (thread, frames), count in stacks.most_common():
+                f.write(";".join((thread,) + frames) + f" {count}\n")
+
+        per_thread = Counter()
+        own = Counter()             # samples with the function at the top of the stack
+        inclusive = Counter()       # samples with the function anywhere on the stack
+        for (thread, frames), count in stacks.items():
+            per_thread[thread] += count
+            if frames:
+                own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        total = sum(stacks.values()) or 1
+        lines = [f"{self.process}: {samples} samples in {elapsed:.1f}s, {total} thread stacks", "", "Samples per thread:"]
+        lines += [f"  {count:8d}  {thread}" for thread, count in per_thread.most_common()]
+        lines += ["", "Top of stack (waiting in sleep/select/locks shows up here too):"]
+        lines += [f"  {count / total:6.1%}  {label}" for label, count in own.most_common(TOP)]
+        lines += ["", "On the stack:"]
+        lines += [f"  {count / total:6.1%}  {label}" for label, count in inclusive.most_common(TOP)]
+        with open(path[:-len(".collapsed")] + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        log.info("🔬 Profile written", extra={"mode": "sample", "path": path})
+
+    # ======== tracemalloc ========
+
+    def _watch_sizes(self):
+        sizes = {}
+        for name, size in self.watches.items():
+            try:
+                sizes[name] = size()
+            except Exception as e:
+                sizes[name] = f"error: {e}"
+        return sizes
+
+    @staticmethod
+    def _type_counts():
+        return Counter(f"{type(obj).__module__}.{type(obj).__qualname__}" for obj in gc.get_objects())
+
+    def _tracemalloc(self, request):
+        started_here = False
+        try:
+            seconds = request.get("seconds", PROFILE_SECONDS)
+            started_here = not tracemalloc.is_tracing()
+            if started_here:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            watches_before, types_before = self._watch_sizes(), self._type_counts()
+            before = tracemalloc.take_snapshot()
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            watches_after, types_after = self._watch_sizes(), self._type_counts()
+            # Leave out the profiler's own bookkeeping (the type counts above)
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                      tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+            diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+            self._write_tracemalloc(seconds, started_here, diff, watches_before, watches_after, types_before, types_after)
+        except Exception as e:
+            log.warning("⚠️ Profile failed", extra={"mode": "tracemalloc", "error": str(e)})
+        finally:
+            if started_here:
+                tracemalloc.stop()
+            with self._lock:
+                self._busy.discard("tracemalloc")
+
+    def _write_tracemalloc(self, seconds, started_here, diff, watches_before, watches_after, types_before, types_after):
+        path = self._output("tracemalloc", "txt")
+        growth = sum(stat.size_diff for stat in diff)
+        lines = [f"{self.process}: allocation growth over {seconds:g}s: {growth / 1024:+.1f} KiB"]
+        if started_here:
+            lines.append("(tracing started with this request, so only allocations made during it are counted)")
+        lines += ["", "Watched structures (start -> end):"]
+        lines += [f"  {name}: {watches_before.get(name)} -> {watches_after.get(name)}" for name in self.watches]
+        lines += ["", "Growth by source line:"]
+        lines += [f"  {stat}" for stat in [stat for stat in diff if stat.size_diff or stat.count_diff][:TOP]]
+        type_diff = Counter(types_after)
+        type_diff.subtract(types_before)
+        lines += ["", "Live objects by type (change, end count):"]
+        lines += [f"  {change:+9d} {types_after[name]:9d}  {name}"
+                  for name, change in sorted(type_diff.items(), key=lambda item: -abs(item[1]))[:TOP] if change]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        log.info("🔬 Profile written", extra={"mode": "tracemalloc", "path": path})
+
+
+# One profiler per process
+profiler = LiveProfiler()
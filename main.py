@@ -1,6 +1,7 @@
 import time
 import re
 import os
+import logging
 import requests
 import json
 from selenium import webdriver
@@ -12,9 +13,20 @@ from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
 from webdriver_manager.chrome import ChromeDriverManager
 
+from heartbeat import beat
+from status_board import board
+from metrics import registry, start_exporter
+from telegram_client import API_BASE, api_metric_families, api_stats
+from stage_timer import StageTimer
+from otp_latency import parse_panel_time
+from live_profiler import profiler
+from structured_log import number_hash, setup_logging
+
 # ====================== Configuration ======================
-LOGIN_PAGE = "http://51.89.99.105/NumberPanel/login"
-OTP_PAGE = "http://51.89.99.105/NumberPanel/agent/SMSCDRReports"
+# Point at a local stand-in (benchmarks/fake_panel.py) for load tests
+PANEL_BASE_URL = os.getenv("PANEL_BASE_URL", "http://51.89.99.105/NumberPanel").rstrip("/")
+LOGIN_PAGE = f"{PANEL_BASE_URL}/login"
+OTP_PAGE = f"{PANEL_BASE_URL}/agent/SMSCDRReports"
 
 # Get credentials from environment variables
 CHEKER_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
@@ -29,6 +41,23 @@ POLL_INTERVAL_SECONDS = 20.0
 MAX_LOGIN_RETRIES = 3
 OTP_QUEUE_FILE = "otp_queue.json"
 
+# ====================== Metrics ======================
+poll_cycle_seconds = registry.histogram("sms_poll_cycle_seconds", "Panel poll cycle duration (refresh, parse, forward), without the sleep")
+rows_per_cycle = registry.histogram("sms_rows_parsed", "SMS table rows parsed per poll cycle",
+                                    buckets=(0, 10, 25, 50, 100, 250, 500, 1000, 2500))
+new_per_cycle = registry.histogram("sms_new_messages", "New SMS forwarded per poll cycle",
+                                   buckets=(0, 1, 2, 5, 10, 25, 50, 100))
+registry.collector(lambda: api_metric_families(api_stats.snapshot(), "sms_forwarder"))
+stage_seconds = registry.histogram("sms_stage_seconds", "Time spent per poll cycle stage")
+
+# Per-stage breakdown of every poll cycle; rolling percentiles are logged every STAGE_REPORT_CYCLES
+cycle_timer = StageTimer(observe=lambda stage, seconds: stage_seconds.observe(seconds, stage=stage))
+STAGE_REPORT_CYCLES = 30
+
+log = logging.getLogger("sms_bot")
+# Per-attempt send records, so they can get their own level in LOG_LEVELS
+send_log = logging.getLogger("sms_bot.send")
+
 def open_driver(headless=True):
     chrome_options = Options()
     
@@ -76,26 +105,33 @@ def send_telegram_message(chat_id: str, text: str, reply_markup: dict | None = N
     
     max_retries = 3
     for attempt in range(max_retries):
+        started = time.monotonic()
         try:
-            r = requests.post(f"https://api.telegram.org/bot{CHEKER_BOT_TOKEN}/sendMessage", data=payload, timeout=15)
-            if r.status_code == 200 and r.json().get('ok'):
-                print(f"✅ Message sent to group {chat_id}")
+            r = requests.post(f"{API_BASE}/bot{CHEKER_BOT_TOKEN}/sendMessage", data=payload, timeout=15)
+            ok = r.status_code == 200 and r.json().get('ok')
+            api_stats.record("sendMessage", time.monotonic() - started, error=not ok, rate_limited=r.status_code == 429)
+            if ok:
+                board.mark("sms_last_send")
+                send_log.info("✅ Message sent", extra={"chat": chat_id, "attempt": attempt + 1,
+                                                       "duration_ms": round((time.monotonic() - started) * 1000)})
                 return r
             elif r.status_code == 429:
                 response_data = r.json()
                 retry_after = response_data.get('parameters', {}).get('retry_after', 5)
-                print(f"⚠️ Rate limit hit! Waiting {retry_after} seconds...")
+                send_log.warning("⚠️ Rate limit hit", extra={"chat": chat_id, "retry_after": retry_after})
                 time.sleep(retry_after + 1)
             else:
-                print(f"⚠️ Failed to send to {chat_id}: {r.status_code} - {r.text[:100]}")
+                send_log.warning("⚠️ Send failed", extra={"chat": chat_id, "attempt": attempt + 1,
+                                                          "status": r.status_code, "error": r.text[:100]})
                 if attempt < max_retries - 1:
                     time.sleep(2)
         except Exception as e:
-            print(f"⚠️ Exception sending to {chat_id} (attempt {attempt+1}/{max_retries}): {e}")
+            api_stats.record("sendMessage", time.monotonic() - started, error=True)
+            send_log.warning("⚠️ Exception sending message", extra={"chat": chat_id, "attempt": attempt + 1, "error": str(e)})
             if attempt < max_retries - 1:
                 time.sleep(2)
     
-    print(f"❌ Failed to send message to {chat_id} after {max_retries} attempts")
+    send_log.error("❌ Giving up on message", extra={"chat": chat_id, "attempt": max_retries})
     return None
 
 def get_sms_rows(html: str):
@@ -103,11 +139,11 @@ def get_sms_rows(html: str):
     rows = []
     table = soup.find("table", {"id": "dt"})
     if not table: 
-        print("⚠️ Table with id='dt' not found")
+        log.warning("⚠️ Table with id='dt' not found")
         return rows
     tbody = table.find("tbody")
     if not tbody: 
-        print("⚠️ Table body not found")
+        log.warning("⚠️ Table body not found")
         return rows
     
     all_trs = tbody.find_all("tr")
@@ -253,9 +289,9 @@ def auto_login(driver, username, password):
                 try:
                     captcha_input = try_find_element(driver, [(By.NAME,"capt"),(By.XPATH,"//input[@placeholder='Your answer']"),(By.NAME,"answer"),(By.NAME,"captcha")], timeout=3)
                     captcha_input.clear(); captcha_input.send_keys(str(captcha_answer))
-                    print("✅ Captcha auto-filled:", captcha_answer)
+                    log.info("✅ Captcha auto-filled")
                 except Exception as e:
-                    print(f"⚠️ Captcha field not found, continuing without it...")
+                    log.warning("⚠️ Captcha field not found, continuing without it", extra={"error": str(e)})
             login_btn = try_find_element(driver, [(By.XPATH,"//button[@type='submit']"),(By.XPATH,"//button[contains(text(),'LOGIN')]"),(By.XPATH,"//button[contains(.,'Sign In') or contains(.,'Login')]"),(By.XPATH,"//input[@type='submit']"),(By.ID,"login_btn")])
             login_btn.click()
             time.sleep(3)
@@ -276,75 +312,99 @@ def auto_login(driver, username, password):
                     
                     # تحقق من أننا في الصفحة الصحيحة
                     if "SMSCDRStats" in driver.current_url or "dt" in driver.page_source:
-                        print(f"✅ Auto-login successful (attempt {attempt})")
+                        log.info("✅ Auto-login successful", extra={"attempt": attempt})
                         return True
                     else:
-                        print(f"⚠️ Could not access OTP page (attempt {attempt})")
+                        log.warning("⚠️ Could not access OTP page", extra={"attempt": attempt})
                 except:
                     pass
             else:
-                print(f"❌ Login failed: Invalid credentials detected (attempt {attempt})")
+                log.error("❌ Login failed: invalid credentials detected", extra={"attempt": attempt})
             
         except Exception as e:
-            print(f"⚠️ Login attempt {attempt} failed: {e}")
+            log.warning("⚠️ Login attempt failed", extra={"attempt": attempt, "error": str(e)})
         
         time.sleep(3)
     
     return False
 
 def get_otp_page_html(driver):
-    driver.refresh()
-    
-    # Handle any alerts that may appear
-    try:
-        alert = driver.switch_to.alert
-        alert.accept()
-        time.sleep(0.3)
-    except:
-        pass
-    
-    # Wait longer for DataTables to load via JavaScript/AJAX
-    time.sleep(3)
-    
-    # Wait for table to have actual data rows (not just loading row)
-    max_wait = 10
-    for i in range(max_wait):
+    with cycle_timer.span("refresh"):
+        driver.refresh()
+        
+        # Handle any alerts that may appear
         try:
-            # Check if table has loaded with data
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            table = soup.find("table", {"id": "dt"})
-            if table:
-                tbody = table.find("tbody")
-                if tbody:
-                    rows = tbody.find_all("tr")
-                    if rows and len(rows) > 0:
-                        first_row_tds = rows[0].find_all("td")
-                        # If first row has more than 1 column, data is loaded
-                        if len(first_row_tds) > 1:
-                            break
+            alert = driver.switch_to.alert
+            alert.accept()
+            time.sleep(0.3)
         except:
             pass
-        time.sleep(1)
     
-    return driver.page_source
+    with cycle_timer.span("table_wait"):
+        # Wait longer for DataTables to load via JavaScript/AJAX
+        time.sleep(3)
+        
+        # Wait for table to have actual data rows (not just loading row)
+        max_wait = 10
+        for i in range(max_wait):
+            try:
+                # Check if table has loaded with data
+                soup = BeautifulSoup(driver.page_source, "html.parser")
+                table = soup.find("table", {"id": "dt"})
+                if table:
+                    tbody = table.find("tbody")
+                    if tbody:
+                        rows = tbody.find_all("tr")
+                        if rows and len(rows) > 0:
+                            first_row_tds = rows[0].find_all("td")
+                            # If first row has more than 1 column, data is loaded
+                            if len(first_row_tds) > 1:
+                                break
+            except:
+                pass
+            time.sleep(1)
+    
+    with cycle_timer.span("page_source"):
+        return driver.page_source
+
+def count_queued_otps():
+    """Lines already in otp_queue.json, the producer side of the queue offset"""
+    try:
+        with open(OTP_QUEUE_FILE, "rb") as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    except FileNotFoundError:
+        return 0
 
 def main_loop():
+    setup_logging("sms_bot")
+    board.mark("sms_started")
+    start_exporter("sms_bot")
+    profiler.start("sms_bot", default_mode="cprofile")
+    board.set("sms_otp_enqueued", count_queued_otps())
     driver = open_driver(headless=True)
     if not auto_login(driver, USERNAME, PASSWORD):
-        print("❌ Login failed after retries.")
+        log.error("❌ Login failed after retries")
         driver.quit()
         return
 
     sent_ids = set()
-    print("🚀 SMS forwarding started")
+    profiler.watch("sent_ids", lambda: len(sent_ids))
+    log.info("🚀 SMS forwarding started")
     
     loop_count = 0
 
     try:
         while True:
             loop_count += 1
+            beat()
+            profiler.cycle()
+            cycle_timer.start_cycle()
             html = get_otp_page_html(driver)
-            rows = get_sms_rows(html)
+            scraped_at = time.time()
+            with cycle_timer.span("parse"):
+                rows = get_sms_rows(html)
+            board.mark("sms_last_poll")
+            board.add("sms_polls")
             
             # عكس ترتيب الرسائل عشان نبدأ بالأحدث (الأول في الجدول)
             rows = list(reversed(rows))
@@ -354,9 +414,11 @@ def main_loop():
                 # ডুপ্লিকেট প্রতিরোধের জন্য ইউনিক আইডি তৈরি
                 unique_id = f"{date}|{number}|{sms[:30]}"
                 if unique_id not in sent_ids:
+                    beat()
                     new_messages += 1
-                    msg = format_message(date, number, cli, client, sms)
-                    print(f"📩 New SMS #{new_messages}: {number} - {sms[:40]}...")
+                    with cycle_timer.span("format"):
+                        msg = format_message(date, number, cli, client, sms)
+                    log.info("📩 New SMS", extra={"number_hash": number_hash(number), "cli": cli, "index": new_messages})
                     
                     # --- টেলিগ্রাম ইনলাইন বাটন তৈরি করা হচ্ছে ---
                     # 1. মেইন চ্যানেল বাটন (Channel Link)
@@ -374,32 +436,47 @@ def main_loop():
                     # --- বাটন ডেটা تৈরি শেষ ---
                     
                     # গ্রুপে মেসেজ পাঠানো হচ্ছে
+                    # The pause between sends is its own stage so "send" is Telegram time only
                     for chat_id in GROUP_CHAT_IDS:
-                        send_telegram_message(chat_id, msg, reply_markup=inline_keyboard_markup)
-                        time.sleep(0.5)
+                        with cycle_timer.span("send"):
+                            send_telegram_message(chat_id, msg, reply_markup=inline_keyboard_markup)
+                        with cycle_timer.span("send_pause"):
+                            time.sleep(0.5)
                     
                     # OTP ডেটা ফাইলে সংরক্ষণ করা হচ্ছে
-                    otp_data = {
-                        "number": number,
-                        "otp": extract_otp(sms),
-                        "service": detect_service(sms)
-                    }
-                    try:
-                        with open(OTP_QUEUE_FILE, "a", encoding="utf-8") as f:
-                            json.dump(otp_data, f)
-                            f.write('\n')
-                        print(f"✅ OTP data queued for number: {number}")
-                    except Exception as e:
-                        print(f"⚠️ Failed to write to OTP file: {e}")
+                    with cycle_timer.span("enqueue"):
+                        otp_data = {
+                            "number": number,
+                            "otp": extract_otp(sms),
+                            "service": detect_service(sms),
+                            # Timestamps for end-to-end latency (otp_latency.py)
+                            "panel_ts": parse_panel_time(date),
+                            "scraped_at": scraped_at,
+                            "enqueued_at": time.time()
+                        }
+                        try:
+                            with open(OTP_QUEUE_FILE, "a", encoding="utf-8") as f:
+                                json.dump(otp_data, f)
+                                f.write('\n')
+                            board.add("sms_otp_enqueued")
+                            log.info("✅ OTP queued", extra={"number_hash": number_hash(number), "stage": "enqueue"})
+                        except Exception as e:
+                            log.error("❌ Failed to write to OTP file", extra={"number_hash": number_hash(number), "error": str(e)})
                     
                     sent_ids.add(unique_id)
             
             if new_messages > 0:
-                print(f"✅ Sent {new_messages} new messages to Telegram")
+                log.info("✅ Sent new messages to Telegram", extra={"count": new_messages})
             
+            cycle_seconds, _ = cycle_timer.end_cycle(html_size=len(html), rows=len(rows), new=new_messages)
+            if loop_count % STAGE_REPORT_CYCLES == 0:
+                cycle_timer.log_percentiles()
+            poll_cycle_seconds.observe(cycle_seconds)
+            rows_per_cycle.observe(len(rows))
+            new_per_cycle.observe(new_messages)
             time.sleep(POLL_INTERVAL_SECONDS)
     except KeyboardInterrupt:
-        print("❌ Stopped by user.")
+        log.info("❌ Stopped by user")
     finally:
         driver.quit()
 
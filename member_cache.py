@@ -0,0 +1,55 @@
+"""
+In-memory membership sets for the Number Bot's user lists
+
+approved_users.json and pending_requests.json are JSON objects keyed by user
+id. MemberSet keeps the keys of one of them as a set, so a membership check
+is a set lookup plus one os.stat() instead of reading and parsing the whole
+file. The set is reloaded when the file's mtime/size/inode change (someone
+edited it outside the bot), and refreshed without a re-read when the bot
+saves the file itself.
+"""
+import json
+import os
+import threading
+
+
+class MemberSet:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._keys = frozenset()
+        self._stamp = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _current(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return self._keys
+        with self._lock:
+            if stamp != self._stamp:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except:
+                    data = {}
+                self._keys = frozenset(data)
+                self._stamp = stamp
+            return self._keys
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._current()
+
+    def __len__(self):
+        return len(self._current())
+
+    def saved(self, data):
+        """Call after writing ``data`` to the file so the next check doesn't re-read it"""
+        with self._lock:
+            self._keys = frozenset(data)
+            self._stamp = self._file_stamp()
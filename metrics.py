@@ -0,0 +1,238 @@
+"""
+Prometheus metrics for the bots, merged across processes by the health server
+
+Each process keeps its counters, gauges and histograms in memory (a lock and
+an add per update), and a background thread writes a snapshot of them to
+METRICS_DIR/<process>.json every FLUSH_SECONDS. Stats the bots already keep
+(route and Telegram API counters, pool sizes) are turned into metrics by
+collectors when the snapshot is taken, so they cost nothing extra on the
+hot path. health_server.py merges the snapshots and serves them at /metrics
+in the Prometheus text format: counters and histograms are summed over
+processes, gauges keep a ``process`` label.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+METRICS_DIR = os.getenv("METRICS_DIR", ".metrics")
+FLUSH_SECONDS = 10
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def family(name, type, help, samples):
+    """A metric family as stored in snapshots: samples are [sample name, labels, value]"""
+    return {"name": name, "type": type, "help": help, "samples": samples}
+
+
+def histogram_samples(name, labels, bounds, counts, total):
+    """Samples of a histogram kept as per-bucket counts.
+
+    ``counts`` has one entry per bound plus one for the open bucket; the
+    Prometheus buckets are cumulative.
+    """
+    samples = []
+    cumulative = 0
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        samples.append([f"{name}_bucket", dict(labels, le=_format_value(bound)), cumulative])
+    cumulative += counts[len(bounds)]
+    samples.append([f"{name}_bucket", dict(labels, le="+Inf"), cumulative])
+    samples.append([f"{name}_sum", labels, total])
+    samples.append([f"{name}_count", labels, cumulative])
+    return samples
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}    # sorted label items -> value
+
+    def family(self):
+        with self._lock:
+            return family(self.name, self.type, self.help, self._samples())
+
+    def _samples(self):
+        return [[self.name, dict(key), value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per-bucket counts, then the sum of observed values
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[bucket] += 1
+            entry[-1] += value
+
+    def _samples(self):
+        samples = []
+        for key, entry in self._values.items():
+            samples.extend(histogram_samples(self.name, dict(key), self.buckets, entry[:-1], entry[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help):
+        return self._register(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self._register(Gauge(name, help))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """Add ``func() -> [family, ...]``, called every time a snapshot is taken"""
+        self._collectors.append(func)
+        return func
+
+    def collect(self):
+        families = [metric.family() for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                log.warning("⚠️ Metrics collector failed", extra={"collector": collector.__name__, "error": str(e)})
+        return families
+
+
+# One registry per process
+registry = Registry()
+
+
+# ======== Snapshots ========
+
+def write_snapshot(process, registry=registry, directory=METRICS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{process}.json")
+    snapshot = {"process": process, "time": time.time(), "families": registry.collect()}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(path + ".tmp", path)
+
+
+def start_exporter(process, registry=registry, directory=METRICS_DIR, interval=FLUSH_SECONDS):
+    """Write this process's snapshot every ``interval`` seconds from a daemon thread"""
+    def export():
+        while True:
+            try:
+                write_snapshot(process, registry, directory)
+            except Exception as e:
+                log.warning("⚠️ Failed to write metrics", extra={"error": str(e)})
+            time.sleep(interval)
+
+    thread = threading.Thread(target=export, name="metrics-exporter", daemon=True)
+    thread.start()
+    return thread
+
+
+def read_snapshots(directory=METRICS_DIR):
+    snapshots = []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return snapshots
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    """One list of families from every process's snapshot"""
+    merged = {}
+    for snapshot in snapshots:
+        for fam in snapshot["families"]:
+            target = merged.setdefault(fam["name"], family(fam["name"], fam["type"], fam["help"], {}))
+            for sample_name, labels, value in fam["samples"]:
+                if fam["type"] == "gauge":
+                    labels = dict(labels, process=snapshot["process"])
+                key = (sample_name, _key(labels))
+                if key in target["samples"]:
+                    target["samples"][key][2] += value
+                else:
+                    target["samples"][key] = [sample_name, labels, value]
+    return [dict(fam, samples=list(fam["samples"].values())) for fam in merged.values()]
+
+
+# ======== Text exposition ========
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        if value.is_integer():
+            return str(int(value)) if abs(value) < 1e15 else repr(value)
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families):
+    """Families in the Prometheus text format (version 0.0.4)"""
+    lines = []
+    for fam in families:
+        lines.append(f"# HELP {fam['name']} {fam['help']}")
+        lines.append(f"# TYPE {fam['name']} {fam['type']}")
+        for sample_name, labels, value in fam["samples"]:
+            if labels:
+                label_text = ",".join(f'{name}="{_escape(v)}"' for name, v in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
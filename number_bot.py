@@ -1,13 +1,41 @@
+import time
+_import_started = time.monotonic()
 import os
+import sys
 import json
-import time
-import requests
+import itertools
+import logging
+import threading
 from threading import Thread
-import pandas as pd
-import io
+from number_pool import NumberPool
+from update_spool import SpoolReader
+from update_capture import CAPTURE_UPDATES_FILE, UpdateCapture
+from telegram_client import TelegramClient, api_metric_families, api_stats, format_stats
+from broadcast import BroadcastEngine
+from startup_profile import StartupProfile
+from member_cache import MemberSet
+from router import Route, Router, format_route_stats, require_admin, route_metric_families
+from flood_control import FloodControl, format_flood_stats
+from lease_manager import LEASE_TICK_SECONDS, QUARANTINE_FILE, RECYCLE_CHANGED_NUMBERS, LeaseScheduler
+from lease_journal import LeaseJournal, apply as replay_journal
+from heartbeat import beat
+from status_board import board
+from metrics import family, registry, start_exporter
+from otp_latency import OtpLatency, format_latency
+from live_profiler import profiler
+from structured_log import number_hash, setup_logging
+
+# pandas/NumPy (number_import, number_validation) are only imported on the first upload
+startup = StartupProfile(_import_started)
+startup.record("imports", time.monotonic() - _import_started)
 
 # Configuration
 BOT_TOKEN = os.getenv("NUMBER_BOT_TOKEN", "")
+# "async" runs everything on one asyncio loop (async_runtime.py), "polling" is the threaded loop
+NUMBER_BOT_RUNTIME = os.getenv("NUMBER_BOT_RUNTIME", "async")
+# Webhook mode: Telegram posts updates to health_server.py, which spools them for us
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
 ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "0"))
 OTP_QUEUE_FILE = "otp_queue.json"
 USER_ASSIGNMENTS_FILE = "user_assignments.json"
@@ -15,10 +43,54 @@ COUNTRIES_FILE = "countries.json"
 LAST_OTP_CHECK_FILE = "last_otp_check.txt"
 APPROVED_USERS_FILE = "approved_users.json"
 PENDING_REQUESTS_FILE = "pending_requests.json"
+UPLOAD_PROGRESS_INTERVAL = 3
+
+log = logging.getLogger("number_bot")
+# OTP routing and delivery, so it can get its own level in LOG_LEVELS
+otp_log = logging.getLogger("number_bot.otp")
 
 # Admin states for file upload workflow
 admin_states = {}
 
+# Background broadcasts (created in init_files once the API transport is set)
+broadcaster = None
+
+# Free/leased numbers, loaded from COUNTRIES_FILE and USER_ASSIGNMENTS_FILE by init_files
+number_pool = NumberPool()
+
+# The live copies of USER_ASSIGNMENTS_FILE (user key -> {"number", "country",
+# "timestamp"}) and of COUNTRIES_FILE without the number lists, which come
+# from number_pool. Lease changes are appended to lease_journal and both
+# files are only rewritten by checkpoint_pool
+user_assignments = {}
+country_settings = {}
+lease_journal = LeaseJournal()
+_checkpoint_lock = threading.Lock()
+_checkpointed_seq = 0
+
+# User ids in APPROVED_USERS_FILE / PENDING_REQUESTS_FILE, reloaded when the files change
+approved_members = MemberSet(APPROVED_USERS_FILE)
+pending_members = MemberSet(PENDING_REQUESTS_FILE)
+
+# Views of number_pool.availability() by name -> (pool version, rendered view)
+_view_cache = {}
+
+# Lease expiry (TTL / no OTP for a while) and the quarantine numbers wait in before reuse
+lease_scheduler = LeaseScheduler()
+
+# Anonymized copy of every incoming update for benchmarks/replay.py (off unless CAPTURE_UPDATES_FILE is set)
+update_capture = UpdateCapture(CAPTURE_UPDATES_FILE, ADMIN_USER_ID,
+                               keep_text=lambda text: text in router.texts) if CAPTURE_UPDATES_FILE else None
+
+# Serializes load-modify-save cycles on the JSON state files between handler threads
+state_lock = threading.RLock()
+
+# Every Telegram call goes through api_transport; async_runtime swaps in a
+# bridge to its aiohttp session and a process pool for CPU-heavy file parsing
+telegram = TelegramClient(BOT_TOKEN)
+api_transport = telegram
+cpu_executor = None
+
 # Initialize data files
 def init_files():
     if not os.path.exists(USER_ASSIGNMENTS_FILE):
@@ -31,7 +103,7 @@ def init_files():
     
     if not os.path.exists(LAST_OTP_CHECK_FILE):
         with open(LAST_OTP_CHECK_FILE, "w") as f:
-            f.write("0")
+            f.write("0 0")
     
     if not os.path.exists(APPROVED_USERS_FILE):
         with open(APPROVED_USERS_FILE, "w") as f:
@@ -41,48 +113,85 @@ def init_files():
         with open(PENDING_REQUESTS_FILE, "w") as f:
             json.dump({}, f)
     
-    # Clean up: Remove already assigned numbers from countries list
-    cleanup_assigned_numbers()
-
-def cleanup_assigned_numbers():
-    """Remove numbers that are already assigned from the available pool"""
+    # The last checkpoint plus the lease changes journaled since; leased
+    # numbers are left out of the pool and the files are rewritten by deferred_startup
     countries = load_json(COUNTRIES_FILE)
-    assignments = load_json(USER_ASSIGNMENTS_FILE)
-    
-    # Get all assigned numbers
-    assigned_numbers = set()
-    for user_data in assignments.values():
-        if "number" in user_data:
-            assigned_numbers.add(user_data["number"])
-    
-    if not assigned_numbers:
-        return
-    
-    # Remove assigned numbers from countries
-    modified = False
+    user_assignments.clear()
+    user_assignments.update(load_json(USER_ASSIGNMENTS_FILE))
+    quarantine = load_json(QUARANTINE_FILE) or []
+    replayed = replay_journal(countries, user_assignments, lease_journal.entries(), quarantine)
+    number_pool.load(countries, user_assignments)
+    country_settings.clear()
     for country, data in countries.items():
-        if "numbers" in data:
-            original_count = len(data["numbers"])
-            data["numbers"] = [num for num in data["numbers"] if num not in assigned_numbers]
-            removed = original_count - len(data["numbers"])
-            if removed > 0:
-                print(f"🧹 Cleaned {removed} assigned numbers from {country}")
-                modified = True
-    
-    if modified:
-        save_json(COUNTRIES_FILE, countries)
-        print("✅ Cleanup complete")
+        country_settings[country] = {key: value for key, value in data.items() if key != "numbers"}
+    lease_scheduler.load(user_assignments)
+    lease_scheduler.load_quarantine(quarantine)
+    log.info("📦 Number pool loaded", extra={"free": number_pool.total_free(), "leased": number_pool.total_leased(),
+                                            "journal_entries": replayed})
+    
+    global broadcaster
+    # The engine paces and retries 429s itself, so the client must not wait them out first
+    broadcaster = BroadcastEngine(lambda chat_id, text: send_message(chat_id, text, max_retries=0), edit_message)
+
+def deferred_startup():
+    """Startup work that doesn't have to finish before updates are served"""
+    steps = [
+        ("checkpoint number pool", checkpoint_pool),
+        ("set_bot_commands", set_bot_commands),
+        ("resume broadcasts", broadcaster.resume),
+    ]
+    for name, step in steps:
+        with startup.phase(name, deferred=True):
+            try:
+                step()
+            except Exception as e:
+                log.warning("⚠️ Startup step failed", extra={"step": name, "error": str(e)})
+    log.info("⏱ Startup profile", extra=startup.fields())
 
 def load_json(file_path):
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             return json.load(f)
-    except:
+    except FileNotFoundError:
         return {}
+    except (OSError, ValueError) as e:
+        log.error("❌ Failed to read state file", extra={"path": file_path, "error": str(e)})
+        return {}
+
+def read_json(file_path):
+    """load_json for handlers that only read, so they never see a save half done"""
+    with state_lock:
+        return load_json(file_path)
 
 def save_json(file_path, data):
-    with open(file_path, "w", encoding="utf-8") as f:
+    # Written next to the file and renamed over it, so readers see the old or the new version
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, file_path)
+
+def checkpoint_pool():
+    """Write COUNTRIES_FILE, USER_ASSIGNMENTS_FILE and QUARANTINE_FILE from memory and drop the journal they cover.
+
+    The snapshot is taken under state_lock, the files are written after it
+    is released.
+    """
+    global _checkpointed_seq
+    with state_lock:
+        countries = {country: dict(data, numbers=number_pool.free_numbers(country))
+                     for country, data in country_settings.items()}
+        assignments = dict(user_assignments)
+        quarantine = lease_scheduler.quarantined()
+        seq = lease_journal.rotate()
+    
+    with _checkpoint_lock:
+        if seq <= _checkpointed_seq:
+            return  # a newer snapshot is already on disk
+        save_json(USER_ASSIGNMENTS_FILE, assignments)
+        save_json(COUNTRIES_FILE, countries)
+        save_json(QUARANTINE_FILE, quarantine)
+        _checkpointed_seq = seq
+        lease_journal.committed(seq)
 
 # ======== User Approval System ========
 
@@ -90,121 +199,142 @@ def is_user_approved(user_id):
     """Check if user is approved to use the bot"""
     if user_id == ADMIN_USER_ID:
         return True
-    approved = load_json(APPROVED_USERS_FILE)
-    return str(user_id) in approved
+    return user_id in approved_members
 
 def add_pending_request(user_id, username=None, first_name=None, last_name=None):
     """Add user to pending requests"""
-    pending = load_json(PENDING_REQUESTS_FILE)
-    user_key = str(user_id)
+    if user_id in pending_members:
+        return False
+    with state_lock:
+        pending = load_json(PENDING_REQUESTS_FILE)
+        user_key = str(user_id)
     
-    if user_key not in pending:
-        pending[user_key] = {
-            "user_id": user_id,
-            "username": username or "N/A",
-            "first_name": first_name or "N/A",
-            "last_name": last_name or "",
-            "timestamp": time.time()
-        }
-        save_json(PENDING_REQUESTS_FILE, pending)
-        return True
-    return False
+        if user_key not in pending:
+            pending[user_key] = {
+                "user_id": user_id,
+                "username": username or "N/A",
+                "first_name": first_name or "N/A",
+                "last_name": last_name or "",
+                "timestamp": time.time()
+            }
+            save_json(PENDING_REQUESTS_FILE, pending)
+            pending_members.saved(pending)
+            return True
+        return False
 
 def approve_user(user_id, username=None, first_name=None):
     """Approve user and remove from pending"""
-    approved = load_json(APPROVED_USERS_FILE)
-    pending = load_json(PENDING_REQUESTS_FILE)
-    user_key = str(user_id)
-    
-    approved[user_key] = {
-        "user_id": user_id,
-        "username": username or "N/A",
-        "first_name": first_name or "User",
-        "approved_at": time.time()
-    }
-    save_json(APPROVED_USERS_FILE, approved)
+    with state_lock:
+        approved = load_json(APPROVED_USERS_FILE)
+        pending = load_json(PENDING_REQUESTS_FILE)
+        user_key = str(user_id)
+    
+        approved[user_key] = {
+            "user_id": user_id,
+            "username": username or "N/A",
+            "first_name": first_name or "User",
+            "approved_at": time.time()
+        }
+        save_json(APPROVED_USERS_FILE, approved)
+        approved_members.saved(approved)
     
-    if user_key in pending:
-        del pending[user_key]
-        save_json(PENDING_REQUESTS_FILE, pending)
+        if user_key in pending:
+            del pending[user_key]
+            save_json(PENDING_REQUESTS_FILE, pending)
+            pending_members.saved(pending)
     
-    print(f"✅ Approved user {user_id}")
-    return True
+        log.info("✅ Approved user", extra={"user": user_id})
+        return True
 
 def reject_user(user_id):
     """Reject user and remove from pending"""
-    pending = load_json(PENDING_REQUESTS_FILE)
-    user_key = str(user_id)
+    with state_lock:
+        pending = load_json(PENDING_REQUESTS_FILE)
+        user_key = str(user_id)
     
-    if user_key in pending:
-        del pending[user_key]
-        save_json(PENDING_REQUESTS_FILE, pending)
-        print(f"❌ Rejected user {user_id}")
-        return True
-    return False
+        if user_key in pending:
+            del pending[user_key]
+            save_json(PENDING_REQUESTS_FILE, pending)
+            pending_members.saved(pending)
+            log.info("❌ Rejected user", extra={"user": user_id})
+            return True
+        return False
 
 def remove_approved_user(user_id):
     """Remove user from approved list and return their number to the pool"""
-    approved = load_json(APPROVED_USERS_FILE)
-    assignments = load_json(USER_ASSIGNMENTS_FILE)
-    countries = load_json(COUNTRIES_FILE)
-    user_key = str(user_id)
+    with state_lock:
+        approved = load_json(APPROVED_USERS_FILE)
+        user_key = str(user_id)
     
-    number_returned = None
-    country_returned = None
+        number_returned = None
+        country_returned = None
     
-    # Check if user has an assigned number
-    if user_key in assignments:
-        number_returned = assignments[user_key].get("number")
-        country_returned = assignments[user_key].get("country")
+        # Check if user has an assigned number
+        if user_key in user_assignments:
+            number_returned = user_assignments[user_key].get("number")
+            country_returned = user_assignments[user_key].get("country")
         
-        # Return number to country pool
-        if country_returned in countries and number_returned:
-            if number_returned not in countries[country_returned]["numbers"]:
-                countries[country_returned]["numbers"].append(number_returned)
-                save_json(COUNTRIES_FILE, countries)
-                print(f"📱 Returned number {number_returned} to {country_returned}")
+            # Return number to country pool
+            number_pool.release(user_key, return_to_pool=True)
+            lease_scheduler.forget(user_key)
+            lease_journal.release(user_key, number_returned, country_returned, to_pool=True)
+            if number_pool.has_country(country_returned) and number_returned:
+                log.info("📱 Returned number to the pool",
+                         extra={"number_hash": number_hash(number_returned), "country": country_returned})
         
-        # Remove assignment
-        del assignments[user_key]
-        save_json(USER_ASSIGNMENTS_FILE, assignments)
-    
-    # Remove from approved list
-    if user_key in approved:
-        del approved[user_key]
-        save_json(APPROVED_USERS_FILE, approved)
-        print(f"🗑️ Removed user {user_id} from approved list")
-        return {"success": True, "number": number_returned, "country": country_returned}
-    
-    return {"success": False}
+            # Remove assignment
+            del user_assignments[user_key]
+    
+        # Remove from approved list
+        if user_key in approved:
+            del approved[user_key]
+            save_json(APPROVED_USERS_FILE, approved)
+            approved_members.saved(approved)
+            log.info("🗑️ Removed user from approved list", extra={"user": user_id})
+            return {"success": True, "number": number_returned, "country": country_returned}
+    
+        return {"success": False}
+
+def api_call(method, payload=None, timeout=None, max_retries=None):
+    """Call a Bot API method and return the decoded JSON response"""
+    return api_transport.call(method, payload or {}, timeout, max_retries)
 
-def send_message(chat_id, text, reply_markup=None):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+def api_download(file_path, timeout=None):
+    """Download a file returned by getFile"""
+    return api_transport.download(file_path, timeout)
+
+def run_cpu_bound(func, *args):
+    """Run CPU-heavy work on the process pool when one is installed"""
+    if cpu_executor is None:
+        return func(*args)
+    return cpu_executor.submit(func, *args).result()
+
+def send_message(chat_id, text, reply_markup=None, max_retries=None):
     payload = {
         "chat_id": chat_id,
         "text": text,
         "parse_mode": "HTML"
     }
     if reply_markup:
-        payload["reply_markup"] = json.dumps(reply_markup)
+        payload["reply_markup"] = reply_markup if isinstance(reply_markup, str) else json.dumps(reply_markup)
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        return response.json()
+        response = api_call("sendMessage", payload, max_retries=max_retries)
     except Exception as e:
-        print(f"❌ Error sending message: {e}")
+        log.warning("⚠️ Error sending message", extra={"chat": chat_id, "error": str(e)})
         return None
+    if response and response.get("ok"):
+        board.mark("number_last_send")
+    return response
 
 def answer_callback(callback_query_id, text=""):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/answerCallbackQuery"
     payload = {"callback_query_id": callback_query_id, "text": text}
     try:
-        requests.post(url, json=payload, timeout=5)
-    except:
-        pass
+        api_call("answerCallbackQuery", payload)
+    except Exception as e:
+        log.warning("⚠️ Error answering callback", extra={"error": str(e)})
 
 def edit_message(chat_id, message_id, text, reply_markup=None):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/editMessageText"
     payload = {
         "chat_id": chat_id,
         "message_id": message_id,
@@ -212,12 +342,12 @@ def edit_message(chat_id, message_id, text, reply_markup=None):
         "parse_mode": "HTML"
     }
     if reply_markup:
-        payload["reply_markup"] = json.dumps(reply_markup)
+        payload["reply_markup"] = reply_markup if isinstance(reply_markup, str) else json.dumps(reply_markup)
     
     try:
-        requests.post(url, json=payload, timeout=10)
-    except:
-        pass
+        api_call("editMessageText", payload)
+    except Exception as e:
+        log.warning("⚠️ Error editing message", extra={"chat": chat_id, "error": str(e)})
 
 def get_admin_menu():
     """Admin keyboard menu"""
@@ -250,14 +380,61 @@ def handle_admin_add_country(chat_id, message):
     country_name = parts[1]
     flag = parts[2]
     
-    countries = load_json(COUNTRIES_FILE)
-    if country_name not in countries:
-        countries[country_name] = {"flag": flag, "numbers": []}
-        save_json(COUNTRIES_FILE, countries)
+    with state_lock:
+        added = country_name not in country_settings
+        if added:
+            country_settings[country_name] = {"flag": flag}
+            number_pool.add_country(country_name, flag)
+    
+    if added:
+        checkpoint_pool()
         send_message(chat_id, f"✅ Country added: {flag} {country_name}")
     else:
         send_message(chat_id, f"⚠️ Country {country_name} already exists!")
 
+def import_numbers_to_country(country, file_content, filename, progress=None):
+    """Stream an uploaded file into a country, returns ImportStats or None"""
+    from number_import import import_numbers, normalize_numbers
+    from number_validation import calling_code_for
+    
+    with state_lock:
+        if country not in country_settings:
+            return None
+        calling_code = calling_code_for(country, country_settings[country])
+
+    def commit(stats):
+        with state_lock:
+            if country not in country_settings:
+                # Deleted while the upload was running
+                number_pool.remove_country(country)
+                raise KeyError(country)
+        checkpoint_pool()
+
+    try:
+        return import_numbers(number_pool, country, file_content, filename, commit=commit, progress=progress,
+                              normalize=lambda chunk: run_cpu_bound(normalize_numbers, chunk),
+                              calling_code=calling_code)
+    except KeyError:
+        return None
+
+def delete_country(country):
+    with state_lock:
+        if country not in country_settings:
+            return False
+        del country_settings[country]
+        number_pool.remove_country(country)
+    checkpoint_pool()
+    return True
+
+def clear_country_numbers(country):
+    """Remove all free numbers of a country, returns how many or None"""
+    with state_lock:
+        if country not in country_settings:
+            return None
+        num_count = number_pool.clear(country)
+    checkpoint_pool()
+    return num_count
+
 def handle_admin_add_number(chat_id, message):
     """
     Usage: /addnumber <country_name> <phone_number>
@@ -271,108 +448,46 @@ def handle_admin_add_number(chat_id, message):
     country_name = parts[1]
     number = parts[2]
     
-    countries = load_json(COUNTRIES_FILE)
-    if country_name not in countries:
-        send_message(chat_id, f"❌ Country '{country_name}' not found! Add it first with /addcountry")
-        return
-    
-    if number not in countries[country_name]["numbers"]:
-        countries[country_name]["numbers"].append(number)
-        save_json(COUNTRIES_FILE, countries)
-        send_message(chat_id, f"✅ Number added to {countries[country_name]['flag']} {country_name}: +{number}")
-    else:
-        send_message(chat_id, f"⚠️ Number already exists in {country_name}!")
+    # Reply after releasing the lock, the other handlers shouldn't wait for Telegram
+    with state_lock:
+        if country_name not in country_settings:
+            reply = f"❌ Country '{country_name}' not found! Add it first with /addcountry"
+        elif number_pool.add_numbers(country_name, [number])[0]:
+            lease_journal.free(number, country_name)
+            reply = f"✅ Number added to {number_pool.flag(country_name)} {country_name}: +{number}"
+        else:
+            reply = "⚠️ Number already exists in the pool or is assigned!"
+    send_message(chat_id, reply)
 
 def download_file(file_id):
     """Download file from Telegram"""
     try:
         # Get file path
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile"
-        response = requests.get(url, params={"file_id": file_id}, timeout=10)
-        result = response.json()
+        result = api_call("getFile", {"file_id": file_id})
         
-        if not result.get("ok"):
+        if not result or not result.get("ok"):
             return None
         
         file_path = result["result"]["file_path"]
         
         # Download file
-        file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-        file_response = requests.get(file_url, timeout=30)
-        
-        return file_response.content
+        return api_download(file_path)
     except Exception as e:
-        print(f"❌ Error downloading file: {e}")
+        log.warning("⚠️ Error downloading file", extra={"error": str(e)})
         return None
 
-def parse_numbers_from_file(file_content, filename):
-    """Parse numbers from Excel, CSV, or Text file"""
-    numbers = []
-    
-    try:
-        if filename.endswith('.xlsx') or filename.endswith('.xls'):
-            # Excel file - read as string to avoid float conversion
-            df = pd.read_excel(io.BytesIO(file_content), dtype=str)
-            # Get all rows from first column (pandas already skips header)
-            if len(df.columns) > 0:
-                numbers = df.iloc[:, 0].tolist()
-        
-        elif filename.endswith('.csv'):
-            # Try reading with header first
-            try:
-                df = pd.read_csv(io.BytesIO(file_content), dtype=str)
-                if len(df.columns) > 0:
-                    numbers = df.iloc[:, 0].tolist()
-            except:
-                # If fails, try without header
-                df = pd.read_csv(io.BytesIO(file_content), header=None, dtype=str)
-                if len(df.columns) > 0:
-                    numbers = df.iloc[:, 0].tolist()
-        
-        else:
-            # Text file
-            text = file_content.decode('utf-8')
-            # Split by newlines and clean
-            numbers = [line.strip() for line in text.split('\n') if line.strip()]
-        
-        # Clean numbers: remove spaces, dashes, plus signs, and .0 suffix
-        cleaned_numbers = []
-        for num in numbers:
-            cleaned = str(num).strip()
-            
-            # Skip if it's NaN or empty
-            if cleaned.lower() in ['nan', 'none', '']:
-                continue
-            
-            # Remove .0 suffix from Excel float conversion
-            if cleaned.endswith('.0'):
-                cleaned = cleaned[:-2]
-            
-            # Remove formatting
-            cleaned = cleaned.replace(' ', '').replace('-', '').replace('+', '')
-            
-            # Only add if it looks like a phone number (digits only, reasonable length)
-            if cleaned.isdigit() and 8 <= len(cleaned) <= 15:
-                cleaned_numbers.append(cleaned)
-        
-        return cleaned_numbers
-    
-    except Exception as e:
-        print(f"❌ Error parsing file: {e}")
-        return []
-
 def show_country_selection_for_upload(chat_id):
     """Show country selection for uploading numbers"""
-    countries = load_json(COUNTRIES_FILE)
+    _, rows = number_pool.availability()
     
-    if not countries:
+    if not rows:
         send_message(chat_id, "⚠️ No countries available. Add a country first with /addcountry")
         return
     
     keyboard = {"inline_keyboard": []}
-    for country, data in countries.items():
+    for country, flag, _ in rows:
         keyboard["inline_keyboard"].append([
-            {"text": f"{data['flag']} {country}", "callback_data": f"upload_{country}"}
+            {"text": f"{flag} {country}", "callback_data": f"upload_{country}"}
         ])
     
     send_message(chat_id, "🌍 <b>Select country to upload numbers:</b>", reply_markup=keyboard)
@@ -382,20 +497,20 @@ def handle_upload_numbers(chat_id, user_id):
     show_country_selection_for_upload(chat_id)
 
 def handle_admin_list(chat_id):
-    countries = load_json(COUNTRIES_FILE)
-    if not countries:
+    _, rows = number_pool.availability()
+    if not rows:
         send_message(chat_id, "📋 No countries added yet.\n\nUse /addcountry to add countries.")
         return
     
     msg = "📋 <b>Available Countries & Numbers:</b>\n\n"
-    for country, data in countries.items():
-        msg += f"{data['flag']} <b>{country}</b>\n"
-        if data['numbers']:
-            msg += f"   📱 Numbers: {len(data['numbers'])}\n"
-            for num in data['numbers'][:5]:
+    for country, flag, count in rows:
+        msg += f"{flag} <b>{country}</b>\n"
+        if count:
+            msg += f"   📱 Numbers: {count}\n"
+            for num in number_pool.peek(country, 5):
                 msg += f"      • +{num}\n"
-            if len(data['numbers']) > 5:
-                msg += f"      ... and {len(data['numbers']) - 5} more\n"
+            if count > 5:
+                msg += f"      ... and {count - 5} more\n"
         else:
             msg += "   ⚠️ No numbers available\n"
         msg += "\n"
@@ -442,7 +557,7 @@ def handle_start(chat_id, user_id, username=None, first_name=None, last_name=Non
             }
             
             send_message(ADMIN_USER_ID, user_info, reply_markup=keyboard)
-            print(f"🔔 New access request from user {user_id} sent to admin")
+            log.info("🔔 New access request sent to admin", extra={"user": user_id})
         else:
             # Already pending
             send_message(
@@ -450,99 +565,71 @@ def handle_start(chat_id, user_id, username=None, first_name=None, last_name=Non
                 "⏳ <b>Request Already Sent</b>\n\nYour access request is pending admin approval.\nPlease wait for confirmation."
             )
 
+def cached_view(name, build):
+    """Build a view of number_pool.availability(), reused until the pool's version changes"""
+    cached = _view_cache.get(name)
+    if cached and cached[0] == number_pool.version:
+        return cached[1]
+    version, rows = number_pool.availability()
+    view = build(rows)
+    _view_cache[name] = (version, view)
+    return view
+
+def build_country_picker(rows):
+    """Serialized keyboard of countries with free numbers, or None"""
+    buttons = [
+        [{"text": f"{flag} {country} ({count} available)", "callback_data": f"select_{country}"}]
+        for country, flag, count in rows if count > 0
+    ]
+    return json.dumps({"inline_keyboard": buttons}) if buttons else None
+
 def show_country_selection(chat_id, user_id):
-    countries = load_json(COUNTRIES_FILE)
-    assignments = load_json(USER_ASSIGNMENTS_FILE)
-    
-    # Get all currently assigned numbers
-    all_assigned_numbers = set()
-    for user_data in assignments.values():
-        if "number" in user_data:
-            all_assigned_numbers.add(user_data["number"])
-    
-    # Filter countries that have available (unassigned) numbers
-    available_countries = {}
-    for country, data in countries.items():
-        if "numbers" in data:
-            # Count how many numbers are truly available (not assigned)
-            available_nums = [num for num in data["numbers"] if num not in all_assigned_numbers]
-            if available_nums:
-                available_countries[country] = data
-    
-    if not available_countries:
+    markup = cached_view("country_picker", build_country_picker)
+    if not markup:
         send_message(chat_id, "⚠️ No numbers available. Please try again later.")
         return
     
-    keyboard = {"inline_keyboard": []}
-    for country, data in available_countries.items():
-        # Show count of available numbers
-        available_count = len([num for num in data["numbers"] if num not in all_assigned_numbers])
-        keyboard["inline_keyboard"].append([
-            {"text": f"{data['flag']} {country} ({available_count} available)", "callback_data": f"select_{country}"}
-        ])
-    
-    send_message(chat_id, "🌍 <b>Select a Country:</b>", reply_markup=keyboard)
+    send_message(chat_id, "🌍 <b>Select a Country:</b>", reply_markup=markup)
 
 def assign_number_to_user(user_id, country):
-    countries = load_json(COUNTRIES_FILE)
-    assignments = load_json(USER_ASSIGNMENTS_FILE)
-    
-    if country not in countries or not countries[country]["numbers"]:
-        return None
-    
-    user_key = str(user_id)
-    
-    # Get all currently assigned numbers across all users
-    all_assigned_numbers = set()
-    for uid, data in assignments.items():
-        if "number" in data:
-            all_assigned_numbers.add(data["number"])
-    
-    # Get list of available numbers (excluding already assigned ones)
-    available_numbers = [
-        num for num in countries[country]["numbers"] 
-        if num not in all_assigned_numbers
-    ]
-    
-    if not available_numbers:
-        print(f"⚠️ No available numbers left in {country}")
-        return None
-    
-    # Check if user is changing number (already has one)
-    if user_key in assignments:
-        old_number = assignments[user_key]["number"]
-        old_country = assignments[user_key]["country"]
-        
-        # Remove old number permanently (don't add back to list)
-        if old_country in countries and old_number in countries[old_country]["numbers"]:
-            countries[old_country]["numbers"].remove(old_number)
-            print(f"🗑️ Removed old number {old_number} from {old_country}")
-    
-    # Take first available number from the list
-    selected_number = available_numbers[0]
-    
-    # Sanity check: Make sure number is not already assigned
-    if selected_number in all_assigned_numbers:
-        print(f"❌ ERROR: Number {selected_number} is already assigned!")
-        return None
+    started = time.monotonic()
+    with state_lock:
+        if not number_pool.has_country(country):
+            return None
     
-    # Remove the selected number from available numbers
-    if selected_number in countries[country]["numbers"]:
-        countries[country]["numbers"].remove(selected_number)
-    save_json(COUNTRIES_FILE, countries)
+        user_key = str(user_id)
+        old_number = number_pool.lease_of(user_key)
+        old_owner = number_pool.owner(old_number) if old_number else None
+    
+        # Take the next free number; the old one is dropped for good unless
+        # changed numbers are recycled through the quarantine
+        selected_number = number_pool.lease(user_key, country)
+        if not selected_number:
+            log.warning("⚠️ No available numbers left", extra={"country": country})
+            return None
     
-    # Assign to user
-    assignments[user_key] = {
-        "number": selected_number,
-        "country": country,
-        "timestamp": time.time()
-    }
-    save_json(USER_ASSIGNMENTS_FILE, assignments)
+        if old_number and RECYCLE_CHANGED_NUMBERS and old_owner:
+            until = lease_scheduler.quarantine_until()
+            lease_journal.release(user_key, old_number, old_owner[1], to_pool=False, until=until)
+            lease_scheduler.quarantine(old_number, old_owner[1], until)
+            log.info("♻️ Old number quarantined for reuse", extra={"number_hash": number_hash(old_number)})
+        elif old_number:
+            log.info("🗑️ Removed old number", extra={"number_hash": number_hash(old_number)})
+    
+        # Assign to user
+        user_assignments[user_key] = {
+            "number": selected_number,
+            "country": country,
+            "timestamp": time.time()
+        }
+        lease_journal.lease(user_key, selected_number, country, user_assignments[user_key]["timestamp"])
+        lease_scheduler.track(user_key, selected_number, country, user_assignments[user_key]["timestamp"])
     
-    print(f"✅ Assigned {selected_number} from {country} to user {user_id}")
-    print(f"📊 Remaining numbers in {country}: {len(countries[country]['numbers'])}")
+        log.info("✅ Assigned number", extra={"user": user_id, "number_hash": number_hash(selected_number),
+                                             "country": country, "free": number_pool.free_count(country)})
     
-    return selected_number
+        assign_seconds.observe(time.monotonic() - started)
+        return selected_number
 
 def handle_status(chat_id, user_id):
     # Check if user is approved
@@ -550,19 +637,16 @@ def handle_status(chat_id, user_id):
         send_message(chat_id, "🔒 <b>Access Denied</b>\n\nYou need admin approval to use this bot.\nUse /start to request access.")
         return
     
-    assignments = load_json(USER_ASSIGNMENTS_FILE)
-    user_key = str(user_id)
+    assignment = user_assignments.get(str(user_id))
     
-    if user_key not in assignments:
+    if not assignment:
         send_message(chat_id, "❌ You don't have a number assigned yet. Use /getnumber to get one.")
         return
     
-    number = assignments[user_key]["number"]
-    country = assignments[user_key]["country"]
+    number = assignment["number"]
+    country = assignment["country"]
     
-    countries = load_json(COUNTRIES_FILE)
-    country_data = countries.get(country, {})
-    flag = country_data.get("flag", "🌍")
+    flag = number_pool.flag(country)
     
     # Get recent OTPs for this number
     recent_otps = get_recent_otps_for_number(number)
@@ -602,18 +686,20 @@ def get_recent_otps_for_number(number):
     except:
         return []
 
+def build_country_list(rows):
+    if not rows:
+        return None
+    msg = "🌍 <b>Available Countries:</b>\n\n"
+    for country, flag, count in rows:
+        msg += f"{flag} {country}: {count} numbers\n"
+    return msg
+
 def handle_countries(chat_id):
-    countries = load_json(COUNTRIES_FILE)
-    
-    if not countries:
+    msg = cached_view("country_list", build_country_list)
+    if not msg:
         send_message(chat_id, "⚠️ No countries available yet.")
         return
     
-    msg = "🌍 <b>Available Countries:</b>\n\n"
-    for country, data in countries.items():
-        available = len([n for n in data.get("numbers", [])])
-        msg += f"{data.get('flag', '🌍')} {country}: {available} numbers\n"
-    
     send_message(chat_id, msg)
 
 def handle_get_number(chat_id, user_id):
@@ -623,9 +709,7 @@ def handle_get_number(chat_id, user_id):
         send_message(chat_id, "🔒 <b>Access Denied</b>\n\nYou need admin approval to use this bot.\nUse /start to request access.")
         return
     
-    countries = load_json(COUNTRIES_FILE)
-    
-    if not countries:
+    if not number_pool.countries():
         send_message(chat_id, "⚠️ No countries available yet. Please try again later.")
         return
     
@@ -646,13 +730,10 @@ def handle_help(chat_id):
 
 def handle_admin_statistics(chat_id):
     """Handle admin statistics"""
-    countries = load_json(COUNTRIES_FILE)
-    assignments = load_json(USER_ASSIGNMENTS_FILE)
-    
-    total_countries = len(countries)
-    total_numbers = sum(len(data.get("numbers", [])) for data in countries.values())
-    total_users = len(assignments)
-    active_numbers = len(set(a["number"] for a in assignments.values()))
+    total_countries = len(number_pool.countries())
+    total_numbers = number_pool.total_free()
+    total_users = len(user_assignments)
+    active_numbers = number_pool.total_leased()
     
     msg = "📊 <b>Bot Statistics:</b>\n\n"
     msg += f"🌍 Total Countries: {total_countries}\n"
@@ -660,59 +741,63 @@ def handle_admin_statistics(chat_id):
     msg += f"👥 Total Users: {total_users}\n"
     msg += f"🔥 Active Numbers: {active_numbers}\n"
     
+    leases = lease_scheduler.snapshot()
+    msg += f"⌛ Expired leases: {leases.get('expired_ttl', 0)} TTL, {leases.get('expired_idle', 0)} idle\n"
+    msg += f"♻️ In quarantine: {leases['in_quarantine']}, recycled: {leases.get('recycled', 0)}\n"
+    
     send_message(chat_id, msg)
 
 def handle_admin_active_users(chat_id):
     """Handle admin active users list"""
-    assignments = load_json(USER_ASSIGNMENTS_FILE)
-    countries = load_json(COUNTRIES_FILE)
+    with state_lock:
+        total = len(user_assignments)
+        first = list(itertools.islice(user_assignments.items(), 10))
     
-    if not assignments:
+    if not total:
         send_message(chat_id, "👥 No active users yet.")
         return
     
     msg = "👥 <b>Active Users:</b>\n\n"
-    for user_id, assignment in list(assignments.items())[:10]:
+    for user_id, assignment in first:
         country = assignment["country"]
         number = assignment["number"]
-        flag = countries.get(country, {}).get("flag", "🌍")
+        flag = number_pool.flag(country)
         msg += f"• User {user_id}\n"
         msg += f"  {flag} {country}: +{number}\n\n"
     
-    if len(assignments) > 10:
-        msg += f"... and {len(assignments) - 10} more users"
+    if total > 10:
+        msg += f"... and {total - 10} more users"
     
     send_message(chat_id, msg)
 
 def handle_admin_delete_country(chat_id, user_id):
     """Handle delete country"""
-    countries = load_json(COUNTRIES_FILE)
+    _, rows = number_pool.availability()
     
-    if not countries:
+    if not rows:
         send_message(chat_id, "⚠️ No countries available to delete.")
         return
     
     keyboard = {"inline_keyboard": []}
-    for country, data in countries.items():
+    for country, flag, _ in rows:
         keyboard["inline_keyboard"].append([
-            {"text": f"🗑️ {data['flag']} {country}", "callback_data": f"delete_{country}"}
+            {"text": f"🗑️ {flag} {country}", "callback_data": f"delete_{country}"}
         ])
     
     send_message(chat_id, "🗑️ <b>Select country to delete:</b>", reply_markup=keyboard)
 
 def handle_admin_clear_numbers(chat_id, user_id):
     """Handle clear numbers from a country"""
-    countries = load_json(COUNTRIES_FILE)
+    _, rows = number_pool.availability()
     
-    if not countries:
+    if not rows:
         send_message(chat_id, "⚠️ No countries available.")
         return
     
     keyboard = {"inline_keyboard": []}
-    for country, data in countries.items():
-        num_count = len(data.get("numbers", []))
+    for country, flag, num_count in rows:
         keyboard["inline_keyboard"].append([
-            {"text": f"🧹 {data['flag']} {country} ({num_count} numbers)", "callback_data": f"clear_{country}"}
+            {"text": f"🧹 {flag} {country} ({num_count} numbers)", "callback_data": f"clear_{country}"}
         ])
     
     send_message(chat_id, "🧹 <b>Select country to clear all numbers:</b>", reply_markup=keyboard)
@@ -727,14 +812,20 @@ def handle_admin_broadcast(chat_id, user_id):
         "⚠️ This will be sent to ALL users who have a number assigned."
     )
 
+def start_broadcast(chat_id, text):
+    """Queue a broadcast to every user with a number; progress is edited into one message"""
+    with state_lock:
+        recipients = list(user_assignments)
+    status = send_message(chat_id, f"📢 <b>Broadcast</b> — ⏳ Queued for {len(recipients)} users...")
+    status_message_id = (status or {}).get("result", {}).get("message_id")
+    job_id = broadcaster.enqueue(text, recipients, chat_id, status_message_id)
+    log.info("📢 Broadcast queued", extra={"job": job_id, "count": len(recipients)})
+
 def handle_manage_members(chat_id):
     """Handle member management"""
-    approved = load_json(APPROVED_USERS_FILE)
-    pending = load_json(PENDING_REQUESTS_FILE)
-    
     msg = "🔐 <b>Member Management</b>\n\n"
-    msg += f"✅ Approved: {len(approved)}\n"
-    msg += f"⏳ Pending: {len(pending)}\n"
+    msg += f"✅ Approved: {len(approved_members)}\n"
+    msg += f"⏳ Pending: {len(pending_members)}\n"
     
     keyboard = {"inline_keyboard": [
         [{"text": "⏳ View Pending Requests", "callback_data": "view_pending"}],
@@ -745,7 +836,7 @@ def handle_manage_members(chat_id):
 
 def show_pending_requests(chat_id):
     """Show pending access requests"""
-    pending = load_json(PENDING_REQUESTS_FILE)
+    pending = read_json(PENDING_REQUESTS_FILE)
     
     if not pending:
         send_message(chat_id, "⏳ No pending requests.")
@@ -763,7 +854,7 @@ def show_pending_requests(chat_id):
 
 def show_approved_members(chat_id):
     """Show approved members"""
-    approved = load_json(APPROVED_USERS_FILE)
+    approved = read_json(APPROVED_USERS_FILE)
     
     if not approved:
         send_message(chat_id, "✅ No approved members yet.")
@@ -781,428 +872,616 @@ def show_approved_members(chat_id):
     send_message(chat_id, msg, reply_markup=keyboard)
 
 # Callback Handler
-def handle_callback(callback_query):
-    query_id = callback_query["id"]
-    data = callback_query["data"]
-    user_id = callback_query["from"]["id"]
-    chat_id = callback_query["message"]["chat"]["id"]
-    message_id = callback_query["message"]["message_id"]
-    
-    # ===== Member Management Callbacks (Admin Only) =====
-    
-    # Approve user
-    if data.startswith("approve_user:") and user_id == ADMIN_USER_ID:
-        target_user_id = int(data.split(":")[1])
-        pending = load_json(PENDING_REQUESTS_FILE)
-        user_data = pending.get(str(target_user_id), {})
-        
-        username = user_data.get("username")
-        first_name = user_data.get("first_name")
-        
-        approve_user(target_user_id, username, first_name)
-        
-        edit_message(chat_id, message_id, "✅ <b>User Approved!</b>\n\nUser has been granted access to the bot.")
-        send_message(target_user_id, "🎉 <b>Access Granted!</b>\n\nYour request has been approved. You can now use the bot.\n\nUse /getnumber to get a number.")
-        answer_callback(query_id, "✅ User approved!")
-        return
-    
-    # Reject user
-    if data.startswith("reject_user:") and user_id == ADMIN_USER_ID:
-        target_user_id = int(data.split(":")[1])
-        reject_user(target_user_id)
-        
-        edit_message(chat_id, message_id, "❌ <b>Request Rejected</b>\n\nUser has been denied access.")
-        send_message(target_user_id, "❌ <b>Access Denied</b>\n\nYour request to use this bot has been rejected by the admin.")
-        answer_callback(query_id, "❌ Request rejected!")
-        return
+# OTP Monitor (runs in background)
+def collect_otp_deliveries():
+    """Read new otp_queue.json lines and route them to their users.
     
-    # View pending requests
-    if data == "view_pending" and user_id == ADMIN_USER_ID:
-        show_pending_requests(chat_id)
-        answer_callback(query_id)
-        return
+    Returns (deliveries, position): a list of (user_id, message, trace) to send
+    and the (byte offset, line count) to store with save_otp_position once they
+    are sent, or None if the queue file does not exist yet. ``trace`` goes to
+    otp_latency.delivered() once the message is out.
     
-    # View approved members
-    if data == "view_approved" and user_id == ADMIN_USER_ID:
-        show_approved_members(chat_id)
-        answer_callback(query_id)
-        return
+    Only the bytes after the stored offset are read, so a poll costs the new
+    lines, not the whole queue.
+    """
+    board.mark("number_otp_scan")
+    if not os.path.exists(OTP_QUEUE_FILE):
+        return None
     
-    # View specific pending user details
-    if data.startswith("pending_user:") and user_id == ADMIN_USER_ID:
-        target_user_id = data.split(":")[1]
-        pending = load_json(PENDING_REQUESTS_FILE)
-        user_data = pending.get(target_user_id, {})
-        
-        if user_data:
-            msg = f"👤 <b>Pending User Details</b>\n\n"
-            msg += f"🆔 User ID: <code>{user_data.get('user_id')}</code>\n"
-            msg += f"👤 Name: {user_data.get('first_name', 'N/A')} {user_data.get('last_name', '')}\n"
-            msg += f"📧 Username: @{user_data.get('username', 'N/A')}\n"
-            
-            keyboard = {"inline_keyboard": [[
-                {"text": "✅ Approve", "callback_data": f"approve_user:{user_data.get('user_id')}"},
-                {"text": "❌ Reject", "callback_data": f"reject_user:{user_data.get('user_id')}"}
-            ]]}
+    offset, line_count = load_otp_position()
+    
+    # Read new OTP entries; a line the SMS bot is still writing waits for the next poll
+    new_lines = []
+    with open(OTP_QUEUE_FILE, "rb") as f:
+        if offset > os.fstat(f.fileno()).st_size:
+            offset = line_count = 0   # the queue was replaced
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            line_count += 1
+            new_lines.append(line)
+    
+    deliveries = []
+    for line in new_lines:
+        try:
+            otp_data = json.loads(line)
+            number = otp_data.get("number")
+            otp = otp_data.get("otp")
+            service = otp_data.get("service", "Unknown")
             
-            send_message(chat_id, msg, reply_markup=keyboard)
-        answer_callback(query_id)
-        return
+            # Find user with this number
+            owner = number_pool.owner(number)
+            if owner:
+                user_id, country = owner
+                lease_scheduler.touch(user_id)
+                flag = number_pool.flag(country)
+                
+                msg = f"🌍 <b>Country:</b> {flag} {country}\n"
+                msg += f"🔢 <b>Number:</b> {number}\n"
+                msg += f"🔑 <b>OTP:</b> <code>{otp}</code>\n"
+                msg += f"⚙️ <b>Service:</b> {service}\n"
+                msg += f"💰 <b>Reward:</b> 0.0050\n"
+                msg += f"💵 <b>Balance:</b> 0.0100"
+                
+                trace = {
+                    "country": country,
+                    "service": service,
+                    "panel_ts": otp_data.get("panel_ts"),
+                    "scraped_at": otp_data.get("scraped_at"),
+                    "enqueued_at": otp_data.get("enqueued_at"),
+                    "number_hash": number_hash(number)
+                }
+                deliveries.append((user_id, msg, trace))
+        except Exception as e:
+            otp_log.warning("⚠️ Error processing OTP", extra={"error": str(e)})
     
-    # View specific approved user details
-    if data.startswith("approved_user:") and user_id == ADMIN_USER_ID:
-        target_user_id = data.split(":")[1]
-        approved = load_json(APPROVED_USERS_FILE)
-        user_data = approved.get(target_user_id, {})
-        
-        if user_data:
-            msg = f"✅ <b>Approved Member</b>\n\n"
-            msg += f"🆔 User ID: <code>{user_data.get('user_id')}</code>\n"
-            msg += f"👤 Name: {user_data.get('first_name', 'User')}\n"
-            msg += f"📧 Username: @{user_data.get('username', 'N/A')}\n"
+    return deliveries, (offset, line_count)
+
+def load_otp_position():
+    """(byte offset, line count) of the OTP queue already handled.
+    
+    LAST_OTP_CHECK_FILE holds "<offset> <lines>"; a file from before offsets
+    were kept holds only the line count and is converted by skipping that
+    many lines once.
+    """
+    try:
+        with open(LAST_OTP_CHECK_FILE, "r") as f:
+            fields = f.read().split()
+        if len(fields) >= 2:
+            return int(fields[0]), int(fields[1])
+        line_count = int(fields[0]) if fields else 0
+    except (OSError, ValueError):
+        return 0, 0
+    offset = 0
+    lines = 0
+    try:
+        with open(OTP_QUEUE_FILE, "rb") as f:
+            for line in f:
+                if lines >= line_count or not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                lines += 1
+    except FileNotFoundError:
+        pass
+    return offset, lines
+
+def log_otp_delivery(user_id, trace, ok, error=None):
+    """One record per OTP delivery, timed from the SMS bot's enqueue"""
+    fields = {"user": user_id, "number_hash": trace.get("number_hash"), "country": trace.get("country"),
+              "service": trace.get("service"), "stage": "deliver"}
+    if trace.get("enqueued_at"):
+        fields["duration_ms"] = round((time.time() - trace["enqueued_at"]) * 1000)
+    if ok:
+        otp_log.info("✅ OTP sent", extra=fields)
+    else:
+        if error:
+            fields["error"] = error
+        otp_log.warning("⚠️ Failed to send OTP", extra=fields)
+
+def save_otp_position(position):
+    offset, line_count = position
+    with open(LAST_OTP_CHECK_FILE, "w") as f:
+        f.write(f"{offset} {line_count}")
+    # The status board compares lines with the SMS bot's enqueue count
+    board.set("number_otp_offset", line_count)
+
+def monitor_otp_queue():
+    """Monitor otp_queue.json and send OTPs to users"""
+    otp_log.info("🔍 OTP Monitor started")
+    
+    while True:
+        try:
+            result = collect_otp_deliveries()
+            if result is None:
+                time.sleep(5)
+                continue
             
-            keyboard = {"inline_keyboard": [[
-                {"text": "🗑️ Remove Access", "callback_data": f"remove_user:{user_data.get('user_id')}"}
-            ]]}
+            deliveries, position = result
+            for user_id, msg, trace in deliveries:
+                response = send_message(user_id, msg)
+                ok = bool(response and response.get("ok"))
+                if ok:
+                    otp_latency.delivered(trace)
+                log_otp_delivery(user_id, trace, ok)
             
-            send_message(chat_id, msg, reply_markup=keyboard)
-        answer_callback(query_id)
-        return
-    
-    # Remove user access
-    if data.startswith("remove_user:") and user_id == ADMIN_USER_ID:
-        target_user_id = int(data.split(":")[1])
-        result = remove_approved_user(target_user_id)
+            # Update last position
+            save_otp_position(position)
         
-        if result.get("success"):
-            msg = "🗑️ <b>Access Removed</b>\n\nUser's access has been revoked."
-            if result.get("number"):
-                msg += f"\n\n📱 Number returned: +{result.get('number')}"
-                msg += f"\n🌍 Country: {result.get('country')}"
-            
-            send_message(chat_id, msg)
-            send_message(target_user_id, "⚠️ <b>Access Revoked</b>\n\nYour access to this bot has been removed by the admin.")
-            answer_callback(query_id, "🗑️ Access removed!")
-        else:
-            answer_callback(query_id, "❌ Failed to remove user!")
+        except Exception as e:
+            otp_log.warning("⚠️ OTP Monitor error", extra={"error": str(e)})
+        
+        time.sleep(2)
+
+# Lease expiry (runs in background)
+def expire_leases():
+    """End leases that are past their TTL/idle deadline and recycle numbers out of quarantine"""
+    expired = lease_scheduler.due()
+    if expired:
+        with state_lock:
+            ended = []
+            for user_key, number, country, reason in expired:
+                if number_pool.lease_of(user_key) != number:
+                    continue
+                number_pool.release(user_key, return_to_pool=False)
+                if user_assignments.get(user_key, {}).get("number") == number:
+                    del user_assignments[user_key]
+                # Journaled first: the entry is what brings the quarantine back after a crash
+                until = lease_scheduler.quarantine_until()
+                lease_journal.release(user_key, number, country, to_pool=False, until=until)
+                lease_scheduler.quarantine(number, country, until)
+                ended.append((user_key, number, reason))
+        
+        for user_key, number, reason in ended:
+            log.info("⌛ Lease expired", extra={"user": user_key, "number_hash": number_hash(number), "reason": reason})
+            why = "the lease time ran out" if reason == "ttl" else "a while without OTPs"
+            send_message(int(user_key), f"⌛ <b>Number Expired</b>\n\nYour number +{number} was released after {why}.\nUse /getnumber to get a new one.")
+    
+    # Under the lock, so no checkpoint falls between leaving the quarantine
+    # and the journal entry that puts the number back in the pool
+    with state_lock:
+        ready = lease_scheduler.released()
+        for number, country in ready:
+            if number_pool.has_country(country) and number_pool.add_numbers(country, [number])[0]:
+                lease_journal.free(number, country)
+    if ready:
+        log.info("♻️ Numbers back in the pool after quarantine", extra={"count": len(ready)})
+    
+    if lease_journal.due():
+        checkpoint_pool()
+
+def run_lease_expiry():
+    while True:
+        try:
+            expire_leases()
+        except Exception as e:
+            log.warning("⚠️ Lease expiry error", extra={"error": str(e)})
+        time.sleep(LEASE_TICK_SECONDS)
+
+# ======== Update Routing ========
+
+router = Router(is_admin=lambda user_id: user_id == ADMIN_USER_ID)
+
+def route_broadcast_text(ctx):
+    if ctx.text:
+        start_broadcast(ctx.chat_id, ctx.text)
+        del admin_states[ctx.user_id]
+
+broadcast_text_route = Route("broadcast_text", route_broadcast_text, admin=True)
+
+def admin_state_middleware(ctx, route):
+    """While the admin is writing a broadcast, anything that isn't an admin command is the broadcast"""
+    if ctx.kind != "message" or not ctx.is_admin or (route is not None and route.admin):
+        return route
+    if admin_states.get(ctx.user_id, {}).get("action") == "broadcast" and "document" not in ctx.message:
+        return broadcast_text_route
+    return route
+
+flood_control = FloodControl()
+
+def route_throttled(ctx):
+    if ctx.kind == "callback":
+        answer_callback(ctx.query_id, "⏳ Too many requests, please wait a moment...")
+
+def route_duplicate_tap(ctx):
+    answer_callback(ctx.query_id)
+
+throttled_routes = {
+    "rate": Route("throttled:rate", route_throttled),
+    "duplicate": Route("throttled:duplicate", route_duplicate_tap),
+}
+
+def flood_middleware(ctx, route):
+    """Per-user rate limit and collapsing of repeated button taps (the admin is exempt)"""
+    if route is None or ctx.is_admin:
+        return route
+    tap = (ctx.chat_id, ctx.message_id, ctx.text) if ctx.kind == "callback" else None
+    reason = flood_control.check(ctx.user_id, tap, now=ctx.received_at)
+    return throttled_routes[reason] if reason else route
+
+def unblock_middleware(ctx, route):
+    """A user who had blocked the bot is writing to it again"""
+    if ctx.user_id:
+        broadcaster.unblock(ctx.user_id)
+    return route
+
+router.use(unblock_middleware)
+router.use(admin_state_middleware)
+router.use(require_admin)
+router.use(flood_middleware)
+
+# ----- Admin messages -----
+
+@router.document(admin=True)
+def route_upload_file(ctx):
+    """Numbers file sent after choosing a country in 📤 Upload Numbers"""
+    chat_id, user_id, message = ctx.chat_id, ctx.user_id, ctx.message
+    if admin_states.get(user_id, {}).get("action") != "upload_numbers":
+        return
+    document = message["document"]
+    file_id = document["file_id"]
+    filename = document.get("file_name", "file.txt")
+    country = admin_states[user_id]["country"]
+    
+    status = send_message(chat_id, "⏳ Processing file...")
+    status_id = ((status or {}).get("result") or {}).get("message_id")
+    
+    # Download and stream the file into the pool
+    file_content = download_file(file_id)
+    if not file_content:
+        send_message(chat_id, "❌ Failed to download file!")
         return
     
-    # ===== End Member Management Callbacks =====
+    log.info("📄 Processing file", extra={"file": filename, "bytes": len(file_content)})
+    last_progress = [time.monotonic()]
     
-    # Admin: Upload numbers callback
-    if data.startswith("upload_") and user_id == ADMIN_USER_ID:
-        country = data.replace("upload_", "")
-        admin_states[user_id] = {"action": "upload_numbers", "country": country}
-        
-        send_message(
-            chat_id,
-            f"📤 <b>Upload numbers for {country}</b>\n\n"
-            f"Send me a file with phone numbers:\n"
-            f"• Excel (.xlsx, .xls)\n"
-            f"• CSV (.csv)\n"
-            f"• Text file (.txt)\n\n"
-            f"Numbers should be in the first column or one per line.\n"
-            f"Example: 584122402006"
-        )
-        answer_callback(query_id, f"✅ Ready to receive file for {country}")
-        return
+    def report_progress(stats):
+        now = time.monotonic()
+        if status_id and now - last_progress[0] >= UPLOAD_PROGRESS_INTERVAL:
+            last_progress[0] = now
+            edit_message(chat_id, status_id,
+                         f"⏳ Processing file...\n\n📄 Rows: {stats.rows}\n➕ Added: {stats.added}")
     
-    # Admin: Delete country callback
-    if data.startswith("delete_") and user_id == ADMIN_USER_ID:
-        country = data.replace("delete_", "")
-        countries = load_json(COUNTRIES_FILE)
-        
-        if country in countries:
-            del countries[country]
-            save_json(COUNTRIES_FILE, countries)
-            send_message(chat_id, f"✅ Country <b>{country}</b> has been deleted!")
-            answer_callback(query_id, f"✅ {country} deleted!")
-        else:
-            answer_callback(query_id, "❌ Country not found!")
+    try:
+        stats = import_numbers_to_country(country, file_content, filename, progress=report_progress)
+    except Exception as e:
+        log.warning("⚠️ Error parsing file", extra={"file": filename, "error": str(e)})
+        send_message(chat_id, "❌ Could not read the file!")
         return
     
-    # Admin: Clear numbers callback
-    if data.startswith("clear_") and user_id == ADMIN_USER_ID:
-        country = data.replace("clear_", "")
-        countries = load_json(COUNTRIES_FILE)
+    if stats is None:
+        send_message(chat_id, f"❌ Country '{country}' not found!")
+    elif stats.rows == stats.invalid:
+        send_message(chat_id, "❌ No valid phone numbers found in file!")
+    else:
+        log.info("📊 Imported numbers", extra={"country": country, "added": stats.added, "rows": stats.rows,
+                                               "duration_ms": round(stats.elapsed * 1000)})
         
-        if country in countries:
-            num_count = len(countries[country].get("numbers", []))
-            countries[country]["numbers"] = []
-            save_json(COUNTRIES_FILE, countries)
-            send_message(chat_id, f"✅ Cleared <b>{num_count}</b> numbers from <b>{country}</b>!")
-            answer_callback(query_id, f"✅ {num_count} numbers cleared!")
-        else:
-            answer_callback(query_id, "❌ Country not found!")
-        return
-    
-    if data == "change_number":
-        assignments = load_json(USER_ASSIGNMENTS_FILE)
-        user_key = str(user_id)
+        msg = f"✅ <b>Upload Complete!</b>\n\n"
+        msg += f"🌍 Country: {number_pool.flag(country)} {country}\n"
+        msg += f"➕ Added: {stats.added} numbers\n"
+        from number_validation import format_rejections
+        rejections = format_rejections(stats, number_pool.flag)
+        if rejections:
+            msg += f"\n<b>Rejected: {stats.rejected}</b>\n" + "\n".join(rejections) + "\n\n"
+        msg += f"📱 Total numbers: {number_pool.free_count(country)}\n"
+        msg += f"⚡ {stats.rows_per_second:.0f} rows/s"
         
-        if user_key in assignments:
-            country = assignments[user_key]["country"]
-            new_number = assign_number_to_user(user_id, country)
-            
-            if new_number:
-                countries = load_json(COUNTRIES_FILE)
-                flag = countries[country]["flag"]
-                
-                edit_message(
-                    chat_id,
-                    message_id,
-                    f"{flag} <b>{country} Number Assigned:</b>\n+{new_number}\n\n⏳ Waiting for OTP...",
-                    reply_markup={
-                        "inline_keyboard": [
-                            [{"text": "🔄 Change Number", "callback_data": "change_number"}],
-                            [{"text": "🌍 Change Country", "callback_data": "change_country"}],
-                            [{"text": "📱 OTP Group", "url": "https://t.me/+QTWTG1P443I5YmJk"}]
-                        ]
-                    }
-                )
-                answer_callback(query_id, "✅ Number changed!")
-            else:
-                answer_callback(query_id, "❌ No numbers available!")
+        send_message(chat_id, msg)
         
-    elif data == "change_country":
-        show_country_selection(chat_id, user_id)
-        answer_callback(query_id)
+        # Clear admin state
+        del admin_states[user_id]
+
+@router.command("/addcountry", admin=True)
+def route_add_country(ctx):
+    handle_admin_add_country(ctx.chat_id, ctx.text)
+
+@router.command("/addnumber", admin=True)
+def route_add_number(ctx):
+    handle_admin_add_number(ctx.chat_id, ctx.text)
+
+@router.text("/list", "📋 View List", admin=True)
+def route_list(ctx):
+    handle_admin_list(ctx.chat_id)
+
+@router.text("➕ Add Country", admin=True)
+def route_add_country_help(ctx):
+    send_message(ctx.chat_id, "📝 To add a country, use:\n\n<code>/addcountry CountryName Flag</code>\n\nExample:\n<code>/addcountry Venezuela 🇻🇪</code>")
+
+@router.text("📤 Upload Numbers", admin=True)
+def route_upload_numbers(ctx):
+    handle_upload_numbers(ctx.chat_id, ctx.user_id)
+
+@router.text("📊 Statistics", admin=True)
+def route_statistics(ctx):
+    handle_admin_statistics(ctx.chat_id)
+
+@router.text("👥 Active Users", admin=True)
+def route_active_users(ctx):
+    handle_admin_active_users(ctx.chat_id)
+
+@router.text("🗑️ Delete Country", admin=True)
+def route_delete_country(ctx):
+    handle_admin_delete_country(ctx.chat_id, ctx.user_id)
+
+@router.text("🧹 Clear Numbers", admin=True)
+def route_clear_numbers(ctx):
+    handle_admin_clear_numbers(ctx.chat_id, ctx.user_id)
+
+@router.text("📢 Broadcast", admin=True)
+def route_broadcast(ctx):
+    handle_admin_broadcast(ctx.chat_id, ctx.user_id)
+
+@router.text("🔐 Manage Members", admin=True)
+def route_manage_members(ctx):
+    handle_manage_members(ctx.chat_id)
+
+@router.text("/apistats", admin=True)
+def route_api_stats(ctx):
+    send_message(ctx.chat_id, format_stats(api_stats.snapshot()))
+
+@router.text("/routestats", admin=True)
+def route_route_stats(ctx):
+    send_message(ctx.chat_id, format_route_stats(router.stats.snapshot()) + "\n" + format_flood_stats(flood_control.snapshot()))
+
+@router.text("/latency", admin=True)
+def route_latency(ctx):
+    send_message(ctx.chat_id, format_latency(otp_latency.snapshot()))
+
+# ----- User messages -----
+
+@router.text("/start")
+def route_start(ctx):
+    sender = ctx.message.get("from", {})
+    handle_start(ctx.chat_id, ctx.user_id, sender.get("username"), sender.get("first_name"), sender.get("last_name"))
+
+@router.text("/status")
+def route_status(ctx):
+    handle_status(ctx.chat_id, ctx.user_id)
+
+@router.text("/countries")
+def route_countries(ctx):
+    handle_countries(ctx.chat_id)
+
+@router.text("/getnumber")
+def route_get_number(ctx):
+    handle_get_number(ctx.chat_id, ctx.user_id)
+
+@router.text("/help")
+def route_help(ctx):
+    handle_help(ctx.chat_id)
+
+# ----- Member management callbacks (admin) -----
+
+@router.callback_prefix("approve_user:", admin=True)
+def route_approve_user(ctx):
+    target_user_id = int(ctx.arg("approve_user:"))
+    pending = read_json(PENDING_REQUESTS_FILE)
+    user_data = pending.get(str(target_user_id), {})
     
-    elif data.startswith("select_"):
-        country = data.replace("select_", "")
-        number = assign_number_to_user(user_id, country)
+    username = user_data.get("username")
+    first_name = user_data.get("first_name")
+    
+    approve_user(target_user_id, username, first_name)
+    
+    edit_message(ctx.chat_id, ctx.message_id, "✅ <b>User Approved!</b>\n\nUser has been granted access to the bot.")
+    send_message(target_user_id, "🎉 <b>Access Granted!</b>\n\nYour request has been approved. You can now use the bot.\n\nUse /getnumber to get a number.")
+    answer_callback(ctx.query_id, "✅ User approved!")
+
+@router.callback_prefix("reject_user:", admin=True)
+def route_reject_user(ctx):
+    target_user_id = int(ctx.arg("reject_user:"))
+    reject_user(target_user_id)
+    
+    edit_message(ctx.chat_id, ctx.message_id, "❌ <b>Request Rejected</b>\n\nUser has been denied access.")
+    send_message(target_user_id, "❌ <b>Access Denied</b>\n\nYour request to use this bot has been rejected by the admin.")
+    answer_callback(ctx.query_id, "❌ Request rejected!")
+
+@router.callback("view_pending", admin=True)
+def route_view_pending(ctx):
+    show_pending_requests(ctx.chat_id)
+    answer_callback(ctx.query_id)
+
+@router.callback("view_approved", admin=True)
+def route_view_approved(ctx):
+    show_approved_members(ctx.chat_id)
+    answer_callback(ctx.query_id)
+
+@router.callback_prefix("pending_user:", admin=True)
+def route_pending_user(ctx):
+    pending = read_json(PENDING_REQUESTS_FILE)
+    user_data = pending.get(ctx.arg("pending_user:"), {})
+    
+    if user_data:
+        msg = f"👤 <b>Pending User Details</b>\n\n"
+        msg += f"🆔 User ID: <code>{user_data.get('user_id')}</code>\n"
+        msg += f"👤 Name: {user_data.get('first_name', 'N/A')} {user_data.get('last_name', '')}\n"
+        msg += f"📧 Username: @{user_data.get('username', 'N/A')}\n"
         
-        if number:
-            countries = load_json(COUNTRIES_FILE)
-            flag = countries[country]["flag"]
-            
-            keyboard = {
-                "inline_keyboard": [
-                    [{"text": "🔄 Change Number", "callback_data": "change_number"}],
-                    [{"text": "🌍 Change Country", "callback_data": "change_country"}],
-                    [{"text": "📱 OTP Group", "url": "https://t.me/+QTWTG1P443I5YmJk"}]
-                ]
-            }
-            
-            send_message(
-                chat_id,
-                f"{flag} <b>{country} Number Assigned:</b>\n+{number}\n\n⏳ Waiting for OTP...",
-                reply_markup=keyboard
-            )
-            answer_callback(query_id, f"✅ {country} number assigned!")
-        else:
-            answer_callback(query_id, "❌ No numbers available!")
+        keyboard = {"inline_keyboard": [[
+            {"text": "✅ Approve", "callback_data": f"approve_user:{user_data.get('user_id')}"},
+            {"text": "❌ Reject", "callback_data": f"reject_user:{user_data.get('user_id')}"}
+        ]]}
+        
+        send_message(ctx.chat_id, msg, reply_markup=keyboard)
+    answer_callback(ctx.query_id)
 
-# OTP Monitor (runs in background)
-def monitor_otp_queue():
-    """Monitor otp_queue.json and send OTPs to users"""
-    print("🔍 OTP Monitor started...")
-    
-    while True:
-        try:
-            if not os.path.exists(OTP_QUEUE_FILE):
-                time.sleep(5)
-                continue
-            
-            # Get last check position
-            try:
-                with open(LAST_OTP_CHECK_FILE, "r") as f:
-                    last_pos = int(f.read().strip() or "0")
-            except:
-                last_pos = 0
-            
-            assignments = load_json(USER_ASSIGNMENTS_FILE)
-            
-            # Read new OTP entries
-            with open(OTP_QUEUE_FILE, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-            
-            if len(lines) > last_pos:
-                new_lines = lines[last_pos:]
-                
-                for line in new_lines:
-                    try:
-                        otp_data = json.loads(line.strip())
-                        number = otp_data.get("number")
-                        otp = otp_data.get("otp")
-                        service = otp_data.get("service", "Unknown")
-                        
-                        # Find user with this number
-                        for user_id, assignment in assignments.items():
-                            if assignment["number"] == number:
-                                countries = load_json(COUNTRIES_FILE)
-                                country = assignment["country"]
-                                flag = countries.get(country, {}).get("flag", "🌍")
-                                
-                                msg = f"🌍 <b>Country:</b> {flag} {country}\n"
-                                msg += f"🔢 <b>Number:</b> {number}\n"
-                                msg += f"🔑 <b>OTP:</b> <code>{otp}</code>\n"
-                                msg += f"⚙️ <b>Service:</b> {service}\n"
-                                msg += f"💰 <b>Reward:</b> 0.0050\n"
-                                msg += f"💵 <b>Balance:</b> 0.0100"
-                                
-                                send_message(user_id, msg)
-                                print(f"✅ OTP sent to user {user_id}: {otp}")
-                    except Exception as e:
-                        print(f"⚠️ Error processing OTP: {e}")
-                
-                # Update last position
-                with open(LAST_OTP_CHECK_FILE, "w") as f:
-                    f.write(str(len(lines)))
+@router.callback_prefix("approved_user:", admin=True)
+def route_approved_user(ctx):
+    approved = read_json(APPROVED_USERS_FILE)
+    user_data = approved.get(ctx.arg("approved_user:"), {})
+    
+    if user_data:
+        msg = f"✅ <b>Approved Member</b>\n\n"
+        msg += f"🆔 User ID: <code>{user_data.get('user_id')}</code>\n"
+        msg += f"👤 Name: {user_data.get('first_name', 'User')}\n"
+        msg += f"📧 Username: @{user_data.get('username', 'N/A')}\n"
         
-        except Exception as e:
-            print(f"⚠️ OTP Monitor error: {e}")
+        keyboard = {"inline_keyboard": [[
+            {"text": "🗑️ Remove Access", "callback_data": f"remove_user:{user_data.get('user_id')}"}
+        ]]}
         
-        time.sleep(2)
+        send_message(ctx.chat_id, msg, reply_markup=keyboard)
+    answer_callback(ctx.query_id)
 
-# Main Bot Loop
-def handle_update(update):
-    try:
-        if "message" in update:
-            message = update["message"]
-            chat_id = message["chat"]["id"]
-            user_id = message["from"]["id"]
-            text = message.get("text", "")
-            
-            # Handle file uploads from admin
-            if "document" in message and user_id == ADMIN_USER_ID:
-                if user_id in admin_states and admin_states[user_id].get("action") == "upload_numbers":
-                    document = message["document"]
-                    file_id = document["file_id"]
-                    filename = document.get("file_name", "file.txt")
-                    country = admin_states[user_id]["country"]
-                    
-                    send_message(chat_id, "⏳ Processing file...")
-                    
-                    # Download and parse file
-                    file_content = download_file(file_id)
-                    if file_content:
-                        print(f"📄 Processing file: {filename} ({len(file_content)} bytes)")
-                        numbers = parse_numbers_from_file(file_content, filename)
-                        print(f"📊 Parsed {len(numbers)} valid numbers from file")
-                        
-                        if numbers:
-                            # Add numbers to country
-                            countries = load_json(COUNTRIES_FILE)
-                            if country in countries:
-                                added = 0
-                                duplicates = 0
-                                
-                                for number in numbers:
-                                    if number not in countries[country]["numbers"]:
-                                        countries[country]["numbers"].append(number)
-                                        added += 1
-                                    else:
-                                        duplicates += 1
-                                
-                                save_json(COUNTRIES_FILE, countries)
-                                
-                                msg = f"✅ <b>Upload Complete!</b>\n\n"
-                                msg += f"🌍 Country: {countries[country]['flag']} {country}\n"
-                                msg += f"➕ Added: {added} numbers\n"
-                                if duplicates > 0:
-                                    msg += f"⚠️ Duplicates skipped: {duplicates}\n"
-                                msg += f"📱 Total numbers: {len(countries[country]['numbers'])}"
-                                
-                                send_message(chat_id, msg)
-                                
-                                # Clear admin state
-                                del admin_states[user_id]
-                            else:
-                                send_message(chat_id, f"❌ Country '{country}' not found!")
-                        else:
-                            send_message(chat_id, "❌ No valid phone numbers found in file!")
-                    else:
-                        send_message(chat_id, "❌ Failed to download file!")
-                    
-                    return
-            
-            # Admin commands
-            if user_id == ADMIN_USER_ID:
-                if text.startswith("/addcountry"):
-                    handle_admin_add_country(chat_id, text)
-                    return
-                elif text.startswith("/addnumber"):
-                    handle_admin_add_number(chat_id, text)
-                    return
-                elif text == "/list" or text == "📋 View List":
-                    handle_admin_list(chat_id)
-                    return
-                elif text == "➕ Add Country":
-                    send_message(chat_id, "📝 To add a country, use:\n\n<code>/addcountry CountryName Flag</code>\n\nExample:\n<code>/addcountry Venezuela 🇻🇪</code>")
-                    return
-                elif text == "📤 Upload Numbers":
-                    handle_upload_numbers(chat_id, user_id)
-                    return
-                elif text == "📊 Statistics":
-                    handle_admin_statistics(chat_id)
-                    return
-                elif text == "👥 Active Users":
-                    handle_admin_active_users(chat_id)
-                    return
-                elif text == "🗑️ Delete Country":
-                    handle_admin_delete_country(chat_id, user_id)
-                    return
-                elif text == "🧹 Clear Numbers":
-                    handle_admin_clear_numbers(chat_id, user_id)
-                    return
-                elif text == "📢 Broadcast":
-                    handle_admin_broadcast(chat_id, user_id)
-                    return
-                elif text == "🔐 Manage Members":
-                    handle_manage_members(chat_id)
-                    return
-                
-                # Handle broadcast message
-                if user_id in admin_states and admin_states[user_id].get("action") == "broadcast":
-                    if text:
-                        assignments = load_json(USER_ASSIGNMENTS_FILE)
-                        sent_count = 0
-                        
-                        for uid in assignments.keys():
-                            try:
-                                send_message(uid, text)
-                                sent_count += 1
-                            except:
-                                pass
-                        
-                        send_message(chat_id, f"✅ Broadcast sent to {sent_count} users!")
-                        del admin_states[user_id]
-                    return
-            
-            # User commands
-            if text == "/start":
-                username = message.get("from", {}).get("username")
-                first_name = message.get("from", {}).get("first_name")
-                last_name = message.get("from", {}).get("last_name")
-                handle_start(chat_id, user_id, username, first_name, last_name)
-            elif text == "/status":
-                handle_status(chat_id, user_id)
-            elif text == "/countries":
-                handle_countries(chat_id)
-            elif text == "/getnumber":
-                handle_get_number(chat_id, user_id)
-            elif text == "/help":
-                handle_help(chat_id)
+@router.callback_prefix("remove_user:", admin=True)
+def route_remove_user(ctx):
+    target_user_id = int(ctx.arg("remove_user:"))
+    result = remove_approved_user(target_user_id)
+    
+    if result.get("success"):
+        msg = "🗑️ <b>Access Removed</b>\n\nUser's access has been revoked."
+        if result.get("number"):
+            msg += f"\n\n📱 Number returned: +{result.get('number')}"
+            msg += f"\n🌍 Country: {result.get('country')}"
         
-        elif "callback_query" in update:
-            handle_callback(update["callback_query"])
+        send_message(ctx.chat_id, msg)
+        send_message(target_user_id, "⚠️ <b>Access Revoked</b>\n\nYour access to this bot has been removed by the admin.")
+        answer_callback(ctx.query_id, "🗑️ Access removed!")
+    else:
+        answer_callback(ctx.query_id, "❌ Failed to remove user!")
+
+# ----- Country / broadcast callbacks (admin) -----
+
+@router.callback_prefix("cancel_broadcast:", admin=True)
+def route_cancel_broadcast(ctx):
+    if broadcaster.cancel(ctx.arg("cancel_broadcast:")):
+        answer_callback(ctx.query_id, "⏹ Broadcast cancelled")
+    else:
+        answer_callback(ctx.query_id, "❌ Broadcast already finished")
+
+@router.callback_prefix("upload_", admin=True)
+def route_choose_upload_country(ctx):
+    country = ctx.arg("upload_")
+    admin_states[ctx.user_id] = {"action": "upload_numbers", "country": country}
+    
+    send_message(
+        ctx.chat_id,
+        f"📤 <b>Upload numbers for {country}</b>\n\n"
+        f"Send me a file with phone numbers:\n"
+        f"• Excel (.xlsx, .xls)\n"
+        f"• CSV (.csv)\n"
+        f"• Text file (.txt)\n\n"
+        f"Numbers should be in the first column or one per line.\n"
+        f"Example: 584122402006"
+    )
+    answer_callback(ctx.query_id, f"✅ Ready to receive file for {country}")
+
+@router.callback_prefix("delete_", admin=True)
+def route_delete_country_confirm(ctx):
+    country = ctx.arg("delete_")
     
+    if delete_country(country):
+        send_message(ctx.chat_id, f"✅ Country <b>{country}</b> has been deleted!")
+        answer_callback(ctx.query_id, f"✅ {country} deleted!")
+    else:
+        answer_callback(ctx.query_id, "❌ Country not found!")
+
+@router.callback_prefix("clear_", admin=True)
+def route_clear_country_confirm(ctx):
+    country = ctx.arg("clear_")
+    num_count = clear_country_numbers(country)
+    
+    if num_count is not None:
+        send_message(ctx.chat_id, f"✅ Cleared <b>{num_count}</b> numbers from <b>{country}</b>!")
+        answer_callback(ctx.query_id, f"✅ {num_count} numbers cleared!")
+    else:
+        answer_callback(ctx.query_id, "❌ Country not found!")
+
+# ----- User callbacks -----
+
+NUMBER_KEYBOARD = {
+    "inline_keyboard": [
+        [{"text": "🔄 Change Number", "callback_data": "change_number"}],
+        [{"text": "🌍 Change Country", "callback_data": "change_country"}],
+        [{"text": "📱 OTP Group", "url": "https://t.me/+QTWTG1P443I5YmJk"}]
+    ]
+}
+
+@router.callback("change_number")
+def route_change_number(ctx):
+    country = (user_assignments.get(str(ctx.user_id)) or {}).get("country")
+    if not country:
+        return
+    
+    new_number = assign_number_to_user(ctx.user_id, country)
+    if new_number:
+        edit_message(
+            ctx.chat_id,
+            ctx.message_id,
+            f"{number_pool.flag(country)} <b>{country} Number Assigned:</b>\n+{new_number}\n\n⏳ Waiting for OTP...",
+            reply_markup=NUMBER_KEYBOARD
+        )
+        answer_callback(ctx.query_id, "✅ Number changed!")
+    else:
+        answer_callback(ctx.query_id, "❌ No numbers available!")
+
+@router.callback("change_country")
+def route_change_country(ctx):
+    show_country_selection(ctx.chat_id, ctx.user_id)
+    answer_callback(ctx.query_id)
+
+@router.callback_prefix("select_")
+def route_select_country(ctx):
+    country = ctx.arg("select_")
+    number = assign_number_to_user(ctx.user_id, country)
+    
+    if number:
+        send_message(
+            ctx.chat_id,
+            f"{number_pool.flag(country)} <b>{country} Number Assigned:</b>\n+{number}\n\n⏳ Waiting for OTP...",
+            reply_markup=NUMBER_KEYBOARD
+        )
+        answer_callback(ctx.query_id, f"✅ {country} number assigned!")
+    else:
+        answer_callback(ctx.query_id, "❌ No numbers available!")
+
+def handle_update(update, received_at=None):
+    # Handlers run on the async runtime's worker threads, out of sight of a
+    # cProfile capture on the loop thread unless they go through the profiler
+    profiler.call(router.dispatch, update, received_at)
+
+def capture_updates(updates):
+    """Record a batch of incoming updates when capture is on"""
+    if update_capture is None or not updates:
+        return
+    try:
+        update_capture.record(updates)
     except Exception as e:
-        print(f"❌ Error handling update: {e}")
+        log.warning("⚠️ Failed to capture updates", extra={"error": str(e)})
 
+# ======== Metrics ========
+
+assign_seconds = registry.histogram("number_assign_seconds", "Time to lease a number to a user, including the wait for the state lock")
+otp_latency_seconds = registry.histogram("otp_latency_seconds", "OTP latency per pipeline stage, from panel receipt to delivery",
+                                         buckets=(1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 300, 600))
+otp_latency = OtpLatency(observe=lambda stage, seconds, country, service:
+                         otp_latency_seconds.observe(seconds, stage=stage, country=country, service=service))
+
+@registry.collector
+def collect_bot_metrics():
+    """Route, Telegram API and pool stats, read when a metrics snapshot is written"""
+    free = number_pool.free_counts()
+    return [
+        *route_metric_families(router.stats.snapshot()),
+        *api_metric_families(api_stats.snapshot(), "number_bot"),
+        family("number_pool_free", "gauge", "Free numbers per country",
+               [["number_pool_free", {"country": country}, count] for country, count in sorted(free.items())]),
+        family("number_pool_leased", "gauge", "Numbers currently leased to users",
+               [["number_pool_leased", {}, number_pool.total_leased()]]),
+    ]
+
+# Main Bot Loop
 def get_updates(offset=0):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates"
     params = {"offset": offset, "timeout": 30}
     try:
-        response = requests.get(url, params=params, timeout=35)
-        return response.json()
+        return api_call("getUpdates", params) or {"ok": False}
     except:
         return {"ok": False}
 
 def set_bot_commands():
     """Set bot commands menu"""
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/setMyCommands"
     commands = [
         {"command": "getnumber", "description": "📱 Get a temporary number"},
         {"command": "status", "description": "🔑 View your number and OTP"},
@@ -1210,43 +1489,108 @@ def set_bot_commands():
         {"command": "help", "description": "❓ How to use the bot"}
     ]
     try:
-        response = requests.post(url, json={"commands": commands}, timeout=10)
-        if response.json().get("ok"):
-            print("✅ Bot commands menu set successfully")
+        response = api_call("setMyCommands", {"commands": commands})
+        if response and response.get("ok"):
+            log.info("✅ Bot commands menu set")
     except:
-        print("⚠️ Failed to set bot commands menu")
+        log.warning("⚠️ Failed to set bot commands menu")
     
     # Set menu button (three lines ≡)
-    menu_url = f"https://api.telegram.org/bot{BOT_TOKEN}/setChatMenuButton"
     menu_button = {
         "menu_button": {
             "type": "commands"
         }
     }
     try:
-        response = requests.post(menu_url, json=menu_button, timeout=10)
-        if response.json().get("ok"):
-            print("✅ Menu button (≡) set successfully")
+        response = api_call("setChatMenuButton", menu_button)
+        if response and response.get("ok"):
+            log.info("✅ Menu button (≡) set")
     except:
-        print("⚠️ Failed to set menu button")
+        log.warning("⚠️ Failed to set menu button")
+
+def configure_webhook():
+    """Register WEBHOOK_URL with Telegram, or remove a stale webhook when polling"""
+    if WEBHOOK_URL:
+        payload = {
+            "url": WEBHOOK_URL,
+            "secret_token": WEBHOOK_SECRET,
+            "allowed_updates": ["message", "callback_query"]
+        }
+        try:
+            response = api_call("setWebhook", payload)
+            if response and response.get("ok"):
+                log.info("✅ Webhook set", extra={"url": WEBHOOK_URL})
+            else:
+                log.warning("⚠️ Failed to set webhook", extra={"error": str(response)})
+        except Exception as e:
+            log.warning("⚠️ Failed to set webhook", extra={"error": str(e)})
+    else:
+        try:
+            api_call("deleteWebhook")
+        except:
+            log.warning("⚠️ Failed to delete webhook")
+
+def consume_webhook_updates():
+    """Handle updates spooled by health_server.py (webhook mode)"""
+    log.info("📥 Webhook mode: reading spooled updates")
+    reader = SpoolReader()
+    while True:
+        beat()
+        profiler.cycle()
+        updates = reader.read_batch()
+        received_at = time.monotonic()
+        board.mark("number_last_poll")
+        capture_updates(updates)
+        for update in updates:
+            handle_update(update, received_at)
+        if updates:
+            reader.commit()
+        else:
+            time.sleep(0.1)
 
 def main():
-    print("🤖 Number Bot started!")
-    init_files()
+    setup_logging("number_bot")
+    board.mark("number_started")
+    start_exporter("number_bot")
+    profiler.start("number_bot", default_mode="sample")
+    profiler.watch("admin_states", lambda: len(admin_states))
+    profiler.watch("view_cache", lambda: len(_view_cache))
+    profiler.watch("leased_numbers", number_pool.total_leased)
+    if NUMBER_BOT_RUNTIME == "async":
+        with startup.phase("import async_runtime"):
+            import async_runtime
+        async_runtime.run(sys.modules[__name__])
+        return
     
-    # Set bot commands menu
-    set_bot_commands()
+    log.info("🤖 Number Bot started")
+    with startup.phase("init_files"):
+        init_files()
+    with startup.phase("configure_webhook"):
+        configure_webhook()
     
-    # Start OTP monitor in background
+    # Start OTP monitor and lease expiry in background
     otp_thread = Thread(target=monitor_otp_queue, daemon=True)
     otp_thread.start()
+    Thread(target=run_lease_expiry, daemon=True).start()
+    
+    startup.mark_serving()
+    Thread(target=deferred_startup, daemon=True).start()
+    
+    if WEBHOOK_URL:
+        consume_webhook_updates()
+        return
     
     offset = 0
     while True:
+        beat()
+        profiler.cycle()
         updates = get_updates(offset)
+        received_at = time.monotonic()
         if updates.get("ok"):
+            board.mark("number_last_poll")
+            capture_updates(updates.get("result"))
             for update in updates.get("result", []):
-                handle_update(update)
+                handle_update(update, received_at)
                 offset = update["update_id"] + 1
         time.sleep(1)
 
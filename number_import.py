@@ -0,0 +1,174 @@
+"""
+Streaming bulk import of phone numbers into a NumberPool
+
+Uploads are read in chunks (CSV via pandas chunksize, Excel row by row in
+read-only mode, text line by line), each chunk is cleaned with vectorized
+string operations, and the valid numbers are checked by number_validation (calling code of the
+target country, already free or leased anywhere) before they are added to
+the pool. The
+caller's ``commit`` persists the pool every COMMIT_EVERY_ROWS rows and
+``progress`` is called after every chunk.
+"""
+import io
+import time
+from collections import Counter
+
+import pandas as pd
+
+from number_validation import NumberIndex, validate_numbers
+
+CHUNK_ROWS = 50_000
+COMMIT_EVERY_ROWS = 250_000
+
+# Same rules as the old per-row cleaning: drop a trailing ".0" left by Excel,
+# remove spaces, dashes and plus signs, keep 8-15 digit numbers.
+_TRAILING_ZERO = r"\.0$"
+_FORMATTING = r"[\s\-+]"
+_VALID = r"\d{8,15}"
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.invalid = 0
+        self.duplicates_in_file = 0
+        self.already_in_pool = 0
+        self.assigned = 0
+        self.in_other_country = Counter()   # country -> count
+        self.wrong_country = Counter()      # inferred calling code -> count
+        self.unknown_prefix = 0
+        self.added = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rejected(self):
+        return (self.invalid + self.duplicates_in_file + self.already_in_pool + self.assigned
+                + sum(self.in_other_country.values()) + sum(self.wrong_country.values()) + self.unknown_prefix)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / max(self.elapsed, 1e-6)
+
+
+def _excel_chunks(file_content, chunk_rows):
+    from openpyxl import load_workbook
+    workbook = load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(min_col=1, max_col=1, values_only=True)
+        next(rows, None)  # header row, like pandas
+        chunk = []
+        for (value,) in rows:
+            chunk.append(value)
+            if len(chunk) >= chunk_rows:
+                yield pd.Series(chunk, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.Series(chunk, dtype=object)
+    finally:
+        workbook.close()
+
+
+def _csv_chunks(file_content, chunk_rows, header):
+    reader = pd.read_csv(io.BytesIO(file_content), dtype=str, header=header,
+                         usecols=[0], chunksize=chunk_rows)
+    for frame in reader:
+        yield frame.iloc[:, 0]
+
+
+def _text_chunks(file_content, chunk_rows):
+    chunk = []
+    for line in io.BytesIO(file_content):
+        chunk.append(line.decode("utf-8"))
+        if len(chunk) >= chunk_rows:
+            yield pd.Series(chunk, dtype=object)
+            chunk = []
+    if chunk:
+        yield pd.Series(chunk, dtype=object)
+
+
+def iter_raw_chunks(file_content, filename, chunk_rows=CHUNK_ROWS):
+    """Yield the first column of an Excel/CSV file (or the lines of a text file) in chunks"""
+    if filename.endswith(".xlsx"):
+        yield from _excel_chunks(file_content, chunk_rows)
+    elif filename.endswith(".xls"):
+        # Legacy .xls can't be streamed; read it once and slice
+        df = pd.read_excel(io.BytesIO(file_content), dtype=str)
+        if len(df.columns) > 0:
+            column = df.iloc[:, 0]
+            for start in range(0, len(column), chunk_rows):
+                yield column.iloc[start:start + chunk_rows]
+    elif filename.endswith(".csv"):
+        yielded = False
+        try:
+            for chunk in _csv_chunks(file_content, chunk_rows, "infer"):
+                yielded = True
+                yield chunk
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, ValueError):
+            if yielded:
+                raise
+            # Retry without treating the first row as a header
+            yield from _csv_chunks(file_content, chunk_rows, None)
+    else:
+        yield from _text_chunks(file_content, chunk_rows)
+
+
+def normalize_numbers(chunk):
+    """Clean a chunk of raw cells into a Series of valid number strings"""
+    cleaned = (
+        chunk.dropna()
+        .astype(str)
+        .str.strip()
+        .str.replace(_TRAILING_ZERO, "", regex=True)
+        .str.replace(_FORMATTING, "", regex=True)
+    )
+    return cleaned[cleaned.str.fullmatch(_VALID)]
+
+
+def import_numbers(pool, country, file_content, filename, commit=None, progress=None,
+                   normalize=normalize_numbers, calling_code=None, chunk_rows=CHUNK_ROWS):
+    """Stream an uploaded file into ``pool`` under ``country``.
+
+    Numbers whose calling code isn't ``calling_code`` are rejected (no check
+    when it is None). ``commit(stats)`` is called every COMMIT_EVERY_ROWS rows
+    and at the end, ``progress(stats)`` after every chunk. Returns the
+    ImportStats.
+    """
+    stats = ImportStats()
+    index = NumberIndex(pool)
+    uncommitted = 0
+    for chunk in iter_raw_chunks(file_content, filename, chunk_rows):
+        valid = normalize(chunk)
+        unique = valid.drop_duplicates()
+        stats.rows += len(chunk)
+        stats.invalid += len(chunk) - len(valid)
+        stats.duplicates_in_file += len(valid) - len(unique)
+
+        accepted = validate_numbers(unique, country, calling_code, index, stats)
+        added, existing = pool.add_numbers(country, accepted.tolist())
+        # The index predates this import, so what the pool still refuses was
+        # (almost always) added from an earlier chunk of the same file
+        stats.duplicates_in_file += existing
+        stats.added += added
+        uncommitted += len(chunk)
+
+        if commit and uncommitted >= COMMIT_EVERY_ROWS:
+            commit(stats)
+            uncommitted = 0
+        if progress:
+            progress(stats)
+
+    if commit:
+        commit(stats)
+    return stats
+
+
+def parse_numbers(file_content, filename):
+    """All valid numbers of a file as a list (no pool involved)"""
+    numbers = []
+    for chunk in iter_raw_chunks(file_content, filename):
+        numbers.extend(normalize_numbers(chunk).tolist())
+    return numbers
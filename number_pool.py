@@ -0,0 +1,240 @@
+import threading
+from collections import deque
+
+
+class NumberPool:
+    """In-memory allocator for country number pools.
+
+    Free numbers are kept in a deque per country (in upload order) together
+    with a global index of where every free number lives, so leasing and
+    releasing a number is O(1). Entries removed out of order (clear, delete)
+    are dropped from the index only and skipped lazily when they reach the
+    front of the deque.
+
+    The assigned-number index doubles as the reverse number -> (user, country)
+    map used to route OTPs, and country flags are cached alongside the pools.
+    ``version`` changes whenever a country, flag or free count changes, so
+    views built from availability() can be cached until it moves.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._queues = {}     # country -> deque of free numbers (may hold stale entries)
+        self._where = {}      # free number -> country
+        self._counts = {}     # country -> number of free numbers
+        self._assigned = {}   # leased number -> (user_key, country)
+        self._leases = {}     # user_key -> leased number
+        self._flags = {}      # country -> flag emoji
+        self.version = 0
+
+    def load(self, countries, assignments):
+        """Rebuild the pool from countries.json and user_assignments.json data"""
+        with self._lock:
+            self._queues.clear()
+            self._where.clear()
+            self._counts.clear()
+            self._assigned.clear()
+            self._leases.clear()
+            self._flags.clear()
+            self.version += 1
+
+            for user_key, data in assignments.items():
+                number = data.get("number")
+                if number:
+                    self._assigned[number] = (str(user_key), data.get("country"))
+                    self._leases[str(user_key)] = number
+
+            for country, data in countries.items():
+                self.add_country(country, data.get("flag"))
+                self.add_numbers(country, data.get("numbers", []))
+
+    # ======== Countries ========
+
+    def add_country(self, country, flag=None):
+        with self._lock:
+            if flag and self._flags.get(country) != flag:
+                self._flags[country] = flag
+                self.version += 1
+            if country in self._queues:
+                return False
+            self._queues[country] = deque()
+            self._counts[country] = 0
+            self.version += 1
+            return True
+
+    def remove_country(self, country):
+        """Drop a country and all of its free numbers. Leases are kept."""
+        with self._lock:
+            queue = self._queues.pop(country, None)
+            self._flags.pop(country, None)
+            if queue is None:
+                return 0
+            self.version += 1
+            for number in queue:
+                if self._where.get(number) == country:
+                    del self._where[number]
+            return self._counts.pop(country, 0)
+
+    def clear(self, country):
+        """Remove every free number from a country, returns how many were removed"""
+        with self._lock:
+            if country not in self._queues:
+                return 0
+            for number in self._queues[country]:
+                if self._where.get(number) == country:
+                    del self._where[number]
+            removed = self._counts[country]
+            self._queues[country] = deque()
+            self._counts[country] = 0
+            if removed:
+                self.version += 1
+            return removed
+
+    def flag(self, country, default="🌍"):
+        return self._flags.get(country, default)
+
+    def countries(self):
+        with self._lock:
+            return list(self._queues)
+
+    def has_country(self, country):
+        return country in self._queues
+
+    # ======== Numbers ========
+
+    def add_numbers(self, country, numbers):
+        """Add numbers to a country's free pool.
+
+        Numbers already free anywhere or currently leased are skipped.
+        Returns (added, duplicates).
+        """
+        added = 0
+        duplicates = 0
+        with self._lock:
+            if country not in self._queues:
+                self.add_country(country)
+            queue = self._queues[country]
+            for number in numbers:
+                if number in self._where or number in self._assigned:
+                    duplicates += 1
+                    continue
+                self._where[number] = country
+                queue.append(number)
+                added += 1
+            self._counts[country] += added
+            if added:
+                self.version += 1
+        return added, duplicates
+
+    def lease(self, user_key, country, recycle_old=False):
+        """Lease the next free number in ``country`` to ``user_key``.
+
+        A number the user already holds is released first; it goes back to the
+        end of the pool only if ``recycle_old`` is set, otherwise it is
+        discarded. Returns the leased number or None if the country is empty.
+        """
+        user_key = str(user_key)
+        with self._lock:
+            queue = self._queues.get(country)
+            if not queue or not self._counts.get(country):
+                return None
+
+            number = None
+            while queue:
+                candidate = queue.popleft()
+                if self._where.get(candidate) == country:
+                    number = candidate
+                    break
+            if number is None:
+                return None
+
+            del self._where[number]
+            self._counts[country] -= 1
+            self.version += 1
+
+            self.release(user_key, return_to_pool=recycle_old)
+            self._assigned[number] = (user_key, country)
+            self._leases[user_key] = number
+            self._compact(country)
+            return number
+
+    def release(self, user_key, return_to_pool=True):
+        """End a user's lease. Returns (number, country) or None."""
+        user_key = str(user_key)
+        with self._lock:
+            number = self._leases.pop(user_key, None)
+            if number is None:
+                return None
+            _, country = self._assigned.pop(number, (None, None))
+            if return_to_pool and country in self._queues:
+                self._where[number] = country
+                self._queues[country].append(number)
+                self._counts[country] += 1
+                self.version += 1
+            return number, country
+
+    def _compact(self, country):
+        # Keep stale entries from piling up after clears and re-uploads
+        queue = self._queues[country]
+        if len(queue) > 2 * self._counts[country] + 1024:
+            self._queues[country] = deque(n for n in queue if self._where.get(n) == country)
+
+    # ======== Queries ========
+
+    def free_count(self, country):
+        with self._lock:
+            return self._counts.get(country, 0)
+
+    def free_counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def availability(self):
+        """(version, [(country, flag, free count), ...]) in country order"""
+        with self._lock:
+            return self.version, [(country, self.flag(country), count) for country, count in self._counts.items()]
+
+    def free_numbers(self, country):
+        """Free numbers of a country in allocation order"""
+        with self._lock:
+            seen = set()
+            numbers = []
+            for number in self._queues.get(country, ()):
+                if self._where.get(number) == country and number not in seen:
+                    seen.add(number)
+                    numbers.append(number)
+            return numbers
+
+    def peek(self, country, count):
+        """The first ``count`` free numbers of a country, without walking the whole pool"""
+        with self._lock:
+            numbers = []
+            for number in self._queues.get(country, ()):
+                if len(numbers) >= count:
+                    break
+                if self._where.get(number) == country and number not in numbers:
+                    numbers.append(number)
+            return numbers
+
+    def lease_of(self, user_key):
+        with self._lock:
+            return self._leases.get(str(user_key))
+
+    def owner(self, number):
+        """(user_key, country) currently holding ``number``, or None"""
+        return self._assigned.get(number)
+
+    def is_known(self, number):
+        return number in self._where or number in self._assigned
+
+    def index_snapshot(self):
+        """Copies of the global index: ({free number: country}, {leased number: country})"""
+        with self._lock:
+            return dict(self._where), {number: country for number, (_, country) in self._assigned.items()}
+
+    def total_free(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+    def total_leased(self):
+        return len(self._assigned)
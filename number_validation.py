@@ -0,0 +1,161 @@
+"""
+Calling-code and cross-country checks for uploaded numbers
+
+Every number's calling code is inferred with integer arithmetic on the
+whole chunk (ITU codes are 1-3 digits and prefix-free), compared with the
+code of the country being uploaded to, and looked up in a snapshot of the
+pool's global index with a pandas hash join, so a million-row upload never
+runs a Python loop per number.
+"""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# (ISO code, name, calling code); names match the ones main.py uses
+CALLING_CODES = [
+    ("US", "USA", 1), ("EG", "Egypt", 20), ("ZA", "South Africa", 27), ("GR", "Greece", 30),
+    ("NL", "Netherlands", 31), ("BE", "Belgium", 32), ("FR", "France", 33), ("ES", "Spain", 34),
+    ("IT", "Italy", 39), ("RO", "Romania", 40), ("GB", "UK", 44), ("SE", "Sweden", 46),
+    ("PL", "Poland", 48), ("DE", "Germany", 49), ("PE", "Peru", 51), ("MX", "Mexico", 52),
+    ("AR", "Argentina", 54), ("BR", "Brazil", 55), ("CL", "Chile", 56), ("CO", "Colombia", 57),
+    ("VE", "Venezuela", 58), ("MY", "Malaysia", 60), ("ID", "Indonesia", 62), ("PH", "Philippines", 63),
+    ("SG", "Singapore", 65), ("TH", "Thailand", 66), ("RU", "Russia", 7), ("JP", "Japan", 81),
+    ("KR", "South Korea", 82), ("VN", "Vietnam", 84), ("CN", "China", 86), ("TR", "Turkey", 90),
+    ("IN", "India", 91), ("PK", "Pakistan", 92), ("AF", "Afghanistan", 93), ("LK", "Sri Lanka", 94),
+    ("MM", "Myanmar", 95), ("IR", "Iran", 98), ("MA", "Morocco", 212), ("DZ", "Algeria", 213),
+    ("TN", "Tunisia", 216), ("SN", "Senegal", 221), ("MR", "Mauritania", 222), ("CI", "Ivory Coast", 225),
+    ("GH", "Ghana", 233), ("NG", "Nigeria", 234), ("ET", "Ethiopia", 251), ("KE", "Kenya", 254),
+    ("TZ", "Tanzania", 255), ("UG", "Uganda", 256), ("ZM", "Zambia", 260), ("BO", "Bolivia", 591),
+    ("EC", "Ecuador", 593), ("PY", "Paraguay", 595), ("UY", "Uruguay", 598), ("KH", "Cambodia", 855),
+    ("BD", "Bangladesh", 880), ("LB", "Lebanon", 961), ("JO", "Jordan", 962), ("SY", "Syria", 963),
+    ("IQ", "Iraq", 964), ("KW", "Kuwait", 965), ("SA", "Saudi Arabia", 966), ("YE", "Yemen", 967),
+    ("OM", "Oman", 968), ("AE", "UAE", 971), ("BH", "Bahrain", 973), ("QA", "Qatar", 974),
+    ("BT", "Bhutan", 975), ("NP", "Nepal", 977), ("UZ", "Uzbekistan", 998),
+]
+
+_BY_ISO = {iso: code for iso, _, code in CALLING_CODES}
+_BY_NAME = {name.lower(): code for _, name, code in CALLING_CODES}
+_NAMES = {code: name for _, name, code in CALLING_CODES}
+_CODES_BY_LENGTH = {
+    length: np.array(sorted(code for _, _, code in CALLING_CODES if len(str(code)) == length), dtype=np.int64)
+    for length in (1, 2, 3)
+}
+
+
+def _flag_iso(flag):
+    # A flag emoji is two regional indicator symbols, 🇪🇨 -> "EC"
+    letters = [chr(ord(c) - 0x1F1E6 + ord("A")) for c in flag or "" if 0x1F1E6 <= ord(c) <= 0x1F1FF]
+    return "".join(letters[:2]) if len(letters) >= 2 else None
+
+
+def calling_code_for(country, data=None):
+    """Calling code of a country from countries.json, or None if it can't be told.
+
+    An explicit "calling_code" field wins, then the flag emoji, then the name.
+    """
+    data = data or {}
+    if data.get("calling_code"):
+        return int(data["calling_code"])
+    code = _BY_ISO.get(_flag_iso(data.get("flag")))
+    if code:
+        return code
+    return _BY_NAME.get(country.strip().lower())
+
+
+def country_label(code):
+    return f"{_NAMES.get(code, 'Unknown')} (+{code})"
+
+
+def infer_calling_codes(numbers):
+    """Calling code of every number in a Series of digit strings (0 = unknown)"""
+    if numbers.empty:
+        return np.zeros(0, dtype=np.int64)
+    values = numbers.astype(np.int64).to_numpy()
+    lengths = numbers.str.len().to_numpy()
+    codes = np.zeros(len(values), dtype=np.int64)
+    for length in (3, 2, 1):
+        prefixes = values // np.power(10, lengths - length, dtype=np.int64)
+        hit = (codes == 0) & np.isin(prefixes, _CODES_BY_LENGTH[length])
+        codes[hit] = prefixes[hit]
+    return codes
+
+
+class NumberIndex:
+    """Point-in-time copy of the pool's global index for bulk lookups"""
+
+    def __init__(self, pool):
+        free, leased = pool.index_snapshot()
+        self.free = pd.Series(free, dtype=object)
+        self.leased = pd.Series(leased, dtype=object)
+
+    def locate(self, numbers):
+        """(free country or NaN, leased country or NaN) for each number"""
+        return numbers.map(self.free), numbers.map(self.leased)
+
+
+def validate_numbers(numbers, country, calling_code, index, stats):
+    """Drop numbers that belong to another country or are already known.
+
+    ``numbers`` must be free of duplicates. Rejections are counted on
+    ``stats`` (an ImportStats); the accepted numbers are returned.
+    """
+    keep = np.ones(len(numbers), dtype=bool)
+
+    if calling_code:
+        codes = infer_calling_codes(numbers)
+        foreign = codes != calling_code
+        unknown = foreign & (codes == 0)
+        stats.unknown_prefix += int(unknown.sum())
+        wrong = codes[foreign & ~unknown]
+        if len(wrong):
+            found, counts = np.unique(wrong, return_counts=True)
+            stats.wrong_country.update(dict(zip(found.tolist(), counts.tolist())))
+        keep &= ~foreign
+
+    free_in, leased_in = index.locate(numbers)
+    leased = leased_in.notna().to_numpy()
+    stats.assigned += int((keep & leased).sum())
+    keep &= ~leased
+
+    free_in = free_in.to_numpy()
+    in_pool = pd.notna(free_in) & keep
+    same = in_pool & (free_in == country)
+    stats.already_in_pool += int(same.sum())
+    other = free_in[in_pool & ~same]
+    if len(other):
+        stats.in_other_country.update(Counter(other.tolist()))
+    keep &= ~in_pool
+
+    return numbers[keep]
+
+
+def _top(counter, limit=5):
+    top = counter.most_common(limit)
+    return top, sum(counter.values()) - sum(count for _, count in top)
+
+
+def format_rejections(stats, flag_of=lambda country: ""):
+    """Categorized rejection lines for the admin's upload report"""
+    lines = []
+    if stats.invalid:
+        lines.append(f"🚫 Not a phone number: {stats.invalid}")
+    if stats.duplicates_in_file:
+        lines.append(f"♻️ Duplicates in file: {stats.duplicates_in_file}")
+    if stats.already_in_pool:
+        lines.append(f"📱 Already in this country: {stats.already_in_pool}")
+    if stats.assigned:
+        lines.append(f"👤 Assigned to a user: {stats.assigned}")
+    top, others = _top(stats.in_other_country)
+    for country, count in top:
+        lines.append(f"🔀 Already in {f'{flag_of(country)} {country}'.strip()}: {count}")
+    if others:
+        lines.append(f"🔀 Already in other countries: {others}")
+    top, others = _top(stats.wrong_country)
+    for code, count in top:
+        lines.append(f"🌐 Wrong country, {country_label(code)}: {count}")
+    if others:
+        lines.append(f"🌐 Wrong country, others: {others}")
+    if stats.unknown_prefix:
+        lines.append(f"❓ Unknown calling code: {stats.unknown_prefix}")
+    return lines
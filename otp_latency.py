@@ -0,0 +1,129 @@
+"""
+End-to-end OTP latency, from the SMS hitting the panel to the user's chat
+
+main.py stamps every otp_queue.json record with the panel's own time for the
+SMS (panel_ts), when the page was scraped (scraped_at) and when the record
+was written (enqueued_at); the Number Bot adds delivered_at once sendMessage
+succeeds. OtpLatency turns those into per-stage latencies, keeps the last
+LATENCY_WINDOW deliveries for percentiles per stage, country and service,
+and hands every value to an optional observe() (the metrics histogram).
+Records written before these fields existed only yield the stages they
+have timestamps for.
+"""
+import calendar
+import os
+import threading
+import time
+from collections import deque
+
+LATENCY_WINDOW = 1000
+# The panel shows local times without a zone; this is its offset from UTC
+PANEL_UTC_OFFSET_HOURS = float(os.getenv("PANEL_UTC_OFFSET_HOURS", "0"))
+PANEL_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%d-%m-%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S")
+
+# (stage, start field, end field)
+STAGES = (
+    ("panel_to_scrape", "panel_ts", "scraped_at"),
+    ("scrape_to_enqueue", "scraped_at", "enqueued_at"),
+    ("enqueue_to_delivery", "enqueued_at", "delivered_at"),
+)
+
+
+def parse_panel_time(date, utc_offset_hours=PANEL_UTC_OFFSET_HOURS):
+    """Epoch seconds for a panel date cell, or None if it isn't a known format"""
+    for fmt in PANEL_TIME_FORMATS:
+        try:
+            parsed = time.strptime(date, fmt)
+        except ValueError:
+            continue
+        return calendar.timegm(parsed) - utc_offset_hours * 3600
+    return None
+
+
+def percentiles(values):
+    """(p50, p95, p99) of a non-empty sequence"""
+    values = sorted(values)
+    last = len(values) - 1
+    return tuple(values[min(int(q * len(values)), last)] for q in (0.5, 0.95, 0.99))
+
+
+class OtpLatency:
+    def __init__(self, window=LATENCY_WINDOW, observe=None):
+        self.window = window
+        self.observe = observe      # observe(stage, seconds, country, service)
+        self._lock = threading.Lock()
+        self.stages = {}            # stage -> deque of seconds
+        self.by_country = {}        # country -> deque of end-to-end seconds
+        self.by_service = {}        # service -> deque of end-to-end seconds
+        self.delivered_count = 0
+
+    def _append(self, table, key, seconds):
+        values = table.get(key)
+        if values is None:
+            values = table[key] = deque(maxlen=self.window)
+        values.append(seconds)
+
+    def delivered(self, trace, now=None):
+        """Record a delivery; ``trace`` holds the queue record's timestamps plus country/service.
+
+        End to end runs from panel_ts, or from scraped_at when the panel time
+        couldn't be read. Clock skew between panel and bot is clamped to 0.
+        """
+        trace = dict(trace, delivered_at=time.time() if now is None else now)
+        country = trace.get("country") or "Unknown"
+        service = trace.get("service") or "Unknown"
+        measured = []
+        for stage, start, end in STAGES:
+            if trace.get(start) and trace.get(end):
+                measured.append((stage, max(trace[end] - trace[start], 0.0)))
+        start = trace.get("panel_ts") or trace.get("scraped_at")
+        end_to_end = max(trace["delivered_at"] - start, 0.0) if start else None
+        if end_to_end is not None:
+            measured.append(("end_to_end", end_to_end))
+
+        with self._lock:
+            self.delivered_count += 1
+            for stage, seconds in measured:
+                self._append(self.stages, stage, seconds)
+            if end_to_end is not None:
+                self._append(self.by_country, country, end_to_end)
+                self._append(self.by_service, service, end_to_end)
+        if self.observe is not None:
+            for stage, seconds in measured:
+                self.observe(stage, seconds, country, service)
+
+    def snapshot(self):
+        """Percentiles per stage and end-to-end per country/service: {name: (count, p50, p95, p99)}"""
+        with self._lock:
+            def summarize(table):
+                return {key: (len(values), *percentiles(values)) for key, values in table.items() if values}
+            return {
+                "delivered": self.delivered_count,
+                "window": self.window,
+                "stages": summarize(self.stages),
+                "countries": summarize(self.by_country),
+                "services": summarize(self.by_service),
+            }
+
+
+def _seconds(value):
+    return f"{value:.1f}s" if value < 100 else f"{value / 60:.1f}m"
+
+
+def format_latency(snapshot, limit=10):
+    """OTP latency summary as an HTML message for the admin"""
+    if not snapshot["stages"]:
+        return "⏱️ <b>OTP Latency</b>\n\nNo OTPs delivered yet."
+    msg = "⏱️ <b>OTP Latency</b>\n"
+    msg += f"{snapshot['delivered']} OTPs delivered; p50 / p95 / p99 over the last {min(snapshot['delivered'], snapshot['window'])}\n\n"
+    for stage, _, _ in STAGES + (("end_to_end", None, None),):
+        if stage in snapshot["stages"]:
+            count, p50, p95, p99 = snapshot["stages"][stage]
+            msg += f"<b>{stage.replace('_', ' ')}</b>: {_seconds(p50)} / {_seconds(p95)} / {_seconds(p99)} ({count})\n"
+    for title, table in (("🌍 By country", snapshot["countries"]), ("⚙️ By service", snapshot["services"])):
+        busiest = sorted(table.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        if busiest:
+            msg += f"\n<b>{title}</b> (end to end)\n"
+            for name, (count, p50, p95, _) in busiest:
+                msg += f"   {name}: {_seconds(p50)} / {_seconds(p95)} ({count})\n"
+    return msg
@@ -0,0 +1,257 @@
+"""
+Table-driven update router for the Number Bot
+
+Message texts are looked up in a dict (whole text, then the first word for
+commands with arguments such as "/addcountry Name 🇪🇨"), callback data in
+a dict and then a prefix trie ("select_Ecuador" -> "select_"). Middleware
+sees every resolved route before it runs and can swap or drop it; that is
+where admin-only routes and the admin's pending input states are handled.
+Every route keeps a call count, an error count and a latency histogram.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from metrics import family, histogram_samples
+
+log = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Context:
+    """What a route handler gets for one update"""
+
+    def __init__(self, update, is_admin, received_at=None):
+        self.update = update
+        # When the update reached the bot (monotonic), not when a worker got to it
+        self.received_at = time.monotonic() if received_at is None else received_at
+        self.message = update.get("message")
+        self.callback_query = update.get("callback_query")
+        if self.message is not None:
+            self.kind = "message"
+            self.chat_id = self.message["chat"]["id"]
+            self.user_id = self.message["from"]["id"]
+            self.text = self.message.get("text", "")
+            self.message_id = self.message.get("message_id")
+        elif self.callback_query is not None:
+            self.kind = "callback"
+            self.user_id = self.callback_query["from"]["id"]
+            self.text = self.callback_query.get("data", "")
+            message = self.callback_query.get("message") or {}
+            self.chat_id = message.get("chat", {}).get("id", self.user_id)
+            self.message_id = message.get("message_id")
+        else:
+            self.kind = None
+            self.chat_id = self.user_id = self.message_id = None
+            self.text = ""
+        self.is_admin = self.user_id is not None and is_admin(self.user_id)
+
+    @property
+    def query_id(self):
+        return self.callback_query["id"] if self.callback_query else None
+
+    def arg(self, prefix):
+        """The part of the text after a callback prefix ("select_Ecuador" -> "Ecuador")"""
+        return self.text[len(prefix):]
+
+
+class Route:
+    def __init__(self, name, handler, admin=False):
+        self.name = name
+        self.handler = handler
+        self.admin = admin
+
+
+class PrefixTrie:
+    """Longest registered prefix of a string, one dict step per character"""
+
+    _END = object()
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, prefix, value):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[self._END] = value
+
+    def longest(self, text):
+        node = self.root
+        found = node.get(self._END)
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(self._END, found)
+        return found
+
+
+class RouteStats:
+    """Thread-safe per-route counters and latency histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, name, seconds, error=False):
+        bucket = bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            entry = self._routes.get(name)
+            if entry is None:
+                entry = self._routes[name] = {
+                    "calls": 0, "errors": 0, "latency_total": 0.0, "latency_max": 0.0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            entry["calls"] += 1
+            entry["latency_total"] += seconds
+            if seconds > entry["latency_max"]:
+                entry["latency_max"] = seconds
+            entry["buckets"][bucket] += 1
+            if error:
+                entry["errors"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(entry, buckets=list(entry["buckets"])) for name, entry in self._routes.items()}
+
+
+def percentile_ms(buckets, fraction):
+    """Upper bucket bound (ms) below which ``fraction`` of the calls fall"""
+    total = sum(buckets)
+    if not total:
+        return 0
+    target = total * fraction
+    seen = 0
+    for i, count in enumerate(buckets):
+        seen += count
+        if seen >= target:
+            return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else float("inf")
+    return float("inf")
+
+
+class Router:
+    def __init__(self, is_admin):
+        self.is_admin = is_admin
+        self.texts = {}                  # whole message text -> Route
+        self.commands = {}               # first word of the text -> Route (commands with arguments)
+        self.callbacks = {}              # whole callback data -> Route
+        self.callback_prefixes = PrefixTrie()
+        self.documents = None            # Route for messages carrying a file
+        self.middleware = []
+        self.stats = RouteStats()
+
+    # ======== Registration ========
+
+    def text(self, *texts, admin=False):
+        """Route messages whose text is exactly one of ``texts``"""
+        def register(handler):
+            route = Route(texts[0], handler, admin)
+            for text in texts:
+                self.texts[text] = route
+            return handler
+        return register
+
+    def command(self, name, admin=False):
+        """Route "/name ..." messages, with or without arguments"""
+        def register(handler):
+            self.commands[name] = Route(name, handler, admin)
+            return handler
+        return register
+
+    def callback(self, data, admin=False):
+        def register(handler):
+            self.callbacks[data] = Route(f"cb:{data}", handler, admin)
+            return handler
+        return register
+
+    def callback_prefix(self, prefix, admin=False):
+        def register(handler):
+            self.callback_prefixes.insert(prefix, Route(f"cb:{prefix}*", handler, admin))
+            return handler
+        return register
+
+    def document(self, admin=False):
+        def register(handler):
+            self.documents = Route("document", handler, admin)
+            return handler
+        return register
+
+    def use(self, middleware):
+        """Add ``middleware(ctx, route) -> route or None``; they run in the order added"""
+        self.middleware.append(middleware)
+        return middleware
+
+    # ======== Dispatch ========
+
+    def resolve(self, ctx):
+        if ctx.kind == "message":
+            if "document" in ctx.message:
+                return self.documents
+            route = self.texts.get(ctx.text)
+            if route is None and ctx.text.startswith("/"):
+                route = self.commands.get(ctx.text.split(maxsplit=1)[0])
+            return route
+        if ctx.kind == "callback":
+            return self.callbacks.get(ctx.text) or self.callback_prefixes.longest(ctx.text)
+        return None
+
+    def dispatch(self, update, received_at=None):
+        try:
+            ctx = Context(update, self.is_admin, received_at)
+            route = self.resolve(ctx)
+            for middleware in self.middleware:
+                route = middleware(ctx, route)
+        except Exception as e:
+            log.error("❌ Error handling update", extra={"error": str(e)})
+            return
+        if route is None:
+            return
+        started = time.monotonic()
+        try:
+            route.handler(ctx)
+        except Exception as e:
+            self.stats.record(route.name, time.monotonic() - started, error=True)
+            log.error("❌ Error handling update", extra={"route": route.name, "error": str(e)})
+        else:
+            self.stats.record(route.name, time.monotonic() - started)
+
+
+def require_admin(ctx, route):
+    """Middleware: admin-only routes don't exist for everybody else"""
+    if route is not None and route.admin and not ctx.is_admin:
+        return None
+    return route
+
+
+def format_route_stats(snapshot, limit=15):
+    """Busiest routes with latency percentiles as an HTML message for the admin"""
+    if not snapshot:
+        return "🧭 <b>Routes</b>\n\nNo updates handled yet."
+    msg = "🧭 <b>Routes</b>\n\n"
+    busiest = sorted(snapshot.items(), key=lambda item: item[1]["calls"], reverse=True)[:limit]
+    for name, entry in busiest:
+        avg_ms = entry["latency_total"] / entry["calls"] * 1000 if entry["calls"] else 0
+        p95 = percentile_ms(entry["buckets"], 0.95)
+        msg += f"<b>{name}</b>: {entry['calls']} calls"
+        if entry["errors"]:
+            msg += f", {entry['errors']} errors"
+        msg += f"\n   avg {avg_ms:.0f} ms, p95 ≤{p95} ms, max {entry['latency_max'] * 1000:.0f} ms\n"
+    return msg
+
+
+def route_metric_families(snapshot):
+    """A RouteStats snapshot as Prometheus families (see metrics.py)"""
+    bounds = [bound / 1000 for bound in LATENCY_BUCKETS_MS]
+    latency, errors = [], []
+    for name, entry in sorted(snapshot.items()):
+        labels = {"route": name}
+        latency.extend(histogram_samples("bot_handler_seconds", labels, bounds, entry["buckets"], entry["latency_total"]))
+        errors.append(["bot_handler_errors_total", labels, entry["errors"]])
+    return [
+        family("bot_handler_seconds", "histogram", "Number Bot update handler latency by route", latency),
+        family("bot_handler_errors_total", "counter", "Number Bot update handlers that raised", errors),
+    ]
@@ -1,51 +1,202 @@
 #!/usr/bin/env python3
 """
-Runs SMS Forwarder Bot, Number Bot, and Health Server
+Runs SMS Forwarder Bot, Number Bot, and Health Server under a supervisor
+
+Each service is a child process. One that exits is restarted after an
+exponential backoff (reset once it has stayed up for STABLE_SECONDS), and a
+bot whose heartbeat file (see heartbeat.py) goes stale for HANG_TIMEOUT
+seconds is treated as hung: its whole process group, Chrome included, is
+stopped and restarted. SIGTERM/SIGINT are passed on to the children as
+SIGINT so they can clean up, and anything still running after STOP_TIMEOUT
+is killed. Per-service uptime, restarts and exit codes are written to
+STATUS_FILE every few seconds.
 """
+import json
 import os
+import signal
+import subprocess
 import sys
-from threading import Thread
 import time
 
-def run_sms_bot():
-    """Run SMS Forwarder Bot"""
-    print("🚀 Starting SMS Forwarder Bot...")
-    os.system("python main.py")
+SUPERVISOR_DIR = os.getenv("SUPERVISOR_DIR", ".supervisor")
+STATUS_FILE = os.path.join(SUPERVISOR_DIR, "status.json")
+HANG_TIMEOUT = float(os.getenv("HANG_TIMEOUT", "180"))
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 60.0
+STABLE_SECONDS = 60.0
+STOP_TIMEOUT = 10.0
+TICK_SECONDS = 1.0
+STATUS_INTERVAL = 5.0
+
+
+class Child:
+    """One supervised service and its restart bookkeeping"""
+
+    def __init__(self, name, script, hang_timeout=None):
+        self.name = name
+        self.script = script
+        self.hang_timeout = hang_timeout
+        self.heartbeat_file = os.path.join(SUPERVISOR_DIR, f"{name}.heartbeat")
+        self.proc = None
+        self.started_at = None
+        self.next_start = 0.0
+        self.backoff = BACKOFF_INITIAL
+        self.starts = 0
+        self.hangs = 0
+        self.last_exit = None
+        self.stopping_since = None
+
+    @property
+    def running(self):
+        return self.proc is not None
+
+    def start(self):
+        env = dict(os.environ, HEARTBEAT_FILE=self.heartbeat_file)
+        # Own process group, so a hang kill also takes down Chrome/chromedriver
+        self.proc = subprocess.Popen([sys.executable, self.script], env=env, start_new_session=True)
+        self.started_at = time.time()
+        self.stopping_since = None
+        self.starts += 1
+        print(f"🚀 Started {self.name} (pid {self.proc.pid})")
+
+    def signal(self, signum, group=False):
+        if self.proc is None:
+            return
+        try:
+            if group:
+                os.killpg(self.proc.pid, signum)
+            else:
+                self.proc.send_signal(signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stop(self, now):
+        """Ask the child to exit; kill() follows if it is still there after STOP_TIMEOUT"""
+        if self.stopping_since is None:
+            self.stopping_since = now
+            self.signal(signal.SIGINT)
+
+    def kill(self):
+        self.signal(signal.SIGKILL, group=True)
+
+    def heartbeat_age(self, now):
+        try:
+            last = max(os.stat(self.heartbeat_file).st_mtime, self.started_at)
+        except OSError:
+            last = self.started_at
+        return now - last
+
+    def exited(self, code, now):
+        """Record an exit and schedule the restart"""
+        uptime = now - self.started_at
+        self.last_exit = code
+        self.proc = None
+        if uptime >= STABLE_SECONDS:
+            self.backoff = BACKOFF_INITIAL
+        self.next_start = now + self.backoff
+        print(f"💥 {self.name} exited with code {code} after {uptime:.0f}s, restarting in {self.backoff:.0f}s")
+        self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+
+    def snapshot(self, now):
+        return {
+            "pid": self.proc.pid if self.proc else None,
+            "running": self.running,
+            "uptime": round(now - self.started_at, 1) if self.running else 0,
+            "restarts": max(self.starts - 1, 0),
+            "hangs": self.hangs,
+            "last_exit": self.last_exit,
+            "heartbeat_age": round(self.heartbeat_age(now), 1) if self.running and self.hang_timeout else None,
+        }
 
-def run_number_bot():
-    """Run Number Bot"""
-    print("🚀 Starting Number Bot...")
-    os.system("python number_bot.py")
 
-def run_health_server():
-    """Run Flask Health Server"""
-    print("🚀 Starting Health Server on port 5000...")
-    os.system("python health_server.py")
+class Supervisor:
+    def __init__(self, children):
+        self.children = children
+        self.started_at = time.time()
+        self.stop_requested = False
+        self._status_written = 0.0
+
+    def request_stop(self, signum, frame):
+        self.stop_requested = True
+
+    def tick(self, now):
+        for child in self.children:
+            if child.running:
+                code = child.proc.poll()
+                if code is not None:
+                    # Group members (Chrome) may outlive the leader
+                    child.signal(signal.SIGKILL, group=True)
+                    child.exited(code, now)
+                elif child.stopping_since is not None:
+                    if now - child.stopping_since >= STOP_TIMEOUT:
+                        child.kill()
+                elif child.hang_timeout and child.heartbeat_age(now) > child.hang_timeout:
+                    child.hangs += 1
+                    print(f"🧊 {child.name} has not made progress for {child.heartbeat_age(now):.0f}s, restarting it")
+                    child.stop(now)
+            elif now >= child.next_start:
+                child.start()
+
+        if now - self._status_written >= STATUS_INTERVAL:
+            self.write_status(now)
+
+    def write_status(self, now):
+        status = {
+            "supervisor_uptime": round(now - self.started_at, 1),
+            "updated": now,
+            "children": {child.name: child.snapshot(now) for child in self.children},
+        }
+        tmp_path = STATUS_FILE + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f)
+            os.replace(tmp_path, STATUS_FILE)
+        except OSError as e:
+            print(f"⚠️ Failed to write supervisor status: {e}")
+        self._status_written = now
+
+    def shutdown(self):
+        print("\n👋 Shutting down all services...")
+        now = time.time()
+        for child in self.children:
+            child.stop(now)
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for child in self.children:
+            if child.proc is None:
+                continue
+            try:
+                child.proc.wait(timeout=max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                print(f"⚠️ {child.name} did not stop in {STOP_TIMEOUT:.0f}s, killing it")
+            child.kill()
+            child.last_exit = child.proc.wait()
+            child.proc = None
+        self.write_status(time.time())
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        while not self.stop_requested:
+            self.tick(time.time())
+            time.sleep(TICK_SECONDS)
+        self.shutdown()
+
 
 if __name__ == '__main__':
-    # Start all services in separate threads
-    threads = [
-        Thread(target=run_health_server, daemon=True),
-        Thread(target=run_sms_bot, daemon=True),
-        Thread(target=run_number_bot, daemon=True),
-    ]
-    
-    for thread in threads:
-        thread.start()
-        time.sleep(2)  # Small delay between starts
-    
+    os.makedirs(SUPERVISOR_DIR, exist_ok=True)
+    supervisor = Supervisor([
+        Child("health_server", "health_server.py"),
+        Child("sms_bot", "main.py", hang_timeout=HANG_TIMEOUT),
+        Child("number_bot", "number_bot.py", hang_timeout=HANG_TIMEOUT),
+    ])
+
     print("\n" + "="*50)
-    print("✅ All services started successfully!")
+    print("✅ Supervisor started")
     print("="*50)
     print("📊 Health Server: http://0.0.0.0:5000")
-    print("🤖 SMS Forwarder Bot: Running")
-    print("📱 Number Bot: Running")
+    print("🤖 SMS Forwarder Bot: supervised")
+    print("📱 Number Bot: supervised")
+    print(f"📁 Status: {STATUS_FILE}")
     print("="*50 + "\n")
-    
-    # Keep main thread alive
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\n👋 Shutting down all services...")
-        sys.exit(0)
+
+    supervisor.run()
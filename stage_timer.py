@@ -0,0 +1,116 @@
+"""
+Per-stage timing of the SMS bot's poll cycle
+
+main_loop() opens a cycle, wraps every stage (page refresh, DataTables
+wait, row parsing, formatting, Telegram sends, the pauses between sends,
+queue writes) in span(), and closes the cycle. Each span costs two
+monotonic() calls and a dict add; a stage that runs several times in a
+cycle (one send per message) is summed. Closing a cycle logs a one-record
+breakdown (stage durations as fields), keeps the last STAGE_WINDOW cycles
+per stage for rolling p50/p95/p99, and with SLOW_CYCLE_SECONDS set appends
+cycles slower than that to SLOW_CYCLE_FILE together with the page size and
+row count, so outliers can be looked at afterwards.
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+
+STAGE_WINDOW = 500
+SLOW_CYCLE_SECONDS = float(os.getenv("SLOW_CYCLE_SECONDS", "0"))   # 0 = no dump
+SLOW_CYCLE_FILE = "slow_cycles.jsonl"
+
+log = logging.getLogger(__name__)
+
+
+class _Span:
+    __slots__ = ("timer", "stage", "started")
+
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.stage, time.monotonic() - self.started)
+        return False
+
+
+class StageTimer:
+    def __init__(self, window=STAGE_WINDOW, slow_seconds=SLOW_CYCLE_SECONDS, slow_file=SLOW_CYCLE_FILE, observe=None):
+        self.window = window
+        self.slow_seconds = slow_seconds
+        self.slow_file = slow_file
+        self.observe = observe          # optional observe(stage, seconds), e.g. a metrics histogram
+        self.history = {}               # stage -> deque of per-cycle seconds
+        self.cycles = 0
+        self.slow_cycles = 0
+        self._stages = None
+        self._started = None
+
+    def start_cycle(self):
+        self._stages = {}
+        self._started = time.monotonic()
+
+    def span(self, stage):
+        """``with timer.span("parse"): ...`` adds the block's duration to the stage"""
+        return _Span(self, stage)
+
+    def add(self, stage, seconds):
+        # Spans outside a cycle (login, startup) are not part of any breakdown
+        if self._stages is not None:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def end_cycle(self, **info):
+        """Close the cycle, returns (total seconds, {stage: seconds}).
+
+        ``info`` (html_size, rows, new_messages, ...) goes into the cycle record
+        line and the slow-cycle dump.
+        """
+        total = time.monotonic() - self._started
+        stages, self._stages = self._stages, None
+        self.cycles += 1
+        for stage, seconds in stages.items():
+            history = self.history.get(stage)
+            if history is None:
+                history = self.history[stage] = deque(maxlen=self.window)
+            history.append(seconds)
+            if self.observe is not None:
+                self.observe(stage, seconds)
+
+        log.info("⏱️ Cycle done", extra={
+            "cycle": self.cycles, "duration_ms": round(total * 1000),
+            "stages_ms": {stage: round(seconds * 1000) for stage, seconds in stages.items()}, **info})
+
+        if self.slow_seconds and total >= self.slow_seconds:
+            self.slow_cycles += 1
+            self._dump_slow(total, stages, info)
+        return total, stages
+
+    def _dump_slow(self, total, stages, info):
+        record = {"time": time.time(), "total": round(total, 4),
+                  "stages": {stage: round(seconds, 4) for stage, seconds in stages.items()}, **info}
+        try:
+            with open(self.slow_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            log.warning("⚠️ Failed to write slow cycle", extra={"error": str(e)})
+
+    def percentiles(self):
+        """{stage: (p50, p95, p99)} in seconds over the rolling window"""
+        result = {}
+        for stage, history in self.history.items():
+            values = sorted(history)
+            last = len(values) - 1
+            result[stage] = tuple(values[min(int(q * len(values)), last)] for q in (0.5, 0.95, 0.99))
+        return result
+
+    def log_percentiles(self):
+        log.info("📈 Stage p50/p95/p99", extra={
+            "cycles": min(self.cycles, self.window),
+            "stages_ms": {stage: [round(value * 1000) for value in values]
+                          for stage, values in self.percentiles().items()}})
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Cold-start profiling for the Number Bot
+
+StartupProfile records how long each startup phase took (imports, loading
+state, webhook setup, the deferred work that runs once updates are being
+served) and number_bot logs them as one record when startup is finished.
+
+Run this file to get a `python -X importtime` breakdown of a module:
+
+    python startup_profile.py [module] [--top 15]
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    def __init__(self, started=None):
+        self.started = started or time.monotonic()
+        self.phases = []          # (name, seconds, deferred)
+        self.serving_after = None
+
+    @contextmanager
+    def phase(self, name, deferred=False):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.monotonic() - started, deferred))
+
+    def record(self, name, seconds, deferred=False):
+        self.phases.append((name, seconds, deferred))
+
+    def mark_serving(self):
+        """Updates are being received from here on"""
+        self.serving_after = time.monotonic() - self.started
+
+    def fields(self):
+        """Phase timings as log fields: {"phases_ms": {...}, "deferred_ms": {...}, "duration_ms": serving after}"""
+        fields = {
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds, deferred in self.phases if not deferred},
+            "deferred_ms": {name: round(seconds * 1000, 1) for name, seconds, deferred in self.phases if deferred},
+        }
+        if self.serving_after is not None:
+            fields["duration_ms"] = round(self.serving_after * 1000)
+        return fields
+
+
+def importtime(module):
+    """[(depth, module, self_us, cumulative_us)] from ``python -X importtime -c "import module"``"""
+    import subprocess
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def importtime_report(module, top=15):
+    entries = importtime(module)
+    if not entries:
+        return f"❌ Could not import {module}"
+    # Children are printed before their parent, one indentation level deeper
+    position = next((i for i, e in enumerate(entries) if e[0] == 0 and e[1] == module), len(entries) - 1)
+    total = entries[position][3]
+    direct = []
+    for depth, name, self_us, cumulative in reversed(entries[:position]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append((depth, name, self_us, cumulative))
+    direct.sort(key=lambda e: e[3], reverse=True)
+    lines = [f"📦 import {module}: {total / 1000:.1f} ms"]
+    for _, name, _, cumulative in direct[:top]:
+        lines.append(f"   {name:<32} {cumulative / 1000:8.1f} ms  {cumulative / total * 100:5.1f}%")
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Import-time breakdown of a module")
+    parser.add_argument("module", nargs="?", default="number_bot")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    print(importtime_report(args.module, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Shared status board for the two bots and the health server
+
+STATUS_BOARD_FILE is a small mmap'd file of float64 slots. Each bot writes
+only its own slots (when it last polled, last sent a Telegram message, how
+far it got through the OTP queue) with one aligned 8-byte store, so
+publishing costs neither a syscall nor a lock. health_server.py maps the
+same file and turns the slots into a readiness verdict with readiness().
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+
+STATUS_BOARD_FILE = os.getenv("STATUS_BOARD_FILE", "status_board.bin")
+LAYOUT_VERSION = 1.0
+FIELDS = (
+    "layout",
+    # main.py
+    "sms_started", "sms_last_poll", "sms_last_send", "sms_polls", "sms_otp_enqueued",
+    # number_bot.py
+    "number_started", "number_last_poll", "number_last_send", "number_otp_scan", "number_otp_offset",
+)
+_SLOT = struct.Struct("d")
+_OFFSETS = {name: i * _SLOT.size for i, name in enumerate(FIELDS)}
+SIZE = len(FIELDS) * _SLOT.size
+
+# Readiness thresholds (seconds, except OTP_LAG_MAX which is queue entries)
+SMS_STALE_SECONDS = float(os.getenv("SMS_STALE_SECONDS", "120"))
+NUMBER_STALE_SECONDS = float(os.getenv("NUMBER_STALE_SECONDS", "90"))
+OTP_SCAN_STALE_SECONDS = float(os.getenv("OTP_SCAN_STALE_SECONDS", "60"))
+OTP_LAG_MAX = int(os.getenv("OTP_LAG_MAX", "100"))
+STARTUP_GRACE_SECONDS = float(os.getenv("STARTUP_GRACE_SECONDS", "300"))
+
+log = logging.getLogger(__name__)
+
+
+class StatusBoard:
+    def __init__(self, path=STATUS_BOARD_FILE):
+        self.path = path
+        self._map = None
+        self._failed = False
+
+    def _open(self):
+        if self._map is None and not self._failed:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    if os.fstat(fd).st_size != SIZE:
+                        # New file or a different layout: start from zeros
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, SIZE)
+                    board = mmap.mmap(fd, SIZE)
+                finally:
+                    os.close(fd)
+                layout = _SLOT.unpack_from(board, 0)[0]
+                if layout != LAYOUT_VERSION:
+                    if layout:
+                        board[:] = bytes(SIZE)
+                    _SLOT.pack_into(board, 0, LAYOUT_VERSION)
+                self._map = board
+            except (OSError, ValueError) as e:
+                log.warning("⚠️ Status board unavailable", extra={"error": str(e)})
+                self._failed = True
+        return self._map
+
+    def set(self, field, value):
+        board = self._open()
+        if board is not None:
+            _SLOT.pack_into(board, _OFFSETS[field], value)
+
+    def mark(self, field, now=None):
+        """Store the current time in ``field``"""
+        self.set(field, time.time() if now is None else now)
+
+    def add(self, field, amount=1):
+        """Bump a counter; every field has a single writer, so no lock is needed"""
+        board = self._open()
+        if board is not None:
+            offset = _OFFSETS[field]
+            _SLOT.pack_into(board, offset, _SLOT.unpack_from(board, offset)[0] + amount)
+
+    def read(self):
+        board = self._open()
+        if board is None:
+            return dict.fromkeys(FIELDS, 0.0)
+        return {name: _SLOT.unpack_from(board, offset)[0] for name, offset in _OFFSETS.items()}
+
+
+# One board per process
+board = StatusBoard()
+
+
+def _age(timestamp, now):
+    return round(now - timestamp, 1) if timestamp else None
+
+
+def _freshness(started, last, stale_after, now):
+    if not started:
+        return "down"
+    if last >= started and now - last <= stale_after:
+        return "ok"
+    if last < started and now - started <= STARTUP_GRACE_SECONDS:
+        return "starting"
+    return "stale"
+
+
+def readiness(values, now=None):
+    """(ready, report) from a read() of the board.
+
+    A bot is ready once it has polled within its staleness threshold (or is
+    still inside STARTUP_GRACE_SECONDS of starting); the OTP queue is ready
+    while the Number Bot keeps scanning it and is at most OTP_LAG_MAX
+    entries behind main.py.
+    """
+    now = time.time() if now is None else now
+    sms = {
+        "status": _freshness(values["sms_started"], values["sms_last_poll"], SMS_STALE_SECONDS, now),
+        "last_poll_age": _age(values["sms_last_poll"], now),
+        "last_send_age": _age(values["sms_last_send"], now),
+        "polls": int(values["sms_polls"]),
+    }
+    number = {
+        "status": _freshness(values["number_started"], values["number_last_poll"], NUMBER_STALE_SECONDS, now),
+        "last_poll_age": _age(values["number_last_poll"], now),
+        "last_send_age": _age(values["number_last_send"], now),
+    }
+    lag = max(int(values["sms_otp_enqueued"] - values["number_otp_offset"]), 0)
+    otp_status = _freshness(values["number_started"], values["number_otp_scan"], OTP_SCAN_STALE_SECONDS, now)
+    if otp_status == "ok" and lag > OTP_LAG_MAX:
+        otp_status = "lagging"
+    otp_queue = {
+        "status": otp_status,
+        "lag": lag,
+        "consumer_offset": int(values["number_otp_offset"]),
+        "last_scan_age": _age(values["number_otp_scan"], now),
+    }
+    ready = all(part["status"] in ("ok", "starting") for part in (sms, number, otp_queue))
+    return ready, {
+        "status": "ok" if ready else "degraded",
+        "bots": {"sms_forwarder": sms, "number_bot": number},
+        "otp_queue": otp_queue,
+    }
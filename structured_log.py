@@ -0,0 +1,221 @@
+"""
+Structured, non-blocking logging for the bots
+
+setup_logging() puts a QueueHandler on the root logger: a thread that logs
+only checks the level and the warning rate limit, formats the message and
+puts the record on an in-memory queue; a QueueListener thread turns it into
+a line and writes it to stdout, so a slow log collector never stalls the
+poll loop or an OTP send. When the queue is full (LOG_QUEUE_SIZE records)
+new records are dropped and counted instead of waiting.
+
+Messages are constant templates and the details travel as fields passed in
+``extra``, with the same names everywhere: number_hash (number_hash(), so a
+number can be followed from the panel to the user without logging it),
+chat, user, stage, duration_ms, attempt, status, error. LOG_FORMAT=json
+(the default) writes one JSON object per line; LOG_FORMAT=text writes the
+message followed by key=value pairs, for reading in a terminal.
+
+LOG_LEVEL is the default level and LOG_LEVELS sets levels per logger, e.g.
+"sms_bot.send=WARNING,router=DEBUG". The warnings in NOISY_TEMPLATES, which
+repeat every cycle while the panel or Telegram is down, are rate limited
+per logger and template: WARNING_BURST of them per WARNING_WINDOW seconds
+go out, the rest are counted and the first one let through after the window
+carries ``suppressed``. Errors and every other warning, e.g. a failed OTP
+delivery, always go out. Dropped and suppressed records are exported as
+metrics.
+"""
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+WARNING_BURST = int(os.getenv("LOG_WARNING_BURST", "5"))      # 0 = no rate limit
+WARNING_WINDOW = float(os.getenv("LOG_WARNING_WINDOW", "60"))
+# Shared by both bots so their number hashes match
+LOG_HASH_KEY = os.getenv("LOG_HASH_KEY", "").encode()[:32]
+MAX_RATE_KEYS = 1000
+EXIT_FLUSH_SECONDS = 2
+# Warnings about a condition rather than one event, logged on every loop while it lasts
+NOISY_TEMPLATES = frozenset({
+    "⚠️ Telegram call failed, retrying",
+    "⚠️ Telegram call failed",
+    "⚠️ getUpdates failed",
+    "⚠️ Webhook spool error",
+    "⚠️ Lease expiry error",
+    "⚠️ Could not access OTP page",
+    "⚠️ Table with id='dt' not found",
+    "⚠️ Table body not found",
+    "⚠️ Rate limit hit",
+    "⚠️ Broadcast send failed",
+    "⚠️ Metrics collector failed",
+    "⚠️ Failed to write metrics",
+    "⚠️ Status board unavailable",
+})
+
+# Attributes every LogRecord has; anything else on a record came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def number_hash(number):
+    """Short stable stand-in for a phone number in log fields"""
+    return hashlib.blake2s(str(number).encode(), digest_size=5, key=LOG_HASH_KEY).hexdigest()
+
+
+def fields(record):
+    """The ``extra`` fields of a record"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class WarningRateLimit(logging.Filter):
+    """Lets WARNING_BURST of each noisy warning per logger through per window"""
+
+    def __init__(self, burst=WARNING_BURST, window=WARNING_WINDOW, templates=NOISY_TEMPLATES):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.templates = templates
+        self.suppressed = 0
+        self._windows = {}      # (logger, template) -> [window start, let through, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != logging.WARNING or not self.burst or record.msg not in self.templates:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is None and len(self._windows) >= MAX_RATE_KEYS:
+                    self._windows.clear()
+                if entry is not None and entry[2]:
+                    record.suppressed = entry[2]
+                self._windows[key] = [now, 1, 0]
+                return True
+            if entry[1] < self.burst:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking"""
+
+    def __init__(self, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # The message is formatted here while its args are current; the line
+        # itself is built by the listener thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, process):
+        super().__init__()
+        self.process = process
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "process": self.process,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(fields(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = record.getMessage()
+        extra = " ".join(f"{key}={value}" for key, value in fields(record).items())
+        if extra:
+            line = f"{line} | {extra}"
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+
+_handler = None
+_rate_limit = None
+
+
+def _flush_at_exit(listener):
+    # Wait a little for what is still queued, but never hang the exit on a stuck stdout
+    try:
+        listener.queue.put(listener._sentinel, timeout=EXIT_FLUSH_SECONDS)
+    except queue.Full:
+        return
+    listener._thread.join(EXIT_FLUSH_SECONDS)
+
+
+def log_metric_families():
+    from metrics import family
+    return [
+        family("log_records_dropped_total", "counter", "Log records dropped because the log queue was full",
+               [["log_records_dropped_total", {}, _handler.dropped]]),
+        family("log_warnings_suppressed_total", "counter", "Repeated warnings held back by the rate limit",
+               [["log_warnings_suppressed_total", {}, _rate_limit.suppressed]]),
+    ]
+
+
+def setup_logging(process):
+    """Send every logger of this process through the queue; call once at startup"""
+    global _handler, _rate_limit
+    if _handler is not None:
+        return
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    bad_levels = []
+    for item in LOG_LEVELS.split(","):
+        name, _, level = item.partition("=")
+        if not name.strip():
+            continue
+        try:
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+        except ValueError:
+            bad_levels.append(item.strip())
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter(process) if LOG_FORMAT == "json" else TextFormatter())
+    _rate_limit = WarningRateLimit()
+    _handler = NonBlockingQueueHandler()
+    _handler.addFilter(_rate_limit)
+    root.handlers[:] = [_handler]
+    listener = QueueListener(_handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(_flush_at_exit, listener)
+
+    from metrics import registry
+    registry.collector(log_metric_families)
+    if bad_levels:
+        logging.getLogger(__name__).warning("⚠️ Ignoring invalid LOG_LEVELS entries", extra={"entries": bad_levels})
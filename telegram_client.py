@@ -0,0 +1,220 @@
+"""
+Telegram Bot API client shared by the Number Bot
+
+One requests.Session with a bounded keep-alive pool, per-method timeouts,
+retry_after-aware retries on 429 and backoff on network/5xx errors, and
+latency/error counters per method. Send methods are not idempotent, so
+they are only retried on a 429 or when the connection could not be made.
+async_runtime.AsyncBotAPI applies the same retry policy and records into
+the same counters.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from metrics import family, histogram_samples
+
+# Point at a local stand-in (benchmarks/fake_telegram.py) for load tests
+API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "100"))
+MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+# Longer waits are not worth blocking a handler for; the caller gets the 429
+MAX_RETRY_AFTER = 30
+DEFAULT_TIMEOUT = 10
+METHOD_TIMEOUTS = {
+    "getUpdates": 35,
+    "sendMessage": 10,
+    "editMessageText": 10,
+    "answerCallbackQuery": 5,
+    "getFile": 10,
+    "file": 30,
+}
+# getUpdates is retried by its own loop
+NO_RETRY_METHODS = {"getUpdates"}
+# A read timeout or a 5xx doesn't tell whether these went through; retrying
+# them could deliver an OTP or a broadcast twice
+SEND_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "sendMediaGroup", "forwardMessage", "copyMessage"}
+
+log = logging.getLogger(__name__)
+# Upper bounds (ms) of the latency histogram buckets; the last one is open.
+# They reach further than the router's because getUpdates long-polls for 30s.
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def method_timeout(method, timeout=None):
+    return timeout or METHOD_TIMEOUTS.get(method, DEFAULT_TIMEOUT)
+
+
+def backoff_delay(attempt):
+    return min(0.5 * 2 ** attempt, 8)
+
+
+def retry_delay(result, attempt, method=None):
+    """Seconds to wait before retrying a failed call, or None to give up"""
+    error_code = result.get("error_code")
+    if error_code == 429:
+        retry_after = result.get("parameters", {}).get("retry_after", 1)
+        return retry_after if retry_after <= MAX_RETRY_AFTER else None
+    if error_code and error_code >= 500 and method not in SEND_METHODS:
+        return backoff_delay(attempt)
+    return None
+
+
+def connect_failed(error):
+    """True if the request never reached Telegram"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class ApiStats:
+    """Thread-safe per-method call counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def _entry(self, method):
+        entry = self._methods.get(method)
+        if entry is None:
+            entry = self._methods[method] = {
+                "calls": 0, "errors": 0, "rate_limited": 0, "retries": 0,
+                "latency_total": 0.0, "latency_max": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        return entry
+
+    def record(self, method, seconds, error=False, rate_limited=False):
+        bucket = bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            entry = self._entry(method)
+            entry["calls"] += 1
+            entry["buckets"][bucket] += 1
+            entry["latency_total"] += seconds
+            if seconds > entry["latency_max"]:
+                entry["latency_max"] = seconds
+            if error:
+                entry["errors"] += 1
+            if rate_limited:
+                entry["rate_limited"] += 1
+
+    def record_retry(self, method):
+        with self._lock:
+            self._entry(method)["retries"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {method: dict(entry, buckets=list(entry["buckets"])) for method, entry in self._methods.items()}
+
+
+# Shared by every client in the process
+api_stats = ApiStats()
+
+
+class TelegramClient:
+    """Blocking Bot API client on a pooled keep-alive session"""
+
+    def __init__(self, token, pool_size=POOL_SIZE, max_retries=MAX_RETRIES, stats=api_stats):
+        self.base_url = f"{API_BASE}/bot{token}"
+        self.file_url = f"{API_BASE}/file/bot{token}"
+        self.max_retries = max_retries
+        self.stats = stats
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def call(self, method, payload=None, timeout=None, max_retries=None):
+        """Call a Bot API method, returns Telegram's JSON response (ok or not).
+
+        Network errors are retried and re-raised once retries run out; for
+        SEND_METHODS only connection failures are. ``max_retries`` overrides
+        the client's for callers that handle 429s themselves.
+        """
+        url = f"{self.base_url}/{method}"
+        timeout = method_timeout(method, timeout)
+        if method in NO_RETRY_METHODS:
+            retries = 0
+        else:
+            retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                result = self.session.post(url, json=payload or {}, timeout=timeout).json()
+            except (requests.RequestException, ValueError) as e:
+                self.stats.record(method, time.monotonic() - started, error=True)
+                if attempt >= retries or (method in SEND_METHODS and not connect_failed(e)):
+                    raise
+                log.warning("⚠️ Telegram call failed, retrying", extra={"method": method, "attempt": attempt + 1,
+                                                                       "error": str(e)})
+                delay = backoff_delay(attempt)
+            else:
+                ok = bool(result.get("ok"))
+                self.stats.record(method, time.monotonic() - started, error=not ok,
+                                  rate_limited=result.get("error_code") == 429)
+                if ok:
+                    return result
+                delay = retry_delay(result, attempt, method)
+                if delay is None or attempt >= retries:
+                    log.warning("⚠️ Telegram call failed", extra={"method": method, "status": result.get("error_code"),
+                                                                 "error": result.get("description", "")})
+                    return result
+            self.stats.record_retry(method)
+            time.sleep(delay)
+            attempt += 1
+
+    def download(self, file_path, timeout=None):
+        started = time.monotonic()
+        try:
+            response = self.session.get(f"{self.file_url}/{file_path}", timeout=method_timeout("file", timeout))
+            response.raise_for_status()
+        except requests.RequestException:
+            self.stats.record("file", time.monotonic() - started, error=True)
+            raise
+        self.stats.record("file", time.monotonic() - started)
+        return response.content
+
+    def close(self):
+        self.session.close()
+
+
+def format_stats(snapshot):
+    """Per-method counters as an HTML message for the admin"""
+    if not snapshot:
+        return "📡 <b>Telegram API</b>\n\nNo calls yet."
+    msg = "📡 <b>Telegram API</b>\n\n"
+    for method, entry in sorted(snapshot.items()):
+        avg_ms = entry["latency_total"] / entry["calls"] * 1000 if entry["calls"] else 0
+        msg += f"<b>{method}</b>: {entry['calls']} calls, {entry['errors']} errors"
+        if entry["rate_limited"]:
+            msg += f", {entry['rate_limited']}× 429"
+        if entry["retries"]:
+            msg += f", {entry['retries']} retries"
+        msg += f"\n   avg {avg_ms:.0f} ms, max {entry['latency_max'] * 1000:.0f} ms\n"
+    return msg
+
+
+def api_metric_families(snapshot, bot):
+    """An ApiStats snapshot as Prometheus families (see metrics.py)"""
+    bounds = [bound / 1000 for bound in LATENCY_BUCKETS_MS]
+    latency, errors, rate_limited, retries = [], [], [], []
+    for method, entry in sorted(snapshot.items()):
+        labels = {"bot": bot, "method": method}
+        latency.extend(histogram_samples("telegram_request_seconds", labels, bounds, entry["buckets"], entry["latency_total"]))
+        errors.append(["telegram_errors_total", labels, entry["errors"]])
+        rate_limited.append(["telegram_rate_limited_total", labels, entry["rate_limited"]])
+        retries.append(["telegram_retries_total", labels, entry["retries"]])
+    return [
+        family("telegram_request_seconds", "histogram", "Telegram Bot API request latency", latency),
+        family("telegram_errors_total", "counter", "Telegram Bot API calls that failed", errors),
+        family("telegram_rate_limited_total", "counter", "Telegram Bot API calls answered with 429", rate_limited),
+        family("telegram_retries_total", "counter", "Telegram Bot API calls retried", retries),
+    ]
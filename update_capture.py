@@ -0,0 +1,158 @@
+"""
+Capture of incoming Telegram updates for offline replay
+
+With CAPTURE_UPDATES_FILE set, the Number Bot appends every update it
+receives (polling or webhook) to that file as one compact JSON line,
+{"t": arrival time, "u": update}; strftime codes in the name give one file
+per day ("captures/updates-%Y%m%d.jsonl"). Updates are anonymized before
+they are written: user and chat ids become keyed-hash pseudonyms (the
+admin becomes ADMIN_PSEUDONYM, ids inside callback data such as
+"approve_user:<id>" are mapped the same way), names become placeholders,
+message and callback query ids are hashed and contact details are dropped.
+Of texts and captions only what routing needs is kept: a text the router
+matches as a whole (a keyboard button) as is, otherwise the command word,
+with every other word replaced by a hash (so "/addnumber Venezuela 58412..."
+keeps its shape, not its arguments). File ids and names are hashed (the
+extension is kept); file sizes are kept so a replay can generate an upload
+of about the same size. Set CAPTURE_SALT to keep pseudonyms stable across
+restarts; otherwise every process picks its own.
+
+benchmarks/replay.py feeds a capture back to the dispatcher.
+"""
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+CAPTURE_UPDATES_FILE = os.getenv("CAPTURE_UPDATES_FILE", "")
+CAPTURE_SALT = os.getenv("CAPTURE_SALT", "")
+ADMIN_PSEUDONYM = 1
+PERSON_KEYS = {"from", "chat", "user", "forward_from", "forward_from_chat", "sender_chat", "new_chat_member",
+               "left_chat_member"}
+DROP_KEYS = {"contact", "phone_number", "last_name", "bio", "location", "venue"}
+TEXT_KEYS = {"text", "caption"}
+FILE_KEYS = {"file_id", "file_unique_id"}
+CALLBACK_ID = re.compile(r":(-?\d+)$")
+
+
+class UpdateCapture:
+    """``keep_text(text)`` tells which whole texts are safe to keep (route names)"""
+
+    def __init__(self, path, admin_id=0, salt=CAPTURE_SALT, keep_text=None):
+        self.path = path
+        self.admin_id = admin_id
+        self.salt = (salt or os.urandom(16).hex()).encode()
+        self.keep_text = keep_text or (lambda text: False)
+        self.captured = 0
+        self._lock = threading.Lock()
+
+    # ======== Anonymization ========
+
+    def _digest(self, value):
+        return int.from_bytes(hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()[:6], "big")
+
+    def pseudonym(self, user_id):
+        """Stable 10-digit stand-in for a user/chat id; group ids stay negative"""
+        if user_id == self.admin_id:
+            return ADMIN_PSEUDONYM
+        pseudo = 1_000_000_000 + self._digest(user_id) % 9_000_000_000
+        return -pseudo if user_id < 0 else pseudo
+
+    def _person(self, value):
+        person = {}
+        for key, item in value.items():
+            if key == "id":
+                person["id"] = self.pseudonym(item)
+            elif key == "first_name":
+                person[key] = "User"
+            elif key == "title":
+                person[key] = "Chat"
+            elif key == "username":
+                person[key] = f"user{self._digest(item) % 10 ** 8}"
+            elif key not in DROP_KEYS:
+                person[key] = item
+        return person
+
+    def _word(self, word):
+        return f"~{self._digest(word):012x}"
+
+    def _text(self, text):
+        if self.keep_text(text):
+            return text
+        words = text.split()
+        if not words:
+            return text
+        first = words[0] if words[0].startswith("/") else self._word(words[0])
+        return " ".join([first] + [self._word(word) for word in words[1:]])
+
+    def _callback_data(self, data):
+        match = CALLBACK_ID.search(data)
+        if match is None:
+            return data
+        return data[:match.start(1)] + str(self.pseudonym(int(match.group(1))))
+
+    def anonymize(self, value, key=None):
+        if isinstance(value, dict):
+            if key in PERSON_KEYS:
+                return self._person(value)
+            result = {}
+            for item_key, item in value.items():
+                if item_key in DROP_KEYS:
+                    continue
+                if item_key == "message_id":
+                    result[item_key] = self._digest(item) % 2 ** 31
+                elif item_key == "id" and key == "callback_query":
+                    result[item_key] = str(self._digest(item))
+                elif item_key == "data" and key == "callback_query":
+                    result[item_key] = self._callback_data(item)
+                elif item_key in TEXT_KEYS and isinstance(item, str):
+                    result[item_key] = self._text(item)
+                elif item_key in FILE_KEYS:
+                    result[item_key] = f"file_{self._digest(item):012x}"
+                elif item_key == "file_name" and isinstance(item, str):
+                    # The extension picks the parser
+                    result[item_key] = f"upload_{self._digest(item):012x}{os.path.splitext(item)[1]}"
+                else:
+                    result[item_key] = self.anonymize(item, item_key)
+            return result
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        return value
+
+    # ======== Writing ========
+
+    def record(self, updates, now=None):
+        """Append anonymized updates, stamped with their arrival time, in one write"""
+        now = time.time() if now is None else now
+        stamp = round(now, 3)
+        data = "".join(json.dumps({"t": stamp, "u": self.anonymize(update)}, ensure_ascii=False,
+                                  separators=(",", ":")) + "\n" for update in updates)
+        path = time.strftime(self.path, time.localtime(now))
+        with self._lock:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(data)
+            self.captured += len(updates)
+
+
+def read_capture(path):
+    """(arrival time, update) pairs from a capture file, .gz files included"""
+    if path.endswith(".gz"):
+        import gzip
+        f = gzip.open(path, "rt", encoding="utf-8")
+    else:
+        f = open(path, encoding="utf-8")
+    with f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            yield record["t"], record["u"]
@@ -0,0 +1,121 @@
+"""
+File spool for webhook updates
+
+health_server.py appends every Telegram update it receives to
+WEBHOOK_SPOOL_FILE (one JSON object per line) and acknowledges it right
+away; number_bot.py reads new lines in batches and feeds them to
+handle_update. The consumer's byte offset is kept in WEBHOOK_OFFSET_FILE,
+the same way last_otp_check.txt tracks otp_queue.json, and is only saved
+once the updates before it have been handled.
+
+Appends and rotation take an flock on WEBHOOK_SPOOL_FILE + ".lock", since
+they happen in different processes.
+"""
+import fcntl
+import json
+import logging
+import os
+from collections import deque
+from contextlib import contextmanager
+
+WEBHOOK_SPOOL_FILE = "webhook_updates.jsonl"
+WEBHOOK_OFFSET_FILE = "webhook_offset.txt"
+ROTATE_BYTES = 1024 * 1024
+RECENT_IDS = 1000
+
+log = logging.getLogger(__name__)
+
+@contextmanager
+def spool_lock(path=WEBHOOK_SPOOL_FILE):
+    """Exclusive lock on the spool, across threads and processes"""
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def append_updates(updates, path=WEBHOOK_SPOOL_FILE):
+    """Append updates to the spool in one write"""
+    data = "".join(json.dumps(u, ensure_ascii=False, separators=(",", ":")) + "\n" for u in updates)
+    with spool_lock(path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+
+class SpoolReader:
+    """Reads new updates from the spool and remembers how far it got"""
+
+    def __init__(self, path=WEBHOOK_SPOOL_FILE, offset_path=WEBHOOK_OFFSET_FILE):
+        self.path = path
+        self.offset_path = offset_path
+        self.offset = self._load_offset()     # how far has been read
+        self.committed = self.offset          # how far has been handled and saved
+        self.recent_ids = deque(maxlen=RECENT_IDS)
+
+    def _load_offset(self):
+        try:
+            with open(self.offset_path, "r") as f:
+                return int(f.read().strip() or "0")
+        except:
+            return 0
+
+    def commit(self, offset=None):
+        """Save ``offset`` (by default everything read so far) once the updates before it are handled"""
+        offset = self.offset if offset is None else offset
+        with open(self.offset_path, "w") as f:
+            f.write(str(offset))
+        self.committed = offset
+
+    def _read_lines(self, path, offset, max_updates):
+        updates = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # partially written line, retry on the next read
+                offset += len(raw)
+                try:
+                    update = json.loads(raw)
+                except ValueError:
+                    log.warning("⚠️ Skipping malformed spooled update", extra={"line": repr(raw[:80])})
+                    continue
+                # Telegram redelivers updates it thinks were not acknowledged
+                update_id = update.get("update_id")
+                if update_id in self.recent_ids:
+                    continue
+                self.recent_ids.append(update_id)
+                updates.append(update)
+                if len(updates) >= max_updates:
+                    break
+        return updates, offset
+
+    def read_batch(self, max_updates=100):
+        """Return up to ``max_updates`` new updates (possibly an empty list).
+
+        The offset is not saved here: call commit() once they are handled.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return []
+        if size < self.offset:
+            self.offset = self.committed = 0  # spool was replaced underneath us
+        if size == self.offset:
+            if size > ROTATE_BYTES and self.committed == self.offset:
+                self._rotate()
+            return []
+
+        updates, self.offset = self._read_lines(self.path, self.offset, max_updates)
+        return updates
+
+    def _rotate(self):
+        # Fully handled and big: start a fresh file. Appenders wait on the
+        # lock, so nothing can land between the size check and the removal.
+        with spool_lock(self.path):
+            if os.path.getsize(self.path) != self.offset:
+                return
+            os.remove(self.path)
+            self.offset = 0
+            self.commit(0)
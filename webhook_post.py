@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Post recorded Telegram updates to the webhook endpoint (local testing)
+
+Usage: python webhook_post.py updates.jsonl [http://localhost:5000/telegram/webhook]
+
+The file holds one update per line, or a JSON list of updates / a saved
+getUpdates response. WEBHOOK_SECRET must match the health server's.
+"""
+import json
+import os
+import sys
+import requests
+
+
+def load_updates(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    if text.startswith("{") and '"result"' in text.split("\n", 1)[0]:
+        return json.loads(text).get("result", [])
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    url = sys.argv[2] if len(sys.argv) > 2 else f"http://localhost:{os.getenv('PORT', '5000')}/telegram/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": os.getenv("WEBHOOK_SECRET", "")}
+
+    updates = load_updates(sys.argv[1])
+    session = requests.Session()
+    ok = 0
+    for update in updates:
+        response = session.post(url, json=update, headers=headers, timeout=10)
+        if response.status_code == 200:
+            ok += 1
+        else:
+            print(f"⚠️ Update {update.get('update_id')}: {response.status_code} {response.text[:100]}")
+    print(f"✅ Posted {ok}/{len(updates)} updates to {url}")
+
+
+if __name__ == "__main__":
+    main()